@@ -0,0 +1,231 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from indice_espacial import METROS_POR_GRAU, LAT_REFERENCIA, haversine_m
+
+
+# ================== CONFIG ==================
+ESPACAMENTO_MAXIMO = 600           # m entre paradas consecutivas da mesma rua/sentido
+RAIO_ISOLAMENTO = 500              # m sem nenhuma outra parada
+LADO_CELULA_LACUNA = 400           # m; células vazias cercadas de células atendidas
+MIN_VIZINHAS_LACUNA = 5            # de 8 vizinhas ocupadas para a célula vazia contar
+
+ESCALA_LON = METROS_POR_GRAU * math.cos(math.radians(LAT_REFERENCIA))
+
+VIZINHANCA_8 = [(di, dj) for di in (-1, 0, 1) for dj in (-1, 0, 1) if (di, dj) != (0, 0)]
+
+
+# ================== AUXILIARES ==================
+def _coordenadas(df):
+    df = df.dropna(subset=["LAT", "LON"])
+    return df, df["LAT"].to_numpy(), df["LON"].to_numpy()
+
+def _celulas(lat, lon, tamanho_m):
+    return (
+        np.floor(lat * METROS_POR_GRAU / tamanho_m).astype("int64"),
+        np.floor(lon * ESCALA_LON / tamanho_m).astype("int64"),
+    )
+
+def _chave(i, j):
+    # (i, j) num único int64 para isin/merge vetorizados
+    return i * 4_000_000 + j
+
+
+# ================== ESPAÇAMENTO AO LONGO DA RUA ==================
+# As paradas de cada (Rua, Sentido) são ordenadas pela projeção no eixo
+# principal do próprio grupo (direção de maior variância), o que segue o
+# traçado de ruas aproximadamente retas; as distâncias são entre vizinhas
+# nessa ordem. Tudo em arrays: sem laço por parada nem por rua.
+def intervalos_consecutivos(df):
+    df, lat, lon = _coordenadas(df)
+    grupo = df.groupby(["Rua", "Sentido"], observed=True, sort=False).ngroup().to_numpy()
+    validos = grupo >= 0
+    df, lat, lon, grupo = df[validos], lat[validos], lon[validos], grupo[validos]
+
+    x = lon * ESCALA_LON
+    y = lat * METROS_POR_GRAU
+    n = np.bincount(grupo).astype("float64")
+    dx = x - (np.bincount(grupo, x) / n)[grupo]
+    dy = y - (np.bincount(grupo, y) / n)[grupo]
+    sxx = np.bincount(grupo, dx * dx)
+    syy = np.bincount(grupo, dy * dy)
+    sxy = np.bincount(grupo, dx * dy)
+    angulo = 0.5 * np.arctan2(2 * sxy, sxx - syy)[grupo]
+    projecao = dx * np.cos(angulo) + dy * np.sin(angulo)
+
+    ordem = np.lexsort((projecao, grupo))
+    g = grupo[ordem]
+    mesmo = g[1:] == g[:-1]
+    origem = ordem[:-1][mesmo]
+    destino = ordem[1:][mesmo]
+
+    return pd.DataFrame({
+        "Rua": df["Rua"].to_numpy()[origem],
+        "Sentido": df["Sentido"].to_numpy()[origem],
+        "Bairro": df["Bairro"].to_numpy()[origem],
+        "ID_DB": df["ID_DB"].to_numpy()[origem],
+        "ID_DB_SEGUINTE": df["ID_DB"].to_numpy()[destino],
+        "Distancia": haversine_m(lat[origem], lon[origem], lat[destino], lon[destino]),
+    })
+
+def espacamento_por_rua(intervalos, limite=ESPACAMENTO_MAXIMO):
+    if intervalos.empty:
+        return pd.DataFrame(columns=[
+            "Rua", "Sentido", "Paradas", "Espaçamento médio (m)",
+            "Espaçamento mediano (m)", "Maior intervalo (m)", f"Trechos > {limite} m",
+        ])
+    tabela = (
+        intervalos.assign(Acima=intervalos["Distancia"] > limite)
+        .groupby(["Rua", "Sentido"], observed=True, sort=False)
+        .agg(
+            Intervalos=("Distancia", "size"),
+            Media=("Distancia", "mean"),
+            Mediana=("Distancia", "median"),
+            Maior=("Distancia", "max"),
+            Acima=("Acima", "sum"),
+        )
+        .reset_index()
+    )
+    return pd.DataFrame({
+        "Rua": tabela["Rua"].astype(str),
+        "Sentido": tabela["Sentido"].astype(str),
+        "Paradas": tabela["Intervalos"] + 1,
+        "Espaçamento médio (m)": tabela["Media"].round(0),
+        "Espaçamento mediano (m)": tabela["Mediana"].round(0),
+        "Maior intervalo (m)": tabela["Maior"].round(0),
+        f"Trechos > {limite} m": tabela["Acima"].astype("int64"),
+    }).sort_values("Maior intervalo (m)", ascending=False, kind="stable").reset_index(drop=True)
+
+
+# ================== PARADAS ISOLADAS ==================
+# Células de lado raio/√2: duas paradas na mesma célula estão a menos de
+# `raio`, então só quem está sozinho na célula pode ser isolado. Para esses,
+# as distâncias são calculadas contra as paradas das células a até 2 de
+# distância (5x5), que cobrem todo o raio.
+def paradas_isoladas(df, raio_m=RAIO_ISOLAMENTO):
+    df, lat, lon = _coordenadas(df)
+    if len(df) < 2:
+        return df.iloc[0:0].assign(**{"Mais próxima (m)": []})
+
+    ci, cj = _celulas(lat, lon, raio_m / math.sqrt(2))
+    chave = _chave(ci, cj)
+    _, inverso, contagem = np.unique(chave, return_inverse=True, return_counts=True)
+    sozinhas = np.flatnonzero(contagem[inverso] == 1)
+    if sozinhas.size == 0:
+        return df.iloc[0:0].assign(**{"Mais próxima (m)": []})
+
+    pontos = pd.DataFrame({"chave": chave, "destino": np.arange(len(df))})
+    pares = []
+    for di in range(-2, 3):
+        for dj in range(-2, 3):
+            if (di, dj) == (0, 0):
+                continue
+            alvo = pd.DataFrame({
+                "chave": _chave(ci[sozinhas] + di, cj[sozinhas] + dj),
+                "origem": sozinhas,
+            })
+            pares.append(alvo.merge(pontos, on="chave")[["origem", "destino"]])
+    pares = pd.concat(pares, ignore_index=True)
+
+    mais_proxima = np.full(len(df), np.inf)
+    if not pares.empty:
+        o = pares["origem"].to_numpy()
+        d = pares["destino"].to_numpy()
+        dist = haversine_m(lat[o], lon[o], lat[d], lon[d])
+        np.minimum.at(mais_proxima, o, dist)
+
+    isoladas = sozinhas[mais_proxima[sozinhas] > raio_m]
+    resultado = df.iloc[isoladas][["ID_DB", "ID", "Rua", "Bairro", "LAT", "LON"]].copy()
+    distancia = mais_proxima[isoladas]
+    resultado["Mais próxima (m)"] = np.where(np.isinf(distancia), np.nan, np.round(distancia, 0))
+    return resultado.sort_values("Mais próxima (m)", ascending=False, na_position="first").reset_index(drop=True)
+
+
+# ================== LACUNAS DE COBERTURA ==================
+# Grade de LADO_CELULA_LACUNA metros: uma célula sem parada cercada por
+# células com parada é uma lacuna. O bairro da lacuna é o mais comum entre
+# as paradas das células vizinhas.
+def lacunas_cobertura(df, tamanho_m=LADO_CELULA_LACUNA, min_vizinhas=MIN_VIZINHAS_LACUNA):
+    colunas = ["LAT", "LON", "Bairro", "Vizinhas atendidas", "Peso"]
+    df, lat, lon = _coordenadas(df)
+    if df.empty:
+        return pd.DataFrame(columns=colunas)
+
+    ci, cj = _celulas(lat, lon, tamanho_m)
+    ocupadas = pd.DataFrame({"i": ci, "j": cj, "Bairro": df["Bairro"].astype(str).to_numpy()})
+    bairro_celula = (
+        ocupadas.groupby(["i", "j", "Bairro"], sort=False).size()
+        .reset_index(name="n")
+        .sort_values("n", ascending=False, kind="stable")
+        .drop_duplicates(["i", "j"])
+    )
+    chaves_ocupadas = _chave(bairro_celula["i"].to_numpy(), bairro_celula["j"].to_numpy())
+
+    candidatas = pd.concat([
+        pd.DataFrame({
+            "i": bairro_celula["i"].to_numpy() + di,
+            "j": bairro_celula["j"].to_numpy() + dj,
+            "Bairro": bairro_celula["Bairro"].to_numpy(),
+        })
+        for di, dj in VIZINHANCA_8
+    ], ignore_index=True)
+    candidatas = candidatas[~np.isin(_chave(candidatas["i"].to_numpy(), candidatas["j"].to_numpy()), chaves_ocupadas)]
+    if candidatas.empty:
+        return pd.DataFrame(columns=colunas)
+
+    vizinhas = candidatas.groupby(["i", "j"], sort=False).size().rename("Vizinhas atendidas")
+    bairro = (
+        candidatas.groupby(["i", "j", "Bairro"], sort=False).size()
+        .reset_index(name="n")
+        .sort_values("n", ascending=False, kind="stable")
+        .drop_duplicates(["i", "j"])
+        .set_index(["i", "j"])["Bairro"]
+    )
+    lacunas = pd.concat([vizinhas, bairro], axis=1).reset_index()
+    lacunas = lacunas[lacunas["Vizinhas atendidas"] >= min_vizinhas]
+
+    return pd.DataFrame({
+        "LAT": (lacunas["i"].to_numpy() + 0.5) * tamanho_m / METROS_POR_GRAU,
+        "LON": (lacunas["j"].to_numpy() + 0.5) * tamanho_m / ESCALA_LON,
+        "Bairro": lacunas["Bairro"].to_numpy(),
+        "Vizinhas atendidas": lacunas["Vizinhas atendidas"].to_numpy(),
+        "Peso": lacunas["Vizinhas atendidas"].to_numpy() / len(VIZINHANCA_8),
+    }, columns=colunas).reset_index(drop=True)
+
+
+# ================== RESUMO POR BAIRRO ==================
+def cobertura_por_bairro(df, intervalos, isoladas, lacunas, tamanho_m=LADO_CELULA_LACUNA):
+    df, lat, lon = _coordenadas(df)
+    ci, cj = _celulas(lat, lon, tamanho_m)
+    base = pd.DataFrame({"Bairro": df["Bairro"].astype(str).to_numpy(), "celula": _chave(ci, cj)})
+
+    tabela = base.groupby("Bairro").agg(Paradas=("celula", "size"), Celulas=("celula", "nunique"))
+    tabela["Área atendida (km²)"] = (tabela["Celulas"] * (tamanho_m / 1000) ** 2).round(2)
+    tabela["Paradas/km²"] = (tabela["Paradas"] / tabela["Área atendida (km²)"]).round(1)
+    tabela["Espaçamento mediano (m)"] = (
+        intervalos.assign(Bairro=intervalos["Bairro"].astype(str))
+        .groupby("Bairro")["Distancia"].median().round(0)
+    )
+    tabela["Isoladas"] = isoladas["Bairro"].astype(str).value_counts()
+    tabela["Lacunas"] = lacunas["Bairro"].astype(str).value_counts()
+
+    tabela[["Isoladas", "Lacunas"]] = tabela[["Isoladas", "Lacunas"]].fillna(0).astype("int64")
+    return (
+        tabela.drop(columns="Celulas")
+        .sort_values(["Lacunas", "Isoladas"], ascending=False, kind="stable")
+        .reset_index()
+    )
+
+
+def analisar_cobertura(df):
+    intervalos = intervalos_consecutivos(df)
+    isoladas = paradas_isoladas(df)
+    lacunas = lacunas_cobertura(df)
+    return {
+        "ruas": espacamento_por_rua(intervalos),
+        "isoladas": isoladas,
+        "lacunas": lacunas,
+        "bairros": cobertura_por_bairro(df, intervalos, isoladas, lacunas),
+    }
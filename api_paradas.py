@@ -0,0 +1,315 @@
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from collections import OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from sqlalchemy import select, func
+
+from dados_paradas import (
+    MARGEM_SYNC,
+    Parada,
+    ParadaExcluida,
+    SENTIDOS_PARADA,
+    TIPOS_PARADA,
+    criar_engine,
+    filtro_bbox,
+)
+from exportar_paradas import consulta_exportacao, feature_geojson
+
+log = logging.getLogger(__name__)
+
+
+# ================== CONFIG ==================
+LIMITE_PADRAO = 100
+LIMITE_MAXIMO = 1000
+LIMITE_BBOX = 5000
+VALIDADE_VERSAO = 2.0              # segundos entre consultas da versão dos dados
+MAX_RESPOSTAS_CACHE = 512
+MAX_AGE = 5                        # Cache-Control para clientes e proxies
+
+ROTA_ID = re.compile(r"^/paradas/(\d+)$")
+
+# filtros sem diferenciar maiúsculas e espaços: "abrigo+placa" -> "Abrigo + Placa"
+def _chave_filtro(valor):
+    return re.sub(r"\s+", "", valor).lower()
+
+TIPOS_POR_CHAVE = {_chave_filtro(t): t for t in TIPOS_PARADA}
+SENTIDOS_POR_CHAVE = {_chave_filtro(s): s for s in SENTIDOS_PARADA}
+
+
+class ErroRequisicao(Exception):
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+
+# ================== VERSÃO DOS DADOS ==================
+# Última alteração e última exclusão: muda sempre que o inventário muda pelo
+# app, pela importação ou pela API de dados (toda exclusão deixa lápide).
+# Os dois max() saem dos índices de atualizado_em e excluido_em numa única
+# ida ao banco, sem contar a tabela, e são lidos no máximo a cada
+# VALIDADE_VERSAO segundos, não a cada requisição.
+#
+# Uma linha carimbada antes e confirmada depois (transação lenta, lote da
+# fila, relógios diferentes entre servidores) não move os max(). Por isso,
+# como no CacheParadas, a versão só é estável quando a última alteração já
+# passou de MARGEM_SYNC; antes disso ela não identifica o conteúdo.
+class VersaoDados:
+    def __init__(self, engine, validade=VALIDADE_VERSAO):
+        self.engine = engine
+        self.validade = validade
+        self.valor = None
+        self.ultima = None
+        self.lida_em = 0.0
+        self._lock = threading.Lock()
+
+    def atual(self):
+        # devolve (versão, estável)
+        with self._lock:
+            if self.valor is None or time.monotonic() - self.lida_em >= self.validade:
+                with self.engine.connect() as conn:
+                    alterada, excluida = conn.execute(select(
+                        select(func.max(Parada.atualizado_em)).scalar_subquery(),
+                        select(func.max(ParadaExcluida.excluido_em)).scalar_subquery(),
+                    )).one()
+                self.valor = f"{alterada}|{excluida}"
+                self.ultima = max((m for m in (alterada, excluida) if m is not None), default=None)
+                self.lida_em = time.monotonic()
+            estavel = self.ultima is None or datetime.now() - self.ultima > MARGEM_SYNC
+            return self.valor, estavel
+
+
+# ================== CACHE DE RESPOSTAS ==================
+class CacheRespostas:
+    def __init__(self, max_entradas=MAX_RESPOSTAS_CACHE):
+        self.max_entradas = max_entradas
+        self.entradas = OrderedDict()
+        self.acertos = 0
+        self.faltas = 0
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            valor = self.entradas.get(chave)
+            if valor is None:
+                self.faltas += 1
+                return None
+            self.entradas.move_to_end(chave)
+            self.acertos += 1
+            return valor
+
+    def guardar(self, chave, valor):
+        with self._lock:
+            self.entradas[chave] = valor
+            self.entradas.move_to_end(chave)
+            while len(self.entradas) > self.max_entradas:
+                self.entradas.popitem(last=False)
+
+
+# ================== CONSULTAS ==================
+def _inteiro(params, nome, padrao=None, minimo=None, maximo=None):
+    valor = params.get(nome, [None])[0]
+    if valor in (None, ""):
+        return padrao
+    try:
+        valor = int(valor)
+    except ValueError:
+        raise ErroRequisicao(400, f"parâmetro {nome} deve ser inteiro")
+    if minimo is not None and valor < minimo:
+        raise ErroRequisicao(400, f"parâmetro {nome} deve ser >= {minimo}")
+    return min(valor, maximo) if maximo is not None else valor
+
+def _decimal(params, nome):
+    valor = params.get(nome, [None])[0]
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        raise ErroRequisicao(400, f"parâmetro {nome} obrigatório e numérico")
+
+def _pagina(conn, consulta, params, limite_maximo):
+    # paginação por chave: ?apos=<último id da página anterior>
+    limite = _inteiro(params, "limite", LIMITE_PADRAO, minimo=1, maximo=limite_maximo)
+    apos = _inteiro(params, "apos")
+    if apos is not None:
+        consulta = consulta.where(Parada.id > apos)
+    if params.get("bairro"):
+        # o bairro gravado pode ter outra caixa ou espaços nas pontas
+        consulta = consulta.where(
+            func.lower(func.trim(Parada.bairro)).in_([b.strip().lower() for b in params["bairro"]])
+        )
+    for nome, coluna, validos in (
+        ("tipo", Parada.tipo, TIPOS_POR_CHAVE),
+        ("sentido", Parada.sentido, SENTIDOS_POR_CHAVE),
+    ):
+        if params.get(nome):
+            valores = [validos.get(_chave_filtro(v)) for v in params[nome]]
+            if None in valores:
+                raise ErroRequisicao(400, f"parâmetro {nome} deve ser um de: {', '.join(validos.values())}")
+            consulta = consulta.where(coluna.in_(valores))
+
+    linhas = conn.execute(consulta.order_by(Parada.id).limit(limite + 1)).all()
+    pagina = linhas[:limite]
+    return {
+        "type": "FeatureCollection",
+        "features": [feature_geojson(l) for l in pagina],
+        "proximo": pagina[-1].id if len(linhas) > limite else None,
+    }
+
+def listar(conn, params):
+    return _pagina(conn, consulta_exportacao(), params, LIMITE_MAXIMO)
+
+def listar_bbox(conn, params):
+    sul, oeste = _decimal(params, "sul"), _decimal(params, "oeste")
+    norte, leste = _decimal(params, "norte"), _decimal(params, "leste")
+    if sul > norte or oeste > leste:
+        raise ErroRequisicao(400, "bbox inválida: sul <= norte e oeste <= leste")
+    consulta = consulta_exportacao().where(*filtro_bbox(sul, oeste, norte, leste))
+    return _pagina(conn, consulta, params, LIMITE_BBOX)
+
+def obter(conn, parada_id):
+    linha = conn.execute(consulta_exportacao().where(Parada.id == parada_id)).first()
+    if linha is None:
+        raise ErroRequisicao(404, "parada não encontrada")
+    return feature_geojson(linha)
+
+
+# ================== SERVIDOR ==================
+class ServicoParadas:
+    def __init__(self, engine, max_respostas=MAX_RESPOSTAS_CACHE):
+        self.engine = engine
+        self.versao = VersaoDados(engine)
+        self.cache = CacheRespostas(max_respostas)
+
+    def _resolver(self, caminho, params):
+        if caminho == "/saude":
+            return None
+        if caminho == "/paradas":
+            return lambda conn: listar(conn, params)
+        if caminho == "/paradas/bbox":
+            return lambda conn: listar_bbox(conn, params)
+        rota = ROTA_ID.match(caminho)
+        if rota:
+            return lambda conn: obter(conn, int(rota.group(1)))
+        raise ErroRequisicao(404, "rota inexistente")
+
+    def responder(self, alvo, if_none_match=None):
+        # devolve (status, etag, corpo gzip); o corpo vem do cache enquanto a
+        # versão dos dados for a mesma. Com a versão estável, o ETag depende
+        # só dela e da requisição, então o 304 sai sem consultar o banco mesmo
+        # depois de a resposta ter saído do cache. Com a versão ainda
+        # instável, toda requisição consulta o banco e o ETag vem do corpo
+        partes = urlsplit(alvo)
+        caminho = partes.path.rstrip("/") or "/"
+        params = parse_qs(partes.query)
+        versao, estavel = self.versao.atual()
+
+        consulta = self._resolver(caminho, params)
+        if consulta is None:
+            corpo = {"status": "ok", "versao": versao}
+            return 200, None, gzip.compress(json.dumps(corpo).encode("utf-8"))
+
+        chave = (versao, caminho, tuple(sorted((k, tuple(v)) for k, v in params.items())))
+        if estavel:
+            etag = '"' + hashlib.sha1(repr(chave).encode("utf-8")).hexdigest()[:20] + '"'
+            if if_none_match and etag in if_none_match:
+                return 304, etag, b""
+
+            em_cache = self.cache.obter(chave)
+            if em_cache is not None:
+                return em_cache
+
+        with self.engine.connect() as conn:
+            dados = consulta(conn)
+        corpo = json.dumps(dados, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+        if not estavel:
+            etag = '"c' + hashlib.sha1(corpo).hexdigest()[:20] + '"'
+            if if_none_match and etag in if_none_match:
+                return 304, etag, b""
+            return 200, etag, gzip.compress(corpo, compresslevel=5)
+
+        resposta = (200, etag, gzip.compress(corpo, compresslevel=5))
+        self.cache.guardar(chave, resposta)
+        return resposta
+
+
+def criar_manipulador(servico):
+    class Manipulador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        server_version = "SIP-API/1.0"
+
+        def do_GET(self):
+            try:
+                status, etag, corpo = servico.responder(self.path, self.headers.get("If-None-Match"))
+            except ErroRequisicao as e:
+                status, etag = e.status, None
+                corpo = gzip.compress(json.dumps({"erro": str(e)}, ensure_ascii=False).encode("utf-8"))
+            except Exception:
+                log.exception("Falha ao atender %s", self.path)
+                status, etag = 500, None
+                corpo = gzip.compress(b'{"erro": "falha interna"}')
+
+            if status == 304:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", f"public, max-age={MAX_AGE}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            aceita_gzip = "gzip" in (self.headers.get("Accept-Encoding") or "")
+            if not aceita_gzip:
+                corpo = gzip.decompress(corpo)
+
+            self.send_response(status)
+            # só as respostas com dados (sempre com ETag) são GeoJSON
+            if etag:
+                self.send_header("Content-Type", "application/geo+json; charset=utf-8")
+            else:
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.send_header("Vary", "Accept-Encoding")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            if aceita_gzip:
+                self.send_header("Content-Encoding", "gzip")
+            if etag:
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", f"public, max-age={MAX_AGE}")
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, formato, *args):
+            log.debug("%s - %s", self.address_string(), formato % args)
+
+    return Manipulador
+
+def servir(engine, host="0.0.0.0", porta=8502):
+    servidor = ThreadingHTTPServer((host, porta), criar_manipulador(ServicoParadas(engine)))
+    servidor.daemon_threads = True
+    return servidor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API somente leitura do inventário de paradas (GeoJSON).")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--porta", type=int, default=int(os.getenv("API_PORTA", "8502")))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine = criar_engine(os.environ["DATABASE_URL"], pool_size=10, max_overflow=20)
+    servidor = servir(engine, args.host, args.porta)
+    log.info("API de paradas em http://%s:%d", args.host, args.porta)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        servidor.shutdown()
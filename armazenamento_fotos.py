@@ -0,0 +1,343 @@
+import argparse
+import io
+import logging
+import os
+import shutil
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from functools import lru_cache
+from uuid import uuid4
+
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+
+from dados_paradas import Parada, criar_engine
+from instrumentacao import etapa, medir
+
+log = logging.getLogger(__name__)
+
+
+# ================== CONFIG ==================
+MAX_ENVIOS_SIMULTANEOS = 4
+MAX_CONEXOES = 16
+TENTATIVAS_ENVIO = 4
+ESPERA_BASE = 1.0                  # segundos; dobra a cada nova tentativa
+RETENCAO_STATUS = 600              # segundos que um envio terminado continua visível
+VALIDADE_SEM_DERIVADOS = 600       # segundos até conferir de novo uma foto sem derivados
+
+# Derivados gerados no envio: versão principal limitada e miniatura
+LADO_MAXIMO = 1600
+LADO_MINIATURA = 320
+QUALIDADE_WEBP = 80
+
+@dataclass(frozen=True)
+class ConfigArmazenamento:
+    endpoint: str
+    chave: str
+    segredo: str
+    bucket: str
+    url_publica: str
+
+def ler_config(segredos=None):
+    # st.secrets primeiro, variáveis de ambiente como alternativa
+    def valor(nome):
+        if segredos is not None and nome in segredos:
+            return segredos[nome]
+        return os.getenv(nome, "")
+
+    return ConfigArmazenamento(
+        endpoint=valor("R2_ENDPOINT"),
+        chave=valor("R2_ACCESS_KEY"),
+        segredo=valor("R2_SECRET_KEY"),
+        bucket=valor("R2_BUCKET"),
+        url_publica=valor("R2_PUBLIC_URL").rstrip("/"),
+    )
+
+
+# ================== CLIENTES ==================
+class ClienteLocal:
+    # Substituto do S3 em disco para desenvolvimento e testes
+    # (R2_ENDPOINT=file:///caminho). Implementa só o que o app usa.
+    def __init__(self, pasta):
+        self.pasta = pasta
+
+    def _caminho(self, bucket, chave):
+        caminho = os.path.join(self.pasta, bucket, *chave.split("/"))
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        return caminho
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, **kwargs):
+        with open(self._caminho(Bucket, Key), "wb") as f:
+            if isinstance(Body, (bytes, bytearray)):
+                f.write(Body)
+            else:
+                shutil.copyfileobj(Body, f)
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None):
+        self.put_object(Bucket, Key, Fileobj)
+
+    def get_object(self, Bucket, Key, **kwargs):
+        with open(self._caminho(Bucket, Key), "rb") as f:
+            return {"Body": io.BytesIO(f.read())}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        caminho = self._caminho(Bucket, Key)
+        if not os.path.exists(caminho):
+            raise FileNotFoundError(Key)
+        return {"ContentLength": os.path.getsize(caminho)}
+
+
+@lru_cache(maxsize=None)
+def obter_cliente(config):
+    # um cliente por processo: reaproveita o pool de conexões TLS entre envios
+    if config.endpoint.startswith("file://"):
+        return ClienteLocal(config.endpoint[len("file://"):])
+
+    import boto3
+    from botocore.config import Config
+
+    return boto3.session.Session().client(
+        "s3",
+        endpoint_url=config.endpoint,
+        aws_access_key_id=config.chave,
+        aws_secret_access_key=config.segredo,
+        region_name="auto",
+        config=Config(
+            max_pool_connections=MAX_CONEXOES,
+            retries={"max_attempts": 3, "mode": "standard"},
+            connect_timeout=5,
+            read_timeout=60,
+        )
+    )
+
+
+# ================== PROCESSAMENTO DE IMAGEM ==================
+def _codificar_webp(img):
+    saida = io.BytesIO()
+    # salvar sem o parâmetro exif descarta os metadados (GPS, aparelho...)
+    img.save(saida, format="WEBP", quality=QUALIDADE_WEBP, method=4)
+    return saida.getvalue()
+
+@medir("imagem.processar")
+def processar_imagem(conteudo):
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(conteudo)) as original:
+        img = ImageOps.exif_transpose(original)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGB")
+
+        principal = img.copy()
+        principal.thumbnail((LADO_MAXIMO, LADO_MAXIMO), Image.LANCZOS)
+        miniatura = img.copy()
+        miniatura.thumbnail((LADO_MINIATURA, LADO_MINIATURA), Image.LANCZOS)
+
+    return _codificar_webp(principal), _codificar_webp(miniatura)
+
+# Derivados ficam ao lado do original:
+#   paradas/12_<uuid>.jpg -> paradas/12_<uuid>_principal.webp / _miniatura.webp
+# A miniatura é enviada depois da principal: se ela existe, as duas existem.
+def chave_derivada(chave_ou_url, sufixo):
+    return f"{chave_ou_url.rsplit('.', 1)[0]}_{sufixo}.webp"
+
+def url_miniatura(foto_url):
+    return chave_derivada(foto_url, "miniatura")
+
+def url_principal(foto_url):
+    return chave_derivada(foto_url, "principal")
+
+def _existe(cliente, bucket, chave):
+    try:
+        cliente.head_object(Bucket=bucket, Key=chave)
+        return True
+    except Exception:
+        return False
+
+
+# ================== ENVIO EM SEGUNDO PLANO ==================
+def chave_foto(parada_id, nome_arquivo):
+    ext = nome_arquivo.rsplit(".", 1)[-1].lower()
+    return f"paradas/{parada_id}_{uuid4()}.{ext}"
+
+def enviar_com_retentativas(config, chave, conteudo, content_type):
+    cliente = obter_cliente(config)
+    for tentativa in range(TENTATIVAS_ENVIO):
+        try:
+            with etapa("r2.envio"):
+                cliente.put_object(
+                    Bucket=config.bucket,
+                    Key=chave,
+                    Body=conteudo,
+                    ContentType=content_type
+                )
+            return
+        except Exception as e:
+            if tentativa == TENTATIVAS_ENVIO - 1:
+                raise
+            espera = ESPERA_BASE * (2 ** tentativa)
+            log.warning("Envio de %s falhou (%s); nova tentativa em %.0fs", chave, e, espera)
+            time.sleep(espera)
+
+def enviar_derivados(config, chave, conteudo):
+    try:
+        principal, miniatura = processar_imagem(conteudo)
+    except Exception as e:
+        log.warning("Não foi possível processar a imagem %s: %s", chave, e)
+        return False
+
+    enviar_com_retentativas(config, chave_derivada(chave, "principal"), principal, "image/webp")
+    enviar_com_retentativas(config, chave_derivada(chave, "miniatura"), miniatura, "image/webp")
+    return True
+
+class EnviosFotos:
+    def __init__(self, config, fabrica_sessao, max_envios=MAX_ENVIOS_SIMULTANEOS):
+        self.config = config
+        self.fabrica_sessao = fabrica_sessao
+        self.executor = ThreadPoolExecutor(max_workers=max_envios, thread_name_prefix="envio-foto")
+        self.status = {}
+        # foto_url -> (tem derivados, instante da consulta ao bucket)
+        self.derivados = {}
+        self._lock = threading.Lock()
+
+    def _marcar(self, parada_id, estado, detalhe=""):
+        agora = time.monotonic()
+        with self._lock:
+            self.status[parada_id] = (estado, detalhe, agora)
+            if estado != "enviando":
+                # envios terminados saem depois de RETENCAO_STATUS; o
+                # processo vive por semanas e o dicionário não pode crescer
+                # a cada foto
+                for pid, (estado_pid, _, instante) in list(self.status.items()):
+                    if estado_pid != "enviando" and agora - instante > RETENCAO_STATUS:
+                        del self.status[pid]
+
+    def situacao(self, parada_id):
+        with self._lock:
+            status = self.status.get(parada_id)
+        return status[:2] if status else None
+
+    def _tem_derivados(self, foto_url):
+        # consulta ao bucket (síncrona, na renderização) no máximo uma vez por
+        # foto: o positivo vale para sempre e o negativo por
+        # VALIDADE_SEM_DERIVADOS, já que o reprocessamento pode gerar os
+        # derivados depois
+        prefixo = f"{self.config.url_publica}/"
+        if not foto_url.startswith(prefixo):
+            return False
+
+        agora = time.monotonic()
+        with self._lock:
+            conhecido = self.derivados.get(foto_url)
+        if conhecido and (conhecido[0] or agora - conhecido[1] < VALIDADE_SEM_DERIVADOS):
+            return conhecido[0]
+
+        chave = chave_derivada(foto_url[len(prefixo):], "miniatura")
+        tem = _existe(obter_cliente(self.config), self.config.bucket, chave)
+        with self._lock:
+            self.derivados[foto_url] = (tem, agora)
+        return tem
+
+    def url_exibicao(self, foto_url):
+        # miniatura quando existe; senão o próprio original (fotos antigas
+        # ainda não reprocessadas ou derivado que falhou)
+        return url_miniatura(foto_url) if self._tem_derivados(foto_url) else foto_url
+
+    def url_tamanho_real(self, foto_url):
+        # versão principal (até LADO_MAXIMO, sem EXIF/GPS); o original só
+        # quando ela não existe
+        return url_principal(foto_url) if self._tem_derivados(foto_url) else foto_url
+
+    def enviar(self, parada_id, conteudo, nome_arquivo, content_type):
+        # chamado depois do commit da parada: o envio não segura o formulário
+        self._marcar(parada_id, "enviando")
+        return self.executor.submit(
+            self._executar, parada_id, conteudo, nome_arquivo, content_type
+        )
+
+    def _executar(self, parada_id, conteudo, nome_arquivo, content_type):
+        chave = chave_foto(parada_id, nome_arquivo)
+        try:
+            enviar_com_retentativas(self.config, chave, conteudo, content_type)
+        except Exception as e:
+            log.error("Falha ao enviar a foto da parada %s: %s", parada_id, e)
+            self._marcar(parada_id, "erro", str(e))
+            return None
+
+        url = f"{self.config.url_publica}/{chave}"
+
+        # sem derivados a tela mostra o original; o reprocessamento
+        # (gerar_derivados_existentes) pode criá-los depois
+        try:
+            if enviar_derivados(self.config, chave, conteudo):
+                with self._lock:
+                    self.derivados[url] = (True, time.monotonic())
+        except Exception as e:
+            log.warning("Derivados da foto da parada %s não enviados: %s", parada_id, e)
+
+        try:
+            with self.fabrica_sessao() as session:
+                parada = session.get(Parada, parada_id)
+                if parada is None:
+                    self._marcar(parada_id, "descartada", "parada excluída durante o envio")
+                    return None
+                parada.foto_url = url
+                session.commit()
+        except Exception as e:
+            log.error("Foto da parada %s enviada, mas não gravada no banco: %s", parada_id, e)
+            self._marcar(parada_id, "erro", f"falha ao gravar no banco: {e}")
+            return None
+
+        self._marcar(parada_id, "concluido", url)
+        return url
+
+
+# ================== REPROCESSAMENTO DAS FOTOS EXISTENTES ==================
+def gerar_derivados_existentes(config, fabrica_sessao, workers=8, refazer=False):
+    prefixo = f"{config.url_publica}/"
+    with fabrica_sessao() as session:
+        urls = session.execute(
+            select(Parada.foto_url).where(Parada.foto_url.like(f"{prefixo}%"))
+        ).scalars().all()
+
+    cliente = obter_cliente(config)
+
+    def processar(url):
+        chave = url[len(prefixo):]
+        if not refazer and _existe(cliente, config.bucket, chave_derivada(chave, "miniatura")):
+            return "existente"
+        conteudo = cliente.get_object(Bucket=config.bucket, Key=chave)["Body"].read()
+        ok = enviar_derivados(config, chave, conteudo)
+        return "gerada" if ok else "ignorada"
+
+    totais = {"gerada": 0, "existente": 0, "ignorada": 0, "erro": 0}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futuros = {executor.submit(processar, url): url for url in urls}
+        for futuro in as_completed(futuros):
+            try:
+                totais[futuro.result()] += 1
+            except Exception as e:
+                log.error("Falha ao reprocessar %s: %s", futuros[futuro], e)
+                totais["erro"] += 1
+
+    return totais
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Gera a versão principal e a miniatura das fotos já enviadas ao R2."
+    )
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--refazer", action="store_true", help="regera mesmo se a miniatura já existir")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine = criar_engine(os.environ["DATABASE_URL"])
+    totais = gerar_derivados_existentes(
+        ler_config(),
+        sessionmaker(bind=engine),
+        workers=args.workers,
+        refazer=args.refazer
+    )
+    print(", ".join(f"{k}: {v}" for k, v in totais.items()))
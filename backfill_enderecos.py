@@ -0,0 +1,322 @@
+import argparse
+import json
+import logging
+import os
+import time
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from sqlalchemy import select, cast, Float
+from sqlalchemy.orm import sessionmaker
+
+from dados_paradas import (
+    EnderecoCache,
+    Parada,
+    criar_engine,
+    dobrar_acentos,
+    extrair_endereco,
+    normalizar_texto,
+)
+from geocodificacao import (
+    PASSO_GRADE,
+    TTL_CACHE,
+    GeocodificadorLocal,
+    GeocodificadorNominatim,
+    LimitadorTaxa,
+    chave_grade,
+)
+from instrumentacao import etapa
+
+log = logging.getLogger(__name__)
+
+
+# ================== CONFIG ==================
+TAMANHO_LOTE_BACKFILL = 200        # paradas por transação (e por checkpoint)
+TRABALHADORES = 4
+TAXA_GEOCODIFICACAO = 1.0          # req/s somando todos os trabalhadores (política do Nominatim)
+MIN_PARADAS_CELULA = 3             # célula com menos paradas não define bairro
+PROPORCAO_BAIRRO_MODAL = 0.6       # fatia mínima do bairro mais comum na célula
+# fora do diretório de trabalho, na mesma pasta de dados locais do app
+CHECKPOINT_PADRAO = os.path.join(
+    os.getenv("PASTA_DADOS") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados_locais"),
+    "backfill_enderecos.json"
+)
+
+LIMITES_CAMPOS = {"rua": 255, "numero_localizacao": 20, "bairro": 100, "cep": 10}
+
+
+def _vazio(serie):
+    return serie.fillna("").astype(str).str.strip() == ""
+
+
+# ================== SELEÇÃO ==================
+# Incompletas: rua, bairro, número ou CEP em branco. Divergentes: bairro
+# diferente do bairro predominante da célula espacial (~550 m) em que a
+# parada está, quando essa célula tem paradas suficientes para decidir.
+def carregar_candidatas(engine, apos_id=0, pendentes=()):
+    with engine.connect() as conn:
+        linhas = conn.execute(
+            select(
+                Parada.id, cast(Parada.latitude, Float), cast(Parada.longitude, Float),
+                Parada.rua, Parada.numero_localizacao, Parada.bairro, Parada.cep, Parada.celula,
+            ).where(Parada.latitude.isnot(None), Parada.longitude.isnot(None))
+        ).all()
+
+    colunas = ["id", "lat", "lon", "rua", "numero_localizacao", "bairro", "cep", "celula"]
+    df = pd.DataFrame.from_records(linhas, columns=colunas)
+    if df.empty:
+        return df.assign(divergente=pd.Series(dtype=bool), chave=pd.Series(dtype=str))
+
+    bairro = df["bairro"].map(dobrar_acentos)
+    contagem = (
+        pd.DataFrame({"celula": df["celula"], "bairro": bairro})
+        .groupby(["celula", "bairro"]).size()
+        .reset_index(name="n")
+    )
+    contagem["total"] = contagem.groupby("celula")["n"].transform("sum")
+    modal = (
+        contagem.sort_values("n", ascending=False, kind="stable")
+        .drop_duplicates("celula")
+        .query("total >= @MIN_PARADAS_CELULA and n >= total * @PROPORCAO_BAIRRO_MODAL")
+        .set_index("celula")["bairro"]
+    )
+    bairro_modal = df["celula"].map(modal)
+    divergente = bairro_modal.notna() & (bairro != bairro_modal)
+
+    incompleta = _vazio(df["rua"]) | _vazio(df["bairro"]) | _vazio(df["numero_localizacao"]) | _vazio(df["cep"])
+    alvo = (incompleta | divergente) & ((df["id"] > apos_id) | df["id"].isin(list(pendentes)))
+
+    df = df[alvo].assign(divergente=divergente[alvo]).sort_values("id", kind="stable")
+    # mesma chave do cache de geocodificação do app: pontos a poucos metros
+    # uns dos outros viram uma única consulta
+    df["chave"] = [chave_grade(lat, lon) for lat, lon in zip(df["lat"], df["lon"])]
+    return df.reset_index(drop=True)
+
+
+# ================== GEOCODIFICAÇÃO EM LOTE ==================
+# Cada lote consulta primeiro o cache persistente (uma ida ao banco) e só
+# depois a rede, para as células que faltam. Os trabalhadores dividem um
+# único limitador com capacidade 1: a taxa global nunca passa de `taxa`,
+# e as esperas de rede de um trabalhador se sobrepõem às fichas dos outros.
+class GeocodificacaoLote:
+    def __init__(self, fabrica_sessao, geocodificador, taxa=TAXA_GEOCODIFICACAO,
+                 trabalhadores=TRABALHADORES, ttl=TTL_CACHE, gravar_cache=True):
+        self.fabrica_sessao = fabrica_sessao
+        self.geocodificador = geocodificador
+        self.limitador = LimitadorTaxa(taxa=taxa, capacidade=1)
+        self.executor = ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix="backfill-geo")
+        self.ttl = ttl
+        self.gravar_cache = gravar_cache
+
+    def fechar(self):
+        self.executor.shutdown(wait=True)
+
+    def _consultar(self, lat, lon):
+        self.limitador.aguardar()
+        try:
+            with etapa("geocodificacao.rede"):
+                return "rede", self.geocodificador.reverter(lat, lon)
+        except Exception as e:
+            log.warning("Falha na geocodificação reversa de (%s, %s): %s", lat, lon, e)
+            return "falha", None
+
+    def resolver(self, celulas):
+        # celulas: {chave: (lat, lon)} -> ({chave: dados ou None}, Counter de origens)
+        origens = Counter()
+        resultado = {}
+        with self.fabrica_sessao() as session:
+            em_cache = session.execute(
+                select(EnderecoCache.chave, EnderecoCache.endereco)
+                .where(
+                    EnderecoCache.chave.in_(list(celulas)),
+                    EnderecoCache.criado_em >= datetime.now() - self.ttl,
+                )
+            ).all()
+        for chave, endereco in em_cache:
+            resultado[chave] = json.loads(endereco)
+        origens["cache"] += len(resultado)
+
+        faltam = [c for c in celulas if c not in resultado]
+        novos = {}
+        futuros = {c: self.executor.submit(self._consultar, *celulas[c]) for c in faltam}
+        for chave, futuro in futuros.items():
+            origem, endereco = futuro.result()
+            if origem == "falha":
+                origens["falha"] += 1
+                continue
+            origens["rede"] += 1
+            resultado[chave] = extrair_endereco(endereco) if endereco else None
+            if endereco:
+                novos[chave] = resultado[chave]
+
+        if novos and self.gravar_cache:
+            with self.fabrica_sessao() as session:
+                for chave, dados in novos.items():
+                    session.merge(EnderecoCache(chave=chave, endereco=json.dumps(dados), criado_em=datetime.now()))
+                session.commit()
+        return resultado, origens
+
+
+# ================== ATUALIZAÇÃO ==================
+def _diferente(a, b):
+    return dobrar_acentos(a) != dobrar_acentos(b)
+
+def novos_valores(parada, dados, divergente):
+    mudancas = {}
+    rua = normalizar_texto(dados["rua"])
+    bairro = normalizar_texto(dados["bairro"])
+    if rua and not (parada.rua or "").strip():
+        mudancas["rua"] = rua
+    if dados["num"] and not (parada.numero_localizacao or "").strip():
+        mudancas["numero_localizacao"] = str(dados["num"]).strip()
+    if dados["cep"] and not (parada.cep or "").strip():
+        mudancas["cep"] = str(dados["cep"]).strip()
+    if bairro and (divergente or not (parada.bairro or "").strip()) and _diferente(bairro, parada.bairro):
+        mudancas["bairro"] = bairro
+    return {c: v[:LIMITES_CAMPOS[c]] for c, v in mudancas.items()}
+
+def aplicar_lote(fabrica_sessao, lote, enderecos, simular=False):
+    # pelo ORM: os ganchos mantêm célula, texto de busca, resumo e
+    # atualizado_em (que leva a mudança aos caches dos apps em execução)
+    totais = Counter()
+    with fabrica_sessao() as session:
+        paradas = {
+            p.id: p
+            for p in session.execute(select(Parada).where(Parada.id.in_(lote["id"].tolist()))).scalars()
+        }
+        for linha in lote.itertuples(index=False):
+            parada = paradas.get(linha.id)
+            if parada is None:
+                # excluída depois da seleção
+                continue
+            dados = enderecos.get(linha.chave)
+            if not dados:
+                totais["sem_endereco"] += 1
+                continue
+            mudancas = novos_valores(parada, dados, linha.divergente)
+            if not mudancas:
+                totais["sem_mudanca"] += 1
+                continue
+            for campo, valor in mudancas.items():
+                setattr(parada, campo, valor)
+                totais[f"campo_{campo}"] += 1
+            totais["atualizadas"] += 1
+
+        if simular:
+            session.rollback()
+        else:
+            session.commit()
+    return totais
+
+
+# ================== CHECKPOINT ==================
+# ultimo_id: maior id já processado; pendentes: ids cuja geocodificação
+# falhou e que a próxima execução tenta de novo
+def ler_checkpoint(caminho):
+    if caminho and os.path.exists(caminho):
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f)
+    return {"ultimo_id": 0, "pendentes": [], "totais": {}}
+
+def gravar_checkpoint(caminho, checkpoint):
+    checkpoint["gravado_em"] = datetime.now().isoformat(timespec="seconds")
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    temporario = f"{caminho}.tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
+
+
+# ================== EXECUÇÃO ==================
+def executar(engine, geocodificador, caminho_checkpoint=CHECKPOINT_PADRAO, tamanho_lote=TAMANHO_LOTE_BACKFILL,
+             trabalhadores=TRABALHADORES, taxa=TAXA_GEOCODIFICACAO, limite=None, simular=False):
+    inicio = time.perf_counter()
+    fabrica_sessao = sessionmaker(bind=engine, expire_on_commit=False)
+    checkpoint = ler_checkpoint(caminho_checkpoint)
+    pendentes = set(checkpoint["pendentes"])
+
+    candidatas = carregar_candidatas(engine, checkpoint["ultimo_id"], pendentes)
+    if limite is not None:
+        candidatas = candidatas.head(limite)
+    totais = Counter(
+        candidatas=len(candidatas),
+        divergentes=int(candidatas["divergente"].sum()),
+        celulas=candidatas["chave"].nunique(),
+    )
+    log.info("%d paradas candidatas em %d células", totais["candidatas"], totais["celulas"])
+
+    geocodificacao = GeocodificacaoLote(
+        fabrica_sessao, geocodificador, taxa=taxa, trabalhadores=trabalhadores, gravar_cache=not simular
+    )
+    try:
+        for inicio_lote in range(0, len(candidatas), tamanho_lote):
+            lote = candidatas.iloc[inicio_lote:inicio_lote + tamanho_lote]
+            celulas = {
+                chave: (int(i) * PASSO_GRADE, int(j) * PASSO_GRADE)
+                for chave in lote["chave"].unique()
+                for i, j in [chave.split(":")]
+            }
+            enderecos, origens = geocodificacao.resolver(celulas)
+            parcial = Counter({f"geo_{k}": v for k, v in origens.items()})
+            parcial.update(aplicar_lote(fabrica_sessao, lote, enderecos, simular=simular))
+            totais.update(parcial)
+
+            falharam = set(lote.loc[~lote["chave"].isin(list(enderecos)), "id"].tolist())
+            pendentes = (pendentes - set(lote["id"].tolist())) | falharam
+            checkpoint["ultimo_id"] = max(checkpoint["ultimo_id"], int(lote["id"].max()))
+            checkpoint["pendentes"] = sorted(pendentes)
+            checkpoint["totais"] = dict(Counter(checkpoint["totais"]) + parcial)
+            if not simular and caminho_checkpoint:
+                gravar_checkpoint(caminho_checkpoint, checkpoint)
+            log.info(
+                "até id %d: %d atualizadas, %d células pela rede, %d pendentes",
+                checkpoint["ultimo_id"], totais["atualizadas"], totais["geo_rede"], len(pendentes),
+            )
+    finally:
+        geocodificacao.fechar()
+
+    totais["pendentes"] = len(pendentes)
+    totais["segundos"] = round(time.perf_counter() - inicio, 2)
+    return totais
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Completa endereços de paradas por geocodificação reversa em lote.")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PADRAO, help="arquivo JSON para retomar a execução")
+    parser.add_argument("--reiniciar", action="store_true", help="ignora o checkpoint existente")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE_BACKFILL, help="paradas por transação")
+    parser.add_argument("--trabalhadores", type=int, default=TRABALHADORES)
+    parser.add_argument("--taxa", type=float, default=TAXA_GEOCODIFICACAO, help="consultas por segundo (total)")
+    parser.add_argument("--limite", type=int, help="processa no máximo N paradas")
+    parser.add_argument("--simular", action="store_true", help="geocodifica e conta sem gravar")
+    parser.add_argument(
+        "--local", metavar="JSON",
+        help="usa um geocodificador local (sem rede) que devolve este endereço no formato do Nominatim"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.reiniciar and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    if args.local is not None:
+        geocodificador = GeocodificadorLocal(json.loads(args.local))
+    else:
+        geocodificador = GeocodificadorNominatim()
+
+    engine = criar_engine(os.environ["DATABASE_URL"])
+    totais = executar(
+        engine,
+        geocodificador,
+        caminho_checkpoint=args.checkpoint,
+        tamanho_lote=args.lote,
+        trabalhadores=args.trabalhadores,
+        taxa=args.taxa,
+        limite=args.limite,
+        simular=args.simular,
+    )
+    print(", ".join(f"{k}: {v}" for k, v in sorted(totais.items())))
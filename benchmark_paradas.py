@@ -0,0 +1,401 @@
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import tempfile
+import time
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from dados_paradas import (
+    Base,
+    Parada,
+    TIPOS_PARADA,
+    SENTIDOS_PARADA,
+    CacheParadas,
+    buscar_paradas,
+    calcular_celula,
+    carregar_frame_paradas,
+    consulta_frame,
+    criar_engine,
+    dobrar_acentos,
+    ler_resumo,
+    migrar_esquema,
+    montar_frame,
+    reconstruir_resumo,
+    texto_busca_parada,
+)
+from api_paradas import listar_bbox
+from indice_espacial import IndiceEspacial, RAIO_DUPLICATA
+from indice_texto import IndiceTexto
+from analise_cobertura import analisar_cobertura
+
+
+# ================== CONFIG ==================
+TAMANHOS_PADRAO = [10_000, 100_000]
+REPETICOES = 5
+SEMENTE = 42
+LOTE_CARGA = 20_000
+
+# Feira de Santana: centro aproximado e espalhamento dos aglomerados (graus)
+CENTRO = (-12.2664, -38.9663)
+ESPALHAMENTO_CIDADE = 0.035
+ESPALHAMENTO_AGLOMERADO = 0.004
+AGLOMERADOS = 60
+DIAS_HISTORICO = 730
+
+PROPORCAO_TIPOS = [0.45, 0.15, 0.30, 0.10]
+PROPORCAO_COM_NUMERO = 0.7
+EXPOENTE_ZIPF = 1.1
+
+BAIRROS_BASE = [
+    "Centro", "Tomba", "Sobradinho", "Campo Limpo", "Jardim Cruzeiro",
+    "Cidade Nova", "Conceição", "Queimadinha", "Capuchinhos", "Santa Mônica",
+    "Brasília", "Ponto Central", "Rua Nova", "Serraria Brasil", "Mangabeira",
+    "Papagaio", "Calumbi", "George Américo", "Parque Ipê", "São João",
+    "Baraúnas", "Pampalona", "Caseb", "Muchila", "Aviário", "Gabriela",
+    "Santo Antônio dos Prazeres", "Lagoa Salgada", "Novo Horizonte", "Subaé",
+]
+LOGRADOUROS = ["Rua", "Avenida", "Travessa", "Praça", "Rodovia"]
+NOMES_RUA = [
+    "Getúlio Vargas", "Maria Quitéria", "João Durval Carneiro", "Senhor dos Passos",
+    "Presidente Dutra", "Sampaio", "Conselheiro Franco", "Castro Alves",
+    "Eduardo Fróes da Mota", "José Falcão da Silva", "Artêmia Pires Freitas",
+    "Fernando São Paulo", "Noide Cerqueira", "Deputado Colbert Martins",
+    "Iguatemi", "São Domingos", "Nóbrega", "Olímpio Vital", "Marechal Deodoro",
+]
+REFERENCIAS = [
+    "Em frente ao mercado", "Próximo à escola", "Ao lado da farmácia",
+    "Em frente à igreja", "Esquina com a praça", "Posto de saúde",
+    "Em frente ao supermercado", "Ponto final", "Próximo ao hospital",
+]
+
+
+# ================== GERADOR SINTÉTICO ==================
+def _pesos_zipf(n, expoente=EXPOENTE_ZIPF):
+    pesos = 1.0 / np.arange(1, n + 1) ** expoente
+    return pesos / pesos.sum()
+
+def vocabulario(n):
+    # bairros reais de Feira primeiro (os mais frequentes pela Zipf),
+    # completados por nomes sintéticos
+    bairros = BAIRROS_BASE + [f"Loteamento {i}" for i in range(max(0, n // 500))]
+    ruas = [
+        f"{LOGRADOUROS[i % len(LOGRADOUROS)]} {NOMES_RUA[i % len(NOMES_RUA)]}"
+        + (f" {i // len(NOMES_RUA)}" if i >= len(NOMES_RUA) else "")
+        for i in range(max(len(NOMES_RUA), n // 20))
+    ]
+    return bairros, ruas
+
+def gerar_paradas(n, semente=SEMENTE):
+    rng = np.random.default_rng(semente)
+    bairros, ruas = vocabulario(n)
+
+    centros = np.column_stack([
+        rng.normal(CENTRO[0], ESPALHAMENTO_CIDADE, AGLOMERADOS),
+        rng.normal(CENTRO[1], ESPALHAMENTO_CIDADE, AGLOMERADOS),
+    ])
+    aglomerado = rng.choice(AGLOMERADOS, n, p=_pesos_zipf(AGLOMERADOS, 0.8))
+    lat = rng.normal(centros[aglomerado, 0], ESPALHAMENTO_AGLOMERADO)
+    lon = rng.normal(centros[aglomerado, 1], ESPALHAMENTO_AGLOMERADO)
+
+    i_bairro = rng.choice(len(bairros), n, p=_pesos_zipf(len(bairros)))
+    i_rua = rng.choice(len(ruas), n, p=_pesos_zipf(len(ruas)))
+    i_tipo = rng.choice(len(TIPOS_PARADA), n, p=PROPORCAO_TIPOS)
+    i_sentido = rng.integers(len(SENTIDOS_PARADA), size=n)
+    i_ref = rng.integers(len(REFERENCIAS), size=n)
+    com_numero = rng.random(n) < PROPORCAO_COM_NUMERO
+    numero_local = rng.integers(1, 3000, size=n)
+    cep = rng.integers(0, 1_000_000, size=n)
+    # cadastros espalhados no passado: a sincronização delta não vê tudo como novo
+    idade = rng.integers(1, DIAS_HISTORICO * 86400, size=n)
+    hoje = datetime.now().replace(microsecond=0)
+
+    for k in range(n):
+        cadastro = hoje - timedelta(seconds=int(idade[k]))
+        yield {
+            "numero_parada": f"FSA{k:07d}" if com_numero[k] else None,
+            "rua": ruas[i_rua[k]],
+            "numero_localizacao": str(numero_local[k]),
+            "bairro": bairros[i_bairro[k]],
+            "cep": f"44{cep[k]:06d}",
+            "ponto_referencia": f"{REFERENCIAS[i_ref[k]]} {k % 97}",
+            "sentido": SENTIDOS_PARADA[i_sentido[k]],
+            "tipo": TIPOS_PARADA[i_tipo[k]],
+            "latitude": round(float(lat[k]), 8),
+            "longitude": round(float(lon[k]), 8),
+            "foto_url": None,
+            "data_cadastro": cadastro,
+            "atualizado_em": cadastro,
+        }
+
+def popular(engine, n, semente=SEMENTE, lote=LOTE_CARGA):
+    # inserção direta no core (como na importação), com os campos que os
+    # ganchos do ORM preencheriam; o resumo é reconstruído no fim
+    def gravar(linhas):
+        for linha in linhas:
+            linha["celula"] = calcular_celula(linha["latitude"], linha["longitude"])
+            linha["texto_busca"] = texto_busca_parada(linha["numero_parada"], linha["rua"], linha["bairro"])
+        with engine.begin() as conn:
+            conn.execute(insert(Parada.__table__), linhas)
+
+    pendentes = []
+    for linha in gerar_paradas(n, semente):
+        pendentes.append(linha)
+        if len(pendentes) >= lote:
+            gravar(pendentes)
+            pendentes = []
+    if pendentes:
+        gravar(pendentes)
+
+    with engine.begin() as conn:
+        reconstruir_resumo(conn)
+
+
+# ================== MEDIÇÃO ==================
+def medir(funcao, repeticoes=REPETICOES):
+    tempos = []
+    resultado = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return {
+        "min_ms": round(min(tempos), 3),
+        "mediana_ms": round(statistics.median(tempos), 3),
+        "max_ms": round(max(tempos), 3),
+        "repeticoes": repeticoes,
+    }, resultado
+
+def _html_mapa(df, viewport):
+    from mapa_paradas import montar_mapa_view, planejar_mapa_view
+
+    m, camada = montar_mapa_view(planejar_mapa_view(df, viewport))
+    camada.add_to(m)
+    return m.get_root().render()
+
+def executar(engine, repeticoes=REPETICOES):
+    Fabrica = sessionmaker(bind=engine)
+    resultados = {}
+
+    def registrar(nome, funcao, vezes=repeticoes):
+        resultados[nome], valor = medir(funcao, vezes)
+        return valor
+
+    with Fabrica() as session:
+        linhas = registrar("consulta_frame", lambda: session.execute(consulta_frame()).all())
+        registrar("montar_frame", lambda: montar_frame(linhas))
+        df = registrar("carga_completa", lambda: carregar_frame_paradas(session))
+
+        # mesma consulta por área do GET /paradas/bbox da API
+        sul, oeste = CENTRO[0] - 0.01, CENTRO[1] - 0.01
+        area = {"sul": [sul], "oeste": [oeste], "norte": [sul + 0.02], "leste": [oeste + 0.02]}
+        registrar("consulta_bbox", lambda: listar_bbox(session.connection(), area))
+
+        registrar("resumo_leitura", lambda: ler_resumo(session))
+        registrar("dashboard_groupby_frame", lambda: (
+            df["Bairro"].value_counts(), df["Rua"].value_counts(), df["Tipo"].value_counts()
+        ))
+
+        # seletor da aba de edição: primeira página e avanço por chave
+        def paginar(termo, paginas=5):
+            apos = None
+            for _ in range(paginas):
+                pagina, ha_mais = buscar_paradas(session, termo, apos_id=apos)
+                if not ha_mais:
+                    break
+                apos = pagina[-1].id
+        registrar("seletor_primeira_pagina", lambda: buscar_paradas(session, "getulio"))
+        registrar("seletor_5_paginas", lambda: paginar("rua"))
+
+    with engine.begin() as conn:
+        registrar("resumo_reconstrucao", lambda: reconstruir_resumo(conn), vezes=1)
+
+    cache = CacheParadas(Fabrica)
+    registrar("cache_carga_inicial", lambda: CacheParadas(Fabrica).sincronizar(forcar=True), vezes=1)
+    cache.sincronizar(forcar=True)
+    registrar("cache_delta_sem_mudancas", lambda: cache.sincronizar(forcar=True))
+
+    with tempfile.TemporaryDirectory() as pasta:
+        arquivo = os.path.join(pasta, "snapshot.arrow")
+        com_snapshot = CacheParadas(Fabrica, snapshot=arquivo)
+        com_snapshot.sincronizar(forcar=True)
+        com_snapshot.aguardar_snapshot()
+        if os.path.exists(arquivo):
+            registrar("cache_partida_snapshot", lambda: CacheParadas(Fabrica, snapshot=arquivo).sincronizar(forcar=True))
+        else:
+            resultados["cache_partida_snapshot"] = {"ignorado": "dependência ausente: pyarrow"}
+
+    indice = registrar("indice_espacial_construcao", lambda: IndiceEspacial.construir(df))
+    lat, lon = float(df["LAT"].iloc[0]), float(df["LON"].iloc[0])
+    registrar("indice_espacial_vizinhos", lambda: indice.vizinhos(lat, lon, RAIO_DUPLICATA))
+    registrar("indice_espacial_duplicatas", lambda: indice.grupos_duplicados(RAIO_DUPLICATA), vezes=1)
+
+    texto = registrar("indice_texto_construcao", lambda: IndiceTexto(df))
+    bairros = df["Bairro"].value_counts().index[:3].tolist()
+    registrar("filtro_bairro_rua", lambda: texto.filtrar(df, bairros, "getulio", None))
+    registrar("filtro_ponto", lambda: texto.filtrar(df, None, None, "em frente"))
+    registrar("filtro_regex_antigo", lambda: df[df["Rua"].str.contains("getúlio", case=False, na=False)])
+
+    registrar("analise_cobertura", lambda: analisar_cobertura(df), vezes=max(1, repeticoes // 2))
+
+    try:
+        viewport = ((sul, oeste, sul + 0.02, oeste + 0.02), 15)
+        registrar("mapa_html_completo", lambda: _html_mapa(df, None), vezes=1)
+        registrar("mapa_html_viewport", lambda: _html_mapa(df, viewport))
+    except ImportError as e:
+        resultados["mapa_html"] = {"ignorado": f"dependência ausente: {e.name}"}
+
+    return resultados
+
+
+# ================== RERUN DO APP ==================
+# Executa o main_paradas.py inteiro pelo AppTest do Streamlit contra o banco
+# populado: a primeira execução (carga dos caches) e reruns sem mudança em
+# cada seção, que é o custo pago a cada clique do usuário.
+def _rotulo_secao(opcao):
+    return re.sub(r"[^a-z0-9]+", "_", dobrar_acentos(opcao).lower()).strip("_")
+
+def medir_app(url, repeticoes=REPETICOES):
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    # caches de recurso são globais do processo: cada banco começa do zero
+    st.cache_resource.clear()
+    st.cache_data.clear()
+
+    resultados = {}
+    with tempfile.TemporaryDirectory() as pasta:
+        app = AppTest.from_file(
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "main_paradas.py"),
+            default_timeout=600
+        )
+        app.secrets["DATABASE_URL"] = url
+        app.secrets["PASTA_DADOS"] = pasta
+
+        resultados["app_primeira_execucao"], _ = medir(app.run, 1)
+        if app.exception:
+            raise RuntimeError(f"main_paradas.py falhou no AppTest: {app.exception[0].value}")
+
+        secao = app.radio(key="aba")
+        for opcao in secao.options:
+            secao.set_value(opcao)
+            app.run()
+            resultados[f"app_rerun_{_rotulo_secao(opcao)}"], _ = medir(app.run, repeticoes)
+            secao = app.radio(key="aba")
+    return resultados
+
+
+# ================== EXECUÇÃO ==================
+def _commit_atual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def preparar_banco(url, n, semente, limpar):
+    engine = criar_engine(url)
+    if limpar:
+        Base.metadata.drop_all(bind=engine)
+    migrar_esquema(engine)
+
+    with engine.connect() as conn:
+        existentes = conn.execute(select(func.count()).select_from(Parada.__table__)).scalar()
+    if existentes:
+        raise RuntimeError(f"O banco já tem {existentes} paradas; use --limpar ou outro --url.")
+
+    inicio = time.perf_counter()
+    popular(engine, n, semente)
+    return engine, round(time.perf_counter() - inicio, 2)
+
+def rodar(tamanhos, url=None, semente=SEMENTE, repeticoes=REPETICOES, limpar=False, app=False):
+    relatorio = {
+        "commit": _commit_atual(),
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "semente": semente,
+        "execucoes": [],
+    }
+
+    for n in tamanhos:
+        with tempfile.TemporaryDirectory() as pasta:
+            url_n = url or f"sqlite:///{os.path.join(pasta, f'bench_{n}.db')}"
+            engine, segundos_carga = preparar_banco(url_n, n, semente, limpar)
+            try:
+                resultados = executar(engine, repeticoes)
+                if app:
+                    try:
+                        resultados.update(medir_app(url_n, repeticoes))
+                    except ImportError as e:
+                        resultados["app"] = {"ignorado": f"dependência ausente: {e.name}"}
+                relatorio["execucoes"].append({
+                    "paradas": n,
+                    "banco": engine.dialect.name,
+                    "carga_segundos": segundos_carga,
+                    "resultados": resultados,
+                })
+            finally:
+                engine.dispose()
+
+    return relatorio
+
+def comparar(anterior, atual, tolerancia=0.2):
+    # razão entre medianas (atual / anterior) por tamanho e por medição
+    base = {e["paradas"]: e["resultados"] for e in anterior["execucoes"]}
+    linhas = []
+    for execucao in atual["execucoes"]:
+        antes = base.get(execucao["paradas"], {})
+        for nome, r in execucao["resultados"].items():
+            a = antes.get(nome, {}).get("mediana_ms")
+            d = r.get("mediana_ms")
+            if not a or d is None:
+                continue
+            razao = d / a
+            marca = "REGRESSÃO" if razao > 1 + tolerancia else ("melhora" if razao < 1 - tolerancia else "")
+            linhas.append((execucao["paradas"], nome, a, d, razao, marca))
+    return linhas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Mede os caminhos críticos do app com um inventário sintético de paradas."
+    )
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS_PADRAO)
+    parser.add_argument("--url", help="banco de teste (padrão: SQLite temporário por tamanho)")
+    parser.add_argument("--limpar", action="store_true", help="apaga as tabelas do --url antes de popular")
+    parser.add_argument("--semente", type=int, default=SEMENTE)
+    parser.add_argument("--repeticoes", type=int, default=REPETICOES)
+    parser.add_argument("--saida", default="benchmark_paradas.json")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior (outro commit)")
+    parser.add_argument("--app", action="store_true", help="mede também os reruns do app por seção (AppTest)")
+    args = parser.parse_args()
+
+    relatorio = rodar(args.tamanhos, args.url, args.semente, args.repeticoes, args.limpar, args.app)
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+
+    for execucao in relatorio["execucoes"]:
+        print(f"--- {execucao['paradas']} paradas ({execucao['banco']}) ---")
+        for nome, r in execucao["resultados"].items():
+            print(f"{nome:32s} {r.get('mediana_ms', r.get('ignorado'))}")
+    print(f"Resultados em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+        print(f"--- comparação com {anterior.get('commit')} ---")
+        for n, nome, a, d, razao, marca in comparar(anterior, relatorio):
+            print(f"{n:>8} {nome:32s} {a:10.3f} -> {d:10.3f} ms  x{razao:.2f} {marca}")
@@ -0,0 +1,727 @@
+import argparse
+import hashlib
+import logging
+import math
+import os
+import re
+import time
+import threading
+import unicodedata
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from sqlalchemy import (
+    Column, Integer, String, Numeric, Text, DateTime, Float,
+    create_engine, select, cast, event, inspect, text, func, bindparam
+)
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import column_property
+from sqlalchemy.dialects import postgresql, sqlite
+
+from collections import Counter
+from datetime import datetime, timedelta
+
+from indice_espacial import IndiceEspacial
+from instrumentacao import etapa
+from snapshot_paradas import gravar_snapshot, ler_snapshot
+
+log = logging.getLogger(__name__)
+
+
+# ================== FUNÇÕES AUXILIARES ==================
+def normalizar_texto(txt):
+    if not txt:
+        return ""
+    return txt.strip().title()
+
+def extrair_endereco(addr):
+    return {
+        "rua": addr.get("road")
+               or addr.get("street")
+               or addr.get("pedestrian")
+               or "",
+        "num": addr.get("house_number", ""),
+        "bairro": addr.get("suburb")
+                  or addr.get("neighbourhood")
+                  or addr.get("quarter")
+                  or "",
+        "cep": addr.get("postcode", "")
+    }
+
+def dobrar_acentos(txt):
+    # "São José" -> "sao jose": base das buscas sem acento nem caixa
+    if not txt:
+        return ""
+    decomposto = unicodedata.normalize("NFKD", str(txt))
+    return "".join(c for c in decomposto if not unicodedata.combining(c)).lower().strip()
+
+def palavras_busca(txt):
+    return re.findall(r"\w+", dobrar_acentos(txt))
+
+def texto_busca_parada(numero_parada, rua, bairro):
+    return " ".join(dobrar_acentos(v) for v in (numero_parada, rua, bairro) if v)[:500]
+
+# ================== CÉLULAS ESPACIAIS ==================
+# Grade fixa em graus (~550 m em Feira de Santana) usada como chave espacial
+TAMANHO_CELULA = 0.005
+MAX_CELULAS_CONSULTA = 400
+
+def calcular_celula(lat, lon):
+    if lat is None or lon is None:
+        return None
+    return f"{math.floor(float(lat) / TAMANHO_CELULA)}:{math.floor(float(lon) / TAMANHO_CELULA)}"
+
+def celulas_bbox(sul, oeste, norte, leste):
+    i0, i1 = math.floor(sul / TAMANHO_CELULA), math.floor(norte / TAMANHO_CELULA)
+    j0, j1 = math.floor(oeste / TAMANHO_CELULA), math.floor(leste / TAMANHO_CELULA)
+    if (i1 - i0 + 1) * (j1 - j0 + 1) > MAX_CELULAS_CONSULTA:
+        return None
+    return [f"{i}:{j}" for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)]
+
+# ================== CONEXÃO ==================
+# Pool por processo: conexões reaproveitadas entre execuções e recicladas
+# antes do timeout de ociosidade do servidor
+POOL_PADRAO = {
+    "pool_size": 5,
+    "max_overflow": 10,
+    "pool_recycle": 1800,
+    "pool_timeout": 30,
+}
+
+def criar_engine(url, **kwargs):
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/") == "sqlite:"):
+        # banco em memória usa um pool próprio, sem tamanho configurável
+        kwargs = {k: v for k, v in kwargs.items() if k not in POOL_PADRAO}
+    return create_engine(url, echo=False, future=True, pool_pre_ping=True, **kwargs)
+
+# ================== MODELO ==================
+TIPOS_PARADA = ["Placa", "Abrigo", "Abrigo + Placa", "Sem Identificação"]
+SENTIDOS_PARADA = ["PC1 - PC2", "PC2 - PC1"]
+
+Base = declarative_base()
+
+class Parada(Base):
+    __tablename__ = "paradas"
+    id = Column(Integer, primary_key=True)
+    numero_parada = Column(String(50), unique=True, nullable=True)
+    # active_history: o valor antigo é carregado antes da troca mesmo numa
+    # instância expirada, para o resumo descontar a chave anterior
+    rua = column_property(Column(String(255), nullable=False), active_history=True)
+    numero_localizacao = Column(String(20))
+    bairro = column_property(Column(String(100), nullable=False), active_history=True)
+    cep = Column(String(10))
+    ponto_referencia = Column(Text, nullable=False)
+    sentido = Column(String(20))
+    tipo = column_property(Column(String(50)), active_history=True)
+    latitude = Column(Numeric(10, 8))
+    longitude = Column(Numeric(11, 8))
+    foto_url = Column(Text)
+    data_cadastro = Column(DateTime, default=datetime.now)
+    atualizado_em = Column(DateTime, default=datetime.now, onupdate=datetime.now, index=True)
+    celula = Column(String(24), index=True)
+    texto_busca = Column(String(500), index=True)
+    # gerada na captura: reenviar o mesmo registro não cria outra parada
+    chave_idempotencia = Column(String(36), unique=True, index=True)
+
+@event.listens_for(Parada, "before_insert")
+@event.listens_for(Parada, "before_update")
+def preencher_derivados(mapper, connection, alvo):
+    alvo.celula = calcular_celula(alvo.latitude, alvo.longitude)
+    alvo.texto_busca = texto_busca_parada(alvo.numero_parada, alvo.rua, alvo.bairro)
+
+# Lápides: permitem que outros processos saibam o que foi excluído
+class ParadaExcluida(Base):
+    __tablename__ = "paradas_excluidas"
+    id = Column(Integer, primary_key=True)
+    parada_id = Column(Integer, nullable=False)
+    excluido_em = Column(DateTime, default=datetime.now, index=True)
+
+# Endereços já geocodificados, por célula de ~10 m
+class EnderecoCache(Base):
+    __tablename__ = "cache_geocodificacao"
+    chave = Column(String(32), primary_key=True)
+    endereco = Column(Text, nullable=False)
+    criado_em = Column(DateTime, default=datetime.now, index=True)
+
+@event.listens_for(Parada, "after_delete")
+def registrar_exclusao(mapper, connection, alvo):
+    connection.execute(
+        ParadaExcluida.__table__.insert().values(
+            parada_id=alvo.id,
+            excluido_em=datetime.now()
+        )
+    )
+
+# Lápides mais antigas que a retenção já foram vistas por todos os caches;
+# um cache parado por mais tempo que isso recarrega tudo (CacheParadas)
+RETENCAO_LAPIDES = timedelta(days=30)
+
+def podar_lapides(connection, retencao=RETENCAO_LAPIDES):
+    resultado = connection.execute(
+        ParadaExcluida.__table__.delete()
+        .where(ParadaExcluida.excluido_em < datetime.now() - retencao)
+    )
+    return resultado.rowcount
+
+# ================== RESUMO (DASHBOARD) ==================
+# Contagens por dimensão mantidas na mesma transação de cada gravação,
+# para o dashboard ler poucas linhas agregadas em vez do inventário inteiro.
+DIMENSOES_RESUMO = ("total", "bairro", "rua", "tipo")
+
+class ResumoParadas(Base):
+    __tablename__ = "resumo_paradas"
+    dimensao = Column(String(20), primary_key=True)
+    valor = Column(String(255), primary_key=True)
+    quantidade = Column(Integer, nullable=False, default=0)
+
+def chaves_resumo(rua, bairro, tipo):
+    return [
+        ("total", ""),
+        ("bairro", normalizar_texto(bairro)),
+        ("rua", normalizar_texto(rua)),
+        ("tipo", tipo or ""),
+    ]
+
+def ajustar_resumo(connection, deltas):
+    tabela = ResumoParadas.__table__
+    dialeto = {"postgresql": postgresql, "sqlite": sqlite}.get(connection.dialect.name)
+
+    for (dimensao, valor), delta in deltas.items():
+        if not delta:
+            continue
+        if dialeto is not None:
+            connection.execute(
+                dialeto.insert(tabela)
+                .values(dimensao=dimensao, valor=valor, quantidade=delta)
+                .on_conflict_do_update(
+                    index_elements=["dimensao", "valor"],
+                    set_={"quantidade": tabela.c.quantidade + delta}
+                )
+            )
+            continue
+        resultado = connection.execute(
+            tabela.update()
+            .where(tabela.c.dimensao == dimensao, tabela.c.valor == valor)
+            .values(quantidade=tabela.c.quantidade + delta)
+        )
+        if resultado.rowcount == 0:
+            connection.execute(tabela.insert().values(dimensao=dimensao, valor=valor, quantidade=delta))
+
+def _valor_anterior(alvo, campo):
+    historico = inspect(alvo).attrs[campo].history
+    if historico.deleted:
+        return historico.deleted[0]
+    return getattr(alvo, campo)
+
+@event.listens_for(Parada, "after_insert")
+def resumo_insercao(mapper, connection, alvo):
+    ajustar_resumo(connection, Counter(chaves_resumo(alvo.rua, alvo.bairro, alvo.tipo)))
+
+@event.listens_for(Parada, "after_update")
+def resumo_atualizacao(mapper, connection, alvo):
+    deltas = Counter(chaves_resumo(alvo.rua, alvo.bairro, alvo.tipo))
+    deltas.subtract(chaves_resumo(
+        _valor_anterior(alvo, "rua"),
+        _valor_anterior(alvo, "bairro"),
+        _valor_anterior(alvo, "tipo"),
+    ))
+    ajustar_resumo(connection, deltas)
+
+@event.listens_for(Parada, "after_delete")
+def resumo_exclusao(mapper, connection, alvo):
+    deltas = Counter()
+    deltas.subtract(chaves_resumo(alvo.rua, alvo.bairro, alvo.tipo))
+    ajustar_resumo(connection, deltas)
+
+def reconstruir_resumo(connection):
+    # GROUP BY nos valores brutos e normalização só dos grupos distintos
+    tabela = Parada.__table__
+    grupos = connection.execute(
+        select(tabela.c.rua, tabela.c.bairro, tabela.c.tipo, func.count())
+        .group_by(tabela.c.rua, tabela.c.bairro, tabela.c.tipo)
+    ).all()
+
+    deltas = Counter()
+    for rua, bairro, tipo, quantidade in grupos:
+        for chave in chaves_resumo(rua, bairro, tipo):
+            deltas[chave] += quantidade
+
+    connection.execute(ResumoParadas.__table__.delete())
+    ajustar_resumo(connection, deltas)
+
+def ler_resumo(session):
+    linhas = session.execute(
+        select(ResumoParadas.dimensao, ResumoParadas.valor, ResumoParadas.quantidade)
+        .where(ResumoParadas.quantidade > 0)
+    ).all()
+    return pd.DataFrame.from_records(linhas, columns=["Dimensao", "Valor", "Quantidade"])
+
+# ================== MIGRAÇÕES ==================
+# Colunas criadas depois da tabela original: (nome, tipo SQL, valor inicial)
+MIGRACOES_PARADAS = [
+    ("atualizado_em", "TIMESTAMP", "COALESCE(data_cadastro, CURRENT_TIMESTAMP)"),
+    ("celula", "VARCHAR(24)", None),
+    ("texto_busca", "VARCHAR(500)", None),
+    ("chave_idempotencia", "VARCHAR(36)", None),
+]
+
+def esquema_pendente(engine):
+    inspetor = inspect(engine)
+    tabelas = set(inspetor.get_table_names())
+    if any(t not in tabelas for t in Base.metadata.tables):
+        return True
+    existentes = {c["name"] for c in inspetor.get_columns(Parada.__tablename__)}
+    return any(nome not in existentes for nome, _, _ in MIGRACOES_PARADAS)
+
+def migrar_esquema(engine):
+    Base.metadata.create_all(bind=engine)
+
+    existentes = {c["name"] for c in inspect(engine).get_columns(Parada.__tablename__)}
+
+    with engine.begin() as conn:
+        for nome, tipo, inicial in MIGRACOES_PARADAS:
+            if nome in existentes:
+                continue
+            conn.execute(text(f"ALTER TABLE {Parada.__tablename__} ADD COLUMN {nome} {tipo}"))
+            if inicial:
+                conn.execute(text(f"UPDATE {Parada.__tablename__} SET {nome} = {inicial}"))
+
+        for indice in Parada.__table__.indexes:
+            indice.create(conn, checkfirst=True)
+
+        preencher_celulas_pendentes(conn)
+        preencher_busca_pendente(conn)
+
+        resumo_vazio = conn.execute(select(func.count()).select_from(ResumoParadas.__table__)).scalar() == 0
+        if resumo_vazio:
+            reconstruir_resumo(conn)
+
+    if engine.dialect.name == "postgresql":
+        criar_indice_trigrama(engine)
+
+def criar_indice_trigrama(engine):
+    # pg_trgm atende os dois LIKE da busca ('termo%' e '% termo%'). Sem ele
+    # nenhum índice serve: o B-tree de texto_busca não atende '% termo%' (e
+    # nem o prefixo, fora da collation C), e o OR das duas condições obriga a
+    # ler a tabela. O Postgres percorre então o índice do id em ordem
+    # decrescente filtrando linha a linha; termos comuns param no LIMIT,
+    # termos raros ou ausentes leem todas as paradas.
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_paradas_texto_busca_trgm "
+                f"ON {Parada.__tablename__} USING gin (texto_busca gin_trgm_ops)"
+            ))
+    except Exception as e:
+        log.warning(
+            "Índice trigrama não criado (%s); a busca por texto vai ler a tabela inteira "
+            "para termos raros. Um administrador pode rodar CREATE EXTENSION pg_trgm "
+            "e depois 'python dados_paradas.py migrar'.", e
+        )
+
+def preencher_celulas_pendentes(conn):
+    tabela = Parada.__table__
+    pendentes = conn.execute(
+        select(tabela.c.id, tabela.c.latitude, tabela.c.longitude)
+        .where(tabela.c.celula.is_(None), tabela.c.latitude.isnot(None))
+    ).all()
+
+    if pendentes:
+        conn.execute(
+            tabela.update()
+            .where(tabela.c.id == bindparam("b_id"))
+            .values(celula=bindparam("b_celula")),
+            [{"b_id": pid, "b_celula": calcular_celula(lat, lon)} for pid, lat, lon in pendentes]
+        )
+
+def preencher_busca_pendente(conn):
+    tabela = Parada.__table__
+    pendentes = conn.execute(
+        select(tabela.c.id, tabela.c.numero_parada, tabela.c.rua, tabela.c.bairro)
+        .where(tabela.c.texto_busca.is_(None))
+    ).all()
+
+    if pendentes:
+        conn.execute(
+            tabela.update()
+            .where(tabela.c.id == bindparam("b_id"))
+            .values(texto_busca=bindparam("b_texto")),
+            [
+                {"b_id": pid, "b_texto": texto_busca_parada(numero, rua, bairro)}
+                for pid, numero, rua, bairro in pendentes
+            ]
+        )
+
+# ================== CARGA TABULAR ==================
+# Apenas as colunas usadas pelas abas, já convertidas no banco
+# (sem hidratar objetos ORM nem Decimals por linha).
+CAMPOS_CONSULTA = [
+    "id", "numero_parada", "rua", "bairro", "ponto_referencia",
+    "tipo", "sentido", "latitude", "longitude", "data_cadastro", "atualizado_em"
+]
+
+COLUNAS_FRAME = [
+    "ID_DB", "ID", "Rua", "Bairro", "Ponto de Referência",
+    "Tipo", "Sentido", "LAT", "LON", "Data Cadastro", "Atualizado Em"
+]
+
+COLUNAS_CATEGORICAS = ["Rua", "Bairro", "Tipo", "Sentido"]
+
+# unidade fixa: o frame vazio e o carregado do banco precisam ter o mesmo tipo
+TIPO_DATA = "datetime64[ns]"
+
+def consulta_frame():
+    return select(
+        Parada.id,
+        Parada.numero_parada,
+        Parada.rua,
+        Parada.bairro,
+        Parada.ponto_referencia,
+        Parada.tipo,
+        Parada.sentido,
+        cast(Parada.latitude, Float),
+        cast(Parada.longitude, Float),
+        Parada.data_cadastro,
+        Parada.atualizado_em
+    )
+
+def normalizar_serie(serie):
+    # normaliza cada valor distinto uma única vez
+    mapa = {v: normalizar_texto(v) for v in serie.dropna().unique()}
+    return serie.map(mapa).fillna("").astype(object).astype("category")
+
+def montar_frame(linhas):
+    bruto = pd.DataFrame.from_records(linhas, columns=CAMPOS_CONSULTA)
+
+    df = pd.DataFrame({
+        "ID_DB": bruto["id"].astype("int64"),
+        "ID": bruto["numero_parada"].fillna("Sem identificação").astype(object),
+        "Rua": normalizar_serie(bruto["rua"]),
+        "Bairro": normalizar_serie(bruto["bairro"]),
+        "Ponto de Referência": bruto["ponto_referencia"].fillna("").astype(object),
+        "Tipo": bruto["tipo"].astype(object).astype("category"),
+        "Sentido": bruto["sentido"].astype(object).astype("category"),
+        "LAT": bruto["latitude"].astype("float64"),
+        "LON": bruto["longitude"].astype("float64"),
+        "Data Cadastro": pd.to_datetime(bruto["data_cadastro"]).astype(TIPO_DATA),
+        "Atualizado Em": pd.to_datetime(bruto["atualizado_em"]).astype(TIPO_DATA)
+    }, columns=COLUNAS_FRAME)
+
+    return df.reset_index(drop=True)
+
+def carregar_frame_paradas(session):
+    consulta = consulta_frame().order_by(Parada.data_cadastro.desc())
+    with etapa("banco.carga_completa"):
+        linhas = session.execute(consulta).all()
+    with etapa("frame.montar"):
+        return montar_frame(linhas)
+
+# ---------- consultas por área (usam o índice de célula) ----------
+def filtro_bbox(sul, oeste, norte, leste):
+    condicoes = [
+        Parada.latitude.between(sul, norte),
+        Parada.longitude.between(oeste, leste),
+    ]
+    celulas = celulas_bbox(sul, oeste, norte, leste)
+    if celulas is not None:
+        condicoes.append(Parada.celula.in_(celulas))
+    return condicoes
+
+# ---------- busca paginada (aba de edição) ----------
+TAMANHO_PAGINA_BUSCA = 20
+
+def _escapar_like(termo):
+    return termo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def filtro_palavra(palavra):
+    # a palavra (sem acento, minúscula) inicia alguma palavra de número/rua/bairro
+    palavra = _escapar_like(palavra)
+    return (
+        Parada.texto_busca.like(f"{palavra}%", escape="\\")
+        | Parada.texto_busca.like(f"% {palavra}%", escape="\\")
+    )
+
+def filtro_trecho(trecho):
+    # o trecho aparece em qualquer ponto de número/rua/bairro
+    return Parada.texto_busca.like(f"%{_escapar_like(dobrar_acentos(trecho))}%", escape="\\")
+
+def buscar_paradas(session, termo, apos_id=None, limite=TAMANHO_PAGINA_BUSCA):
+    # cada palavra do termo precisa iniciar alguma palavra de número/rua/bairro;
+    # paginação por chave (id decrescente) em vez de OFFSET
+    consulta = select(Parada.id, Parada.numero_parada, Parada.rua, Parada.bairro)
+
+    for palavra in dobrar_acentos(termo).split():
+        consulta = consulta.where(filtro_palavra(palavra))
+
+    if apos_id is not None:
+        consulta = consulta.where(Parada.id < apos_id)
+
+    linhas = session.execute(consulta.order_by(Parada.id.desc()).limit(limite + 1)).all()
+    return linhas[:limite], len(linhas) > limite
+
+def linha_parada(p):
+    return (
+        p.id, p.numero_parada, p.rua, p.bairro, p.ponto_referencia,
+        p.tipo, p.sentido,
+        float(p.latitude) if p.latitude is not None else None,
+        float(p.longitude) if p.longitude is not None else None,
+        p.data_cadastro, p.atualizado_em
+    )
+
+def concatenar_frames(frames):
+    # frames vazios têm categorias sem tipo definido e não entram na união
+    frames = [f for f in frames if not f.empty] or frames[:1]
+    df = pd.concat(frames, ignore_index=True)
+    for c in COLUNAS_CATEGORICAS:
+        df[c] = union_categoricals(
+            [f[c].values for f in frames],
+            ignore_order=True
+        ).remove_unused_categories()
+    return df
+
+# ================== CACHE VERSIONADO ==================
+# Uma cópia do inventário por processo. Depois da carga inicial, cada
+# sincronização busca apenas linhas alteradas/excluídas desde a última marca.
+# A marca é o maior atualizado_em/excluido_em já visto no banco (o relógio
+# de quem gravou), nunca o relógio deste servidor; a margem cobre gravações
+# com carimbo um pouco anterior que ficaram visíveis depois (commit lento,
+# relógios de servidores diferentes).
+INTERVALO_SYNC = 5
+MARGEM_SYNC = timedelta(seconds=10)
+MARCA_INICIAL = datetime(2000, 1, 1)         # banco vazio: a próxima sincronização já é por delta
+INTERVALO_SNAPSHOT = timedelta(minutes=10)   # avanço da marca que justifica regravar o snapshot
+
+class CacheParadas:
+    def __init__(self, fabrica_sessao, intervalo=INTERVALO_SYNC, snapshot=None):
+        self.fabrica_sessao = fabrica_sessao
+        self.intervalo = intervalo
+        self.snapshot = snapshot
+        self.marca_snapshot = None
+        self._gravacao = None
+        self.frame = montar_frame([])
+        self.indice = IndiceEspacial()
+        self.versao = 0
+        self.marca = None
+        self.ultima_sync = 0.0
+        self._lock = threading.RLock()
+
+    def sincronizar(self, forcar=False):
+        with self._lock:
+            if not forcar and time.monotonic() - self.ultima_sync < self.intervalo:
+                return self.frame
+
+            # parado por mais tempo que a retenção, pode ter perdido lápides podadas
+            if time.monotonic() - self.ultima_sync > RETENCAO_LAPIDES.total_seconds():
+                self.marca = None
+
+            with self.fabrica_sessao() as session:
+                if self.marca is None:
+                    self._carga_completa(session)
+                else:
+                    self._carga_delta(session)
+                    self._talvez_gravar_snapshot(session)
+
+            self.ultima_sync = time.monotonic()
+            return self.frame
+
+    def instantaneo(self):
+        # frame e versão lidos juntos, para caches derivados por versão
+        with self._lock:
+            return self.frame, self.versao
+
+    def _carga_completa(self, session):
+        if self.snapshot and self._carga_snapshot(session):
+            return
+
+        excluida = session.execute(select(func.max(ParadaExcluida.excluido_em))).scalar()
+        frame = carregar_frame_paradas(session)
+        self.indice = IndiceEspacial.construir(frame)
+        self._publicar(frame)
+        self.marca = None
+        self._avancar_marca(frame["Atualizado Em"].max(), excluida)
+        if self.marca is None:
+            self.marca = MARCA_INICIAL
+        self._gravar_snapshot(session)
+
+    # ---------- snapshot em disco (partida a frio) ----------
+    # O frame vem do arquivo mapeado e só as linhas alteradas/excluídas desde
+    # a marca dele vêm do banco. Sem pyarrow, com arquivo de outro banco,
+    # gravado há mais que a retenção das lápides (exclusões podem ter sido
+    # podadas) ou com contagem divergente (exclusões fora do ORM), cai na
+    # carga completa. A gravação roda numa thread, fora do lock do cache.
+    # As páginas mapeadas só são compartilhadas até a primeira alteração
+    # aplicada (_aplicar monta um frame novo, em memória do processo).
+    def _origem(self, session):
+        url = session.get_bind().url.render_as_string(hide_password=True)
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+
+    def _carga_snapshot(self, session):
+        try:
+            with etapa("snapshot.ler"):
+                lido = ler_snapshot(self.snapshot, self._origem(session), montar_frame([]).dtypes)
+        except Exception as e:
+            log.warning("Snapshot %s ignorado: %s", self.snapshot, e)
+            if isinstance(e, RuntimeError):
+                self.snapshot = None
+            return False
+        if lido is None:
+            return False
+
+        frame, marca, gravado_em = lido
+        if datetime.now() - gravado_em > RETENCAO_LAPIDES:
+            log.warning("Snapshot %s gravado em %s, antes da retenção das lápides; recarregando",
+                        self.snapshot, gravado_em)
+            return False
+
+        self.indice = IndiceEspacial.construir(frame)
+        self._publicar(frame, ordenar=False)
+        self.marca = self.marca_snapshot = marca
+        self._carga_delta(session)
+
+        total = session.execute(select(func.count(Parada.id))).scalar()
+        if total != len(self.frame):
+            log.warning("Snapshot com %d paradas e banco com %d; recarregando", len(self.frame), total)
+            self.marca = self.marca_snapshot = None
+            return False
+        return True
+
+    def _gravar_snapshot(self, session):
+        if not self.snapshot or self.marca is None:
+            return
+        if self._gravacao is not None and self._gravacao.is_alive():
+            return
+        # o frame publicado nunca é alterado, então a thread pode gravá-lo
+        # enquanto as sessões seguem sincronizando; em caso de falha, nova
+        # tentativa só depois de outro INTERVALO_SNAPSHOT de mudanças
+        self.marca_snapshot = self.marca
+        self._gravacao = threading.Thread(
+            target=self._gravar_em_segundo_plano,
+            args=(self.snapshot, self.frame, self.marca, self._origem(session)),
+            name="snapshot-paradas",
+            daemon=True
+        )
+        self._gravacao.start()
+
+    def _gravar_em_segundo_plano(self, caminho, frame, marca, origem):
+        try:
+            with etapa("snapshot.gravar"):
+                gravar_snapshot(caminho, frame, marca, origem)
+        except Exception as e:
+            log.warning("Não foi possível gravar o snapshot %s: %s", caminho, e)
+            if isinstance(e, RuntimeError):
+                self.snapshot = None
+
+    def aguardar_snapshot(self, timeout=None):
+        gravacao = self._gravacao
+        if gravacao is not None:
+            gravacao.join(timeout)
+
+    def _talvez_gravar_snapshot(self, session):
+        if self.marca_snapshot is None or self.marca - self.marca_snapshot >= INTERVALO_SNAPSHOT:
+            self._gravar_snapshot(session)
+
+    def _carga_delta(self, session):
+        desde = self.marca - MARGEM_SYNC
+
+        with etapa("banco.delta"):
+            alteradas = session.execute(
+                consulta_frame().where(Parada.atualizado_em >= desde)
+            ).all()
+            excluidas = session.execute(
+                select(ParadaExcluida.parada_id, ParadaExcluida.excluido_em)
+                .where(ParadaExcluida.excluido_em >= desde)
+            ).all()
+
+        with etapa("frame.delta"):
+            self._aplicar(alteradas, excluidas)
+
+    def _aplicar(self, linhas, excluidas=(), avancar=True):
+        novos = montar_frame(linhas)
+        excluidos = {pid: quando for pid, quando in excluidas}
+
+        if excluidos:
+            # uma lápide mais recente que a alteração vence
+            vivos = [
+                pid not in excluidos
+                or (excluidos[pid] is not None and quando > excluidos[pid])
+                for pid, quando in zip(novos["ID_DB"], novos["Atualizado Em"])
+            ]
+            novos = novos[vivos]
+
+        atual = self.frame
+        if not novos.empty:
+            # reindex (e não map) funciona também com o cache ainda vazio
+            conhecidos = atual.set_index("ID_DB")["Atualizado Em"]
+            anteriores = conhecidos.reindex(novos["ID_DB"].to_numpy()).to_numpy()
+            novos = novos[pd.isna(anteriores) | (novos["Atualizado Em"].to_numpy() != anteriores)]
+
+        remover = set(novos["ID_DB"]) | (set(excluidos) & set(atual["ID_DB"]))
+
+        if avancar:
+            marcas = [novos["Atualizado Em"].max()] + [q for q in excluidos.values() if q is not None]
+            self._avancar_marca(*marcas)
+
+        if not remover:
+            return
+
+        for pid in remover:
+            self.indice.remover(int(pid))
+        self.indice.adicionar_frame(novos)
+
+        base = atual[~atual["ID_DB"].isin(remover)]
+        frame = concatenar_frames([base, novos])
+        self._publicar(frame)
+
+    def _publicar(self, frame, ordenar=True):
+        # o frame publicado nunca é alterado no lugar: cada mudança gera uma nova versão
+        # (o do snapshot já vem ordenado, e reordenar copiaria as colunas mapeadas)
+        if ordenar:
+            frame = frame.sort_values("Data Cadastro", ascending=False, kind="stable")
+        self.frame = frame.reset_index(drop=True)
+        self.versao += 1
+
+    def _avancar_marca(self, *marcas):
+        validas = [m for m in marcas if m is not None and not pd.isna(m)]
+        if not validas:
+            return
+        maior = max(pd.Timestamp(m).to_pydatetime() for m in validas)
+        if self.marca is None or maior > self.marca:
+            self.marca = maior
+
+    # ---------- atualizações locais após gravações deste processo ----------
+    # não avançam a marca: gravações de outros processos anteriores a esta
+    # ainda precisam ser vistas pela próxima sincronização
+    def aplicar_gravacao(self, parada):
+        with self._lock:
+            self._aplicar([linha_parada(parada)], avancar=False)
+
+    def aplicar_exclusao(self, parada_id):
+        with self._lock:
+            self._aplicar([], [(parada_id, None)], avancar=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tarefas de manutenção do banco de paradas.")
+    parser.add_argument("comando", choices=["migrar", "reconstruir-resumo", "podar-lapides"])
+    parser.add_argument(
+        "--dias", type=int, default=RETENCAO_LAPIDES.days,
+        help="podar-lapides: retenção das lápides de exclusão, em dias"
+    )
+    args = parser.parse_args()
+
+    engine = criar_engine(os.environ["DATABASE_URL"])
+    if args.comando == "migrar":
+        migrar_esquema(engine)
+        print("Esquema atualizado.")
+    elif args.comando == "podar-lapides":
+        with engine.begin() as conn:
+            removidas = podar_lapides(conn, timedelta(days=args.dias))
+        print(f"{removidas} lápides removidas.")
+    else:
+        with engine.begin() as conn:
+            reconstruir_resumo(conn)
+        print("Resumo reconstruído.")
@@ -0,0 +1,197 @@
+import argparse
+import csv
+import io
+import json
+import os
+
+from datetime import datetime
+
+from sqlalchemy import select, cast, or_, Float
+
+from dados_paradas import (
+    Parada,
+    criar_engine,
+    dobrar_acentos,
+    filtro_trecho,
+    normalizar_texto,
+)
+
+
+# ================== CONFIG ==================
+TAMANHO_LOTE = 2000
+FORMATOS = ("csv", "geojson", "parquet")
+
+COLUNAS_EXPORTACAO = [
+    "id", "numero_parada", "rua", "numero_localizacao", "bairro", "cep",
+    "ponto_referencia", "sentido", "tipo", "latitude", "longitude",
+    "foto_url", "data_cadastro",
+]
+
+TIPOS_MIME = {
+    "csv": "text/csv",
+    "geojson": "application/geo+json",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+# ================== LEITURA EM LOTES ==================
+def filtro_linhas(bairros=None, rua=None, ponto=None):
+    # mesmas regras dos filtros da aba de visualização (IndiceTexto): o
+    # trecho, sem acento nem caixa, aparece em qualquer ponto do texto
+    bairros = set(bairros or ())
+    rua = dobrar_acentos(rua)
+    ponto = dobrar_acentos(ponto)
+
+    def aceita(linha):
+        if bairros and normalizar_texto(linha.bairro) not in bairros:
+            return False
+        if rua and rua not in dobrar_acentos(linha.rua):
+            return False
+        if ponto and ponto not in dobrar_acentos(linha.ponto_referencia):
+            return False
+        return True
+
+    return aceita
+
+def condicoes_banco(bairros=None, rua=None):
+    # pré-filtro no banco pelo texto_busca (número, rua e bairro sem acento):
+    # só chegam ao Python as linhas que podem passar; a regra exata continua
+    # em filtro_linhas, já que o trecho da rua também pode casar com o
+    # bairro ou o número. O ponto de referência não está no texto_busca.
+    condicoes = []
+    if bairros:
+        condicoes.append(or_(*[filtro_trecho(b) for b in bairros]))
+    if dobrar_acentos(rua):
+        condicoes.append(filtro_trecho(rua))
+    return condicoes
+
+def consulta_exportacao():
+    return select(
+        Parada.id,
+        Parada.numero_parada,
+        Parada.rua,
+        Parada.numero_localizacao,
+        Parada.bairro,
+        Parada.cep,
+        Parada.ponto_referencia,
+        Parada.sentido,
+        Parada.tipo,
+        cast(Parada.latitude, Float).label("latitude"),
+        cast(Parada.longitude, Float).label("longitude"),
+        Parada.foto_url,
+        Parada.data_cadastro,
+    )
+
+def iterar_lotes(conn, bairros=None, rua=None, lote=TAMANHO_LOTE, ponto=None):
+    consulta = consulta_exportacao().where(*condicoes_banco(bairros, rua)).order_by(Parada.id)
+
+    # cursor no servidor: só um lote de linhas fica em memória por vez
+    resultado = conn.execution_options(yield_per=lote).execute(consulta)
+    aceita = filtro_linhas(bairros, rua, ponto)
+
+    for parte in resultado.partitions():
+        linhas = [l for l in parte if aceita(l)]
+        if linhas:
+            yield linhas
+
+
+# ================== ESCRITORES ==================
+def _valor(v):
+    return v.isoformat() if isinstance(v, datetime) else v
+
+def feature_geojson(linha):
+    return {
+        "type": "Feature",
+        "id": linha.id,
+        "geometry": {"type": "Point", "coordinates": [linha.longitude, linha.latitude]},
+        "properties": {c: _valor(v) for c, v in zip(COLUNAS_EXPORTACAO, linha)},
+    }
+
+def escrever_csv(lotes, destino):
+    texto = io.TextIOWrapper(destino, encoding="utf-8", newline="")
+    escritor = csv.writer(texto)
+    escritor.writerow(COLUNAS_EXPORTACAO)
+    total = 0
+    for linhas in lotes:
+        escritor.writerows([[_valor(v) for v in l] for l in linhas])
+        total += len(linhas)
+    texto.flush()
+    texto.detach()
+    return total
+
+def escrever_geojson(lotes, destino):
+    texto = io.TextIOWrapper(destino, encoding="utf-8")
+    texto.write('{"type": "FeatureCollection", "features": [\n')
+    total = 0
+    for linhas in lotes:
+        for l in linhas:
+            feature = feature_geojson(l)
+            texto.write(("" if total == 0 else ",\n") + json.dumps(feature, ensure_ascii=False))
+            total += 1
+    texto.write("\n]}\n")
+    texto.flush()
+    texto.detach()
+    return total
+
+def escrever_parquet(lotes, destino):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Exportação em Parquet requer o pacote pyarrow.")
+
+    esquema = pa.schema([
+        ("id", pa.int64()),
+        ("numero_parada", pa.string()),
+        ("rua", pa.string()),
+        ("numero_localizacao", pa.string()),
+        ("bairro", pa.string()),
+        ("cep", pa.string()),
+        ("ponto_referencia", pa.string()),
+        ("sentido", pa.string()),
+        ("tipo", pa.string()),
+        ("latitude", pa.float64()),
+        ("longitude", pa.float64()),
+        ("foto_url", pa.string()),
+        ("data_cadastro", pa.timestamp("us")),
+    ])
+
+    total = 0
+    with pq.ParquetWriter(destino, esquema) as escritor:
+        for linhas in lotes:
+            colunas = list(zip(*linhas))
+            escritor.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=campo.type) for col, campo in zip(colunas, esquema)],
+                schema=esquema
+            ))
+            total += len(linhas)
+    return total
+
+ESCRITORES = {
+    "csv": escrever_csv,
+    "geojson": escrever_geojson,
+    "parquet": escrever_parquet,
+}
+
+def exportar(conn, destino, formato, bairros=None, rua=None, lote=TAMANHO_LOTE, ponto=None):
+    return ESCRITORES[formato](iterar_lotes(conn, bairros, rua, lote, ponto), destino)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta o inventário de paradas em CSV, GeoJSON ou Parquet.")
+    parser.add_argument("saida", help="arquivo de destino")
+    parser.add_argument("--formato", choices=FORMATOS, help="padrão: deduzido pela extensão")
+    parser.add_argument("--bairro", action="append", help="pode ser repetido")
+    parser.add_argument("--rua", help="trecho do nome da rua (sem diferenciar acento)")
+    parser.add_argument("--ponto", help="trecho do ponto de referência")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE)
+    args = parser.parse_args()
+
+    formato = args.formato or os.path.splitext(args.saida)[1].lstrip(".").lower()
+    if formato not in FORMATOS:
+        parser.error(f"formato não reconhecido: {formato}")
+
+    engine = criar_engine(os.environ["DATABASE_URL"])
+    with engine.connect() as conn, open(args.saida, "wb") as destino:
+        total = exportar(conn, destino, formato, args.bairro, args.rua, args.lote, args.ponto)
+    print(f"{total} paradas exportadas para {args.saida}")
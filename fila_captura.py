@@ -0,0 +1,342 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from contextlib import contextmanager
+from uuid import uuid4
+
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+
+from dados_paradas import Parada
+
+log = logging.getLogger(__name__)
+
+
+# ================== CONFIG ==================
+TAMANHO_LOTE_FILA = 50
+INTERVALO_FILA = 2.0               # segundos entre descargas sem aviso novo
+ESPERA_MAXIMA_FILA = 60.0          # teto do recuo quando o banco está fora
+CAMPOS_CAPTURA = [
+    "numero_parada", "rua", "numero_localizacao", "bairro", "cep",
+    "ponto_referencia", "sentido", "tipo", "latitude", "longitude",
+]
+# tamanho máximo dos campos de texto, tirado das colunas da tabela
+LIMITES_CAPTURA = {
+    c: Parada.__table__.c[c].type.length
+    for c in CAMPOS_CAPTURA
+    if getattr(Parada.__table__.c[c].type, "length", None)
+}
+
+ESQUEMA_DIARIO = """
+CREATE TABLE IF NOT EXISTS capturas (
+    chave TEXT PRIMARY KEY,
+    registro TEXT NOT NULL,
+    foto BLOB,
+    foto_nome TEXT,
+    foto_tipo TEXT,
+    estado TEXT NOT NULL DEFAULT 'pendente',
+    foto_estado TEXT,
+    parada_id INTEGER,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    erro TEXT,
+    criado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_capturas_estado ON capturas (estado, criado_em);
+"""
+
+
+class CapturaInvalida(Exception):
+    pass
+
+def validar_captura(dados):
+    # o que não cabe na coluna seria recusado pelo banco só na descarga,
+    # depois de o cadastro já ter sido confirmado na tela
+    for campo, limite in LIMITES_CAPTURA.items():
+        valor = dados.get(campo)
+        if valor is not None and len(str(valor)) > limite:
+            raise CapturaInvalida(f"{campo} com mais de {limite} caracteres")
+
+def _falha_do_banco(erro):
+    # banco fora ou conexão perdida: o lote inteiro espera e tenta de novo;
+    # os demais erros (valor duplicado, longo demais...) são do registro
+    return erro.connection_invalidated or isinstance(erro, (OperationalError, InterfaceError))
+
+
+# ================== FILA COM DIÁRIO LOCAL ==================
+# Cada cadastro é gravado primeiro num diário SQLite local (com a foto) e a
+# tela volta na hora. Uma thread descarrega o diário no banco principal em
+# lotes; a chave de idempotência de cada captura vai para a parada, então
+# repetir um lote depois de uma falha nunca duplica paradas.
+#
+# Estados: pendente -> gravada (parada no banco) ou erro (registro recusado).
+# Foto: aguardando -> enviando -> enviada ou erro; erro -> enviando
+# (reenvio) ou descartada.
+class FilaCaptura:
+    def __init__(self, caminho, fabrica_sessao, envios_fotos=None, ao_gravar=None,
+                 intervalo=INTERVALO_FILA, tamanho_lote=TAMANHO_LOTE_FILA):
+        self.caminho = caminho
+        self.fabrica_sessao = fabrica_sessao
+        self.envios_fotos = envios_fotos
+        self.ao_gravar = ao_gravar
+        self.intervalo = intervalo
+        self.tamanho_lote = tamanho_lote
+        self._aviso = threading.Event()
+        self._parar = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+        pasta = os.path.dirname(os.path.abspath(caminho))
+        os.makedirs(pasta, exist_ok=True)
+        with self._conectar() as conn:
+            conn.executescript(ESQUEMA_DIARIO)
+
+    @contextmanager
+    def _conectar(self):
+        # uma conexão curta por operação, com commit ao sair do bloco
+        conn = sqlite3.connect(self.caminho, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # ---------- entrada ----------
+    def enfileirar(self, registro, foto=None, foto_nome=None, foto_tipo=None, chave=None):
+        chave = chave or uuid4().hex
+        dados = {c: registro.get(c) for c in CAMPOS_CAPTURA}
+        validar_captura(dados)
+        with self._lock, self._conectar() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO capturas "
+                "(chave, registro, foto, foto_nome, foto_tipo, foto_estado, criado_em) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    chave, json.dumps(dados, ensure_ascii=False),
+                    foto, foto_nome, foto_tipo,
+                    "aguardando" if foto else None,
+                    time.time(),
+                )
+            )
+        self._aviso.set()
+        return chave
+
+    # ---------- consulta ----------
+    def situacao(self, chave):
+        with self._conectar() as conn:
+            linha = conn.execute(
+                "SELECT estado, parada_id, foto_estado, erro FROM capturas WHERE chave = ?",
+                (chave,)
+            ).fetchone()
+        if linha is None:
+            return None
+        return dict(zip(("estado", "parada_id", "foto_estado", "erro"), linha))
+
+    def contagens(self):
+        # estados dos registros e, com prefixo foto_, das fotos
+        with self._conectar() as conn:
+            contagens = dict(conn.execute("SELECT estado, COUNT(*) FROM capturas GROUP BY estado").fetchall())
+            contagens.update(conn.execute(
+                "SELECT 'foto_' || foto_estado, COUNT(*) FROM capturas "
+                "WHERE foto_estado IS NOT NULL GROUP BY foto_estado"
+            ).fetchall())
+        return contagens
+
+    # ---------- erros ----------
+    # Registros recusados e fotos que falharam ficam no diário (com a foto)
+    # até alguém decidir: reenviar as fotos ou descartar os dois.
+    def reenviar_fotos_com_erro(self):
+        # só as fotos com erro: as que estão em envio neste processo não
+        # podem ser mandadas de novo
+        if self.envios_fotos is None:
+            return 0
+        with self._conectar() as conn:
+            fotos = conn.execute(
+                "SELECT chave, parada_id, foto, foto_nome, foto_tipo FROM capturas "
+                "WHERE estado = 'gravada' AND foto_estado = 'erro' AND foto IS NOT NULL"
+            ).fetchall()
+
+        total = 0
+        for chave, parada_id, foto, nome, tipo in fotos:
+            # quem troca erro -> enviando envia; dois cliques seguidos não
+            # mandam a mesma foto duas vezes
+            with self._lock, self._conectar() as conn:
+                reservada = conn.execute(
+                    "UPDATE capturas SET foto_estado = 'enviando' "
+                    "WHERE chave = ? AND foto_estado = 'erro'",
+                    (chave,)
+                ).rowcount
+            if reservada:
+                self._enviar_foto(chave, parada_id, foto, nome, tipo)
+                total += 1
+        return total
+
+    def descartar_erros(self, idade=0):
+        # idade em segundos: só descarta o que está com erro há mais tempo
+        limite = time.time() - idade
+        with self._lock, self._conectar() as conn:
+            registros = conn.execute(
+                "DELETE FROM capturas WHERE estado = 'erro' AND criado_em <= ?", (limite,)
+            ).rowcount
+            fotos = conn.execute(
+                "UPDATE capturas SET foto = NULL, foto_estado = 'descartada' "
+                "WHERE foto_estado = 'erro' AND criado_em <= ?", (limite,)
+            ).rowcount
+        return registros, fotos
+
+    # ---------- descarga ----------
+    def iniciar(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._laco, name="fila-captura", daemon=True)
+            self._thread.start()
+        return self
+
+    def parar(self, timeout=None):
+        self._parar.set()
+        self._aviso.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _laco(self):
+        # fotos de paradas já gravadas que não chegaram a ser enviadas
+        # (processo reiniciado no meio) voltam para a fila de envio
+        self._reenviar_fotos()
+
+        espera = self.intervalo
+        while not self._parar.is_set():
+            self._aviso.wait(espera)
+            self._aviso.clear()
+            try:
+                while self.descarregar():
+                    pass
+                espera = self.intervalo
+            except Exception as e:
+                espera = min(espera * 2, ESPERA_MAXIMA_FILA)
+                log.warning("Descarga da fila falhou (%s); nova tentativa em %.0fs", e, espera)
+
+    def descarregar(self):
+        with self._conectar() as conn:
+            pendentes = conn.execute(
+                "SELECT chave, registro FROM capturas WHERE estado = 'pendente' "
+                "ORDER BY criado_em LIMIT ?",
+                (self.tamanho_lote,)
+            ).fetchall()
+        if not pendentes:
+            return 0
+
+        registros = {chave: json.loads(registro) for chave, registro in pendentes}
+        try:
+            gravadas, recusadas = self._gravar_lote(registros), {}
+        except DBAPIError as e:
+            if _falha_do_banco(e):
+                raise
+            # uma linha ruim (ex.: número de parada repetido ou longo demais)
+            # não derruba o lote
+            gravadas, recusadas = self._gravar_um_a_um(registros)
+
+        with self._lock, self._conectar() as conn:
+            conn.executemany(
+                "UPDATE capturas SET estado = 'gravada', parada_id = ?, erro = NULL WHERE chave = ?",
+                [(parada.id, chave) for chave, parada in gravadas.items()]
+            )
+            conn.executemany(
+                "UPDATE capturas SET estado = 'erro', erro = ?, tentativas = tentativas + 1 WHERE chave = ?",
+                [(erro, chave) for chave, erro in recusadas.items()]
+            )
+
+        if self.ao_gravar is not None:
+            for parada in gravadas.values():
+                self.ao_gravar(parada)
+        self._enviar_fotos(gravadas)
+        return len(pendentes)
+
+    def _existentes(self, session, chaves):
+        return {
+            p.chave_idempotencia: p
+            for p in session.execute(
+                select(Parada).where(Parada.chave_idempotencia.in_(list(chaves)))
+            ).scalars()
+        }
+
+    def _nova_parada(self, chave, dados):
+        return Parada(chave_idempotencia=chave, **{
+            c: dados[c] if dados[c] != "" else None
+            for c in CAMPOS_CAPTURA
+        })
+
+    def _gravar_lote(self, registros):
+        # uma transação por lote; chaves já presentes no banco (lote repetido
+        # depois de uma queda) são reaproveitadas em vez de reinseridas
+        with self.fabrica_sessao(expire_on_commit=False) as session:
+            gravadas = self._existentes(session, registros)
+            novas = {
+                chave: self._nova_parada(chave, dados)
+                for chave, dados in registros.items() if chave not in gravadas
+            }
+            session.add_all(novas.values())
+            session.commit()
+            gravadas.update(novas)
+            return gravadas
+
+    def _gravar_um_a_um(self, registros):
+        gravadas, recusadas = {}, {}
+        for chave, dados in registros.items():
+            try:
+                gravadas.update(self._gravar_lote({chave: dados}))
+            except DBAPIError as e:
+                if _falha_do_banco(e):
+                    raise
+                recusadas[chave] = str(e.orig)
+        return gravadas, recusadas
+
+    # ---------- fotos ----------
+    def _enviar_fotos(self, gravadas):
+        if self.envios_fotos is None or not gravadas:
+            return
+        chaves = list(gravadas)
+        with self._conectar() as conn:
+            fotos = conn.execute(
+                f"SELECT chave, foto, foto_nome, foto_tipo FROM capturas "
+                f"WHERE foto_estado = 'aguardando' AND chave IN ({','.join('?' * len(chaves))})",
+                chaves
+            ).fetchall()
+        for chave, foto, nome, tipo in fotos:
+            self._enviar_foto(chave, gravadas[chave].id, foto, nome, tipo)
+
+    def _enviar_foto(self, chave, parada_id, foto, nome, tipo):
+        self._marcar_foto(chave, "enviando")
+        futuro = self.envios_fotos.enviar(parada_id, foto, nome, tipo)
+        futuro.add_done_callback(lambda f, chave=chave: self._foto_concluida(chave, f))
+
+    def _foto_concluida(self, chave, futuro):
+        ok = futuro.exception() is None and futuro.result() is not None
+        # depois de enviada, a foto não precisa mais ocupar o diário
+        self._marcar_foto(chave, "enviada" if ok else "erro", apagar=ok)
+
+    def _marcar_foto(self, chave, estado, apagar=False):
+        with self._lock, self._conectar() as conn:
+            conn.execute(
+                "UPDATE capturas SET foto_estado = ?"
+                + (", foto = NULL" if apagar else "")
+                + " WHERE chave = ?",
+                (estado, chave)
+            )
+
+    def _reenviar_fotos(self):
+        # só na partida: aqui 'enviando' é um envio que o processo anterior
+        # não terminou, não um envio em andamento
+        if self.envios_fotos is None:
+            return
+        with self._conectar() as conn:
+            fotos = conn.execute(
+                "SELECT chave, parada_id, foto, foto_nome, foto_tipo FROM capturas "
+                "WHERE estado = 'gravada' AND foto_estado IN ('aguardando', 'enviando')"
+            ).fetchall()
+        for chave, parada_id, foto, nome, tipo in fotos:
+            self._enviar_foto(chave, parada_id, foto, nome, tipo)
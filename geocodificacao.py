@@ -0,0 +1,179 @@
+import json
+import logging
+import threading
+import time
+
+from datetime import datetime, timedelta
+from sqlalchemy import select
+
+from dados_paradas import (
+    EnderecoCache,
+    Parada,
+    extrair_endereco,
+)
+from instrumentacao import etapa
+
+log = logging.getLogger(__name__)
+
+
+# ================== CONFIG ==================
+PASSO_GRADE = 0.0001               # ~11 m: cliques próximos caem na mesma chave
+TTL_CACHE = timedelta(days=30)
+RAIO_PARADA_PROXIMA = 30           # metros
+TIMEOUT_GEOCODIFICADOR = 5
+ESPERA_LIMITADOR = 2               # segundos aguardando uma ficha antes de desistir
+
+def chave_grade(lat, lon, passo=PASSO_GRADE):
+    return f"{round(float(lat) / passo)}:{round(float(lon) / passo)}"
+
+
+# ================== LIMITADOR (TOKEN BUCKET) ==================
+class LimitadorTaxa:
+    # relogio/dormir substituíveis para testar sem esperar de verdade
+    def __init__(self, taxa=1.0, capacidade=1, relogio=time.monotonic, dormir=time.sleep):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.relogio = relogio
+        self.dormir = dormir
+        self.fichas = float(capacidade)
+        self.ultimo = relogio()
+        self._lock = threading.Lock()
+
+    def _tentar(self):
+        with self._lock:
+            agora = self.relogio()
+            self.fichas = min(self.capacidade, self.fichas + (agora - self.ultimo) * self.taxa)
+            self.ultimo = agora
+            if self.fichas >= 1:
+                self.fichas -= 1
+                return 0.0
+            return (1 - self.fichas) / self.taxa
+
+    def aguardar(self, timeout=None):
+        limite = None if timeout is None else self.relogio() + timeout
+        while True:
+            espera = self._tentar()
+            if espera == 0.0:
+                return True
+            if limite is not None and self.relogio() + espera > limite:
+                return False
+            self.dormir(espera)
+
+
+# ================== GEOCODIFICADORES ==================
+# Interface: reverter(lat, lon) -> dict de endereço no formato do Nominatim
+# ("road", "suburb", "postcode", ...) ou None.
+class GeocodificadorNominatim:
+    def __init__(self, user_agent="sipo_semob_fsa_v6", timeout=TIMEOUT_GEOCODIFICADOR):
+        from geopy.geocoders import Nominatim
+        self.geolocator = Nominatim(user_agent=user_agent)
+        self.timeout = timeout
+
+    def reverter(self, lat, lon):
+        rev = self.geolocator.reverse(f"{lat}, {lon}", timeout=self.timeout)
+        return rev.raw.get("address", {}) if rev else None
+
+
+class GeocodificadorLocal:
+    # Stub sem rede para testes e desenvolvimento: devolve sempre o mesmo
+    # endereço ou o resultado de uma função (lat, lon) -> dict
+    def __init__(self, endereco=None):
+        self.endereco = endereco if endereco is not None else {}
+        self.chamadas = 0
+
+    def reverter(self, lat, lon):
+        self.chamadas += 1
+        if callable(self.endereco):
+            return self.endereco(lat, lon)
+        return dict(self.endereco)
+
+
+# ================== SERVIÇO COM CACHE ==================
+class ServicoGeocodificacao:
+    def __init__(self, fabrica_sessao, geocodificador, limitador=None, ttl=TTL_CACHE):
+        self.fabrica_sessao = fabrica_sessao
+        self.geocodificador = geocodificador
+        self.limitador = limitador or LimitadorTaxa(taxa=1.0, capacidade=1)
+        self.ttl = ttl
+        self.estatisticas = {
+            "cache": 0,
+            "parada": 0,
+            "rede": 0,
+            "limitado": 0,
+            "falha": 0,
+        }
+        self._lock = threading.Lock()
+
+    def _contar(self, origem):
+        with self._lock:
+            self.estatisticas[origem] += 1
+
+    def reverter(self, lat, lon, indice=None):
+        chave = chave_grade(lat, lon)
+
+        with self.fabrica_sessao() as session:
+            dados = self._ler_cache(session, chave)
+            if dados is not None:
+                self._contar("cache")
+                return dados, "cache"
+
+            if indice is not None:
+                dados = self._parada_mais_proxima(session, indice, lat, lon)
+                if dados is not None:
+                    self._contar("parada")
+                    return dados, "parada"
+
+        # a conexão volta ao pool antes da espera pela rede
+        if not self.limitador.aguardar(ESPERA_LIMITADOR):
+            self._contar("limitado")
+            return None, "limitado"
+
+        try:
+            with etapa("geocodificacao.rede"):
+                endereco = self.geocodificador.reverter(lat, lon)
+        except Exception as e:
+            log.warning("Falha na geocodificação reversa de (%s, %s): %s", lat, lon, e)
+            self._contar("falha")
+            return None, "falha"
+
+        self._contar("rede")
+        if not endereco:
+            return None, "rede"
+
+        dados = extrair_endereco(endereco)
+        with self.fabrica_sessao() as session:
+            self._gravar_cache(session, chave, dados)
+        return dados, "rede"
+
+    def _ler_cache(self, session, chave):
+        item = session.get(EnderecoCache, chave)
+        if item is None or item.criado_em < datetime.now() - self.ttl:
+            return None
+        return json.loads(item.endereco)
+
+    def _gravar_cache(self, session, chave, dados):
+        try:
+            session.merge(EnderecoCache(
+                chave=chave,
+                endereco=json.dumps(dados),
+                criado_em=datetime.now()
+            ))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            log.warning("Não foi possível gravar o cache de geocodificação: %s", e)
+
+    def _parada_mais_proxima(self, session, indice, lat, lon):
+        proximas = indice.vizinhos(lat, lon, RAIO_PARADA_PROXIMA)
+        if not proximas:
+            return None
+
+        parada_id = proximas[0][0]
+        linha = session.execute(
+            select(Parada.rua, Parada.bairro, Parada.cep).where(Parada.id == parada_id)
+        ).first()
+        if linha is None:
+            return None
+
+        # o número da parada vizinha não é o deste ponto
+        return {"rua": linha.rua, "num": "", "bairro": linha.bairro, "cep": linha.cep or ""}
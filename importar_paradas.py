@@ -0,0 +1,295 @@
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import time
+
+from collections import Counter
+from datetime import datetime
+
+import pandas as pd
+
+from sqlalchemy import select, cast, Float, insert
+
+from dados_paradas import (
+    Parada,
+    TIPOS_PARADA,
+    SENTIDOS_PARADA,
+    ajustar_resumo,
+    calcular_celula,
+    chaves_resumo,
+    criar_engine,
+    extrair_endereco,
+    normalizar_texto,
+    texto_busca_parada,
+)
+from indice_espacial import IndiceEspacial, RAIO_DUPLICATA
+
+log = logging.getLogger(__name__)
+
+
+# ================== CONFIG ==================
+TAMANHO_LOTE = 5000
+
+COLUNAS_INSERCAO = [
+    "numero_parada", "rua", "numero_localizacao", "bairro", "cep",
+    "ponto_referencia", "sentido", "tipo", "latitude", "longitude",
+    "foto_url", "data_cadastro", "atualizado_em", "celula", "texto_busca",
+]
+
+# comparação sem diferenciar maiúsculas: "abrigo + placa" -> "Abrigo + Placa"
+TIPOS_POR_CHAVE = {t.lower(): t for t in TIPOS_PARADA}
+SENTIDOS_POR_CHAVE = {s.lower().replace(" ", ""): s for s in SENTIDOS_PARADA}
+
+
+class RegistroInvalido(Exception):
+    pass
+
+
+# ================== LEITURA (STREAMING) ==================
+def ler_csv(caminho):
+    with open(caminho, newline="", encoding="utf-8-sig") as f:
+        for n, linha in enumerate(csv.DictReader(f), start=2):
+            yield n, linha
+
+def _propriedades_feature(feature):
+    props = dict(feature.get("properties") or {})
+    geometria = feature.get("geometry") or {}
+    if geometria.get("type") == "Point":
+        lon, lat = geometria["coordinates"][:2]
+        props.setdefault("latitude", lat)
+        props.setdefault("longitude", lon)
+    return props
+
+def ler_geojson(caminho):
+    # GeoJSON sequencial (uma feature por linha) é lido em streaming;
+    # uma FeatureCollection comum precisa ser carregada inteira pelo json
+    with open(caminho, encoding="utf-8") as f:
+        inicio = f.read(1)
+        while inicio.isspace():
+            inicio = f.read(1)
+        f.seek(0)
+
+        if inicio == "{" and not caminho.endswith((".geojsonl", ".geojsons", ".jsonl")):
+            colecao = json.load(f)
+            for n, feature in enumerate(colecao.get("features", []), start=1):
+                yield n, _propriedades_feature(feature)
+            return
+
+        for n, linha in enumerate(f, start=1):
+            linha = linha.strip().lstrip("\x1e")
+            if linha:
+                yield n, _propriedades_feature(json.loads(linha))
+
+def ler_arquivo(caminho):
+    if caminho.lower().endswith(".csv"):
+        return ler_csv(caminho)
+    return ler_geojson(caminho)
+
+
+# ================== VALIDAÇÃO E NORMALIZAÇÃO ==================
+def _texto(valor):
+    if valor is None:
+        return ""
+    return str(valor).strip()
+
+def _coordenada(valor, nome, limite):
+    try:
+        numero = float(str(valor).replace(",", "."))
+    except (TypeError, ValueError):
+        raise RegistroInvalido(f"{nome} inválida: {valor!r}")
+    if not -limite <= numero <= limite:
+        raise RegistroInvalido(f"{nome} fora do intervalo: {numero}")
+    return numero
+
+def normalizar_registro(bruto):
+    # aceita as colunas do modelo ou as chaves de endereço do Nominatim
+    endereco = extrair_endereco(bruto)
+
+    rua = normalizar_texto(_texto(bruto.get("rua")) or _texto(endereco["rua"]))
+    bairro = normalizar_texto(_texto(bruto.get("bairro")) or _texto(endereco["bairro"]))
+    ponto = _texto(bruto.get("ponto_referencia"))
+
+    faltando = [n for n, v in (("rua", rua), ("bairro", bairro), ("ponto_referencia", ponto)) if not v]
+    if faltando:
+        raise RegistroInvalido(f"campos obrigatórios vazios: {', '.join(faltando)}")
+
+    tipo = TIPOS_POR_CHAVE.get(_texto(bruto.get("tipo")).lower())
+    if tipo is None:
+        raise RegistroInvalido(f"tipo inválido: {bruto.get('tipo')!r}")
+
+    sentido = SENTIDOS_POR_CHAVE.get(_texto(bruto.get("sentido")).lower().replace(" ", ""))
+    if sentido is None:
+        raise RegistroInvalido(f"sentido inválido: {bruto.get('sentido')!r}")
+
+    lat = _coordenada(bruto.get("latitude"), "latitude", 90)
+    lon = _coordenada(bruto.get("longitude"), "longitude", 180)
+
+    numero = _texto(bruto.get("numero_parada"))
+    num_local = _texto(bruto.get("numero_localizacao")) or _texto(endereco["num"])
+    cep = _texto(bruto.get("cep")) or _texto(endereco["cep"])
+    foto = _texto(bruto.get("foto_url"))
+
+    return {
+        "numero_parada": numero or None,
+        "rua": rua,
+        "numero_localizacao": num_local or None,
+        "bairro": bairro,
+        "cep": cep or None,
+        "ponto_referencia": ponto,
+        "sentido": sentido,
+        "tipo": tipo,
+        "latitude": lat,
+        "longitude": lon,
+        "foto_url": foto or None,
+    }
+
+
+# ================== GRAVAÇÃO EM LOTE ==================
+def _copy_postgres(conn, linhas):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    for linha in linhas:
+        escritor.writerow([
+            "" if linha[c] is None else (linha[c].isoformat() if isinstance(linha[c], datetime) else linha[c])
+            for c in COLUNAS_INSERCAO
+        ])
+    buffer.seek(0)
+
+    cursor = conn.connection.driver_connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {Parada.__tablename__} ({', '.join(COLUNAS_INSERCAO)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+def gravar_lote(engine, linhas):
+    agora = datetime.now()
+    deltas = Counter()
+    for linha in linhas:
+        linha["data_cadastro"] = agora
+        linha["atualizado_em"] = agora
+        linha["celula"] = calcular_celula(linha["latitude"], linha["longitude"])
+        linha["texto_busca"] = texto_busca_parada(linha["numero_parada"], linha["rua"], linha["bairro"])
+        deltas.update(chaves_resumo(linha["rua"], linha["bairro"], linha["tipo"]))
+
+    # inserção direta no core: os ganchos do ORM não rodam, então célula, busca e
+    # resumo são preenchidos aqui, na mesma transação do lote
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            _copy_postgres(conn, linhas)
+        else:
+            conn.execute(insert(Parada.__table__), [
+                {c: linha[c] for c in COLUNAS_INSERCAO} for linha in linhas
+            ])
+        ajustar_resumo(conn, deltas)
+
+
+# ================== IMPORTAÇÃO ==================
+def carregar_existentes(engine):
+    with engine.connect() as conn:
+        numeros = set(conn.execute(
+            select(Parada.numero_parada).where(Parada.numero_parada.isnot(None))
+        ).scalars())
+        coords = conn.execute(
+            select(Parada.id, cast(Parada.latitude, Float), cast(Parada.longitude, Float))
+            .where(Parada.latitude.isnot(None))
+        ).all()
+
+    indice = IndiceEspacial.construir(pd.DataFrame.from_records(coords, columns=["ID_DB", "LAT", "LON"]))
+    return numeros, indice
+
+def importar(engine, caminho, caminho_rejeitados, tamanho_lote=TAMANHO_LOTE,
+             raio_duplicata=RAIO_DUPLICATA, simular=False):
+    inicio = time.perf_counter()
+    numeros, indice = carregar_existentes(engine)
+    totais = Counter()
+    lote = []
+    novo_id = 0
+
+    with open(caminho_rejeitados, "w", newline="", encoding="utf-8") as f_rej:
+        rejeitados = csv.writer(f_rej)
+        rejeitados.writerow(["linha", "motivo", "registro"])
+
+        def rejeitar(n, motivo, bruto):
+            totais["rejeitadas"] += 1
+            rejeitados.writerow([n, motivo, json.dumps(bruto, ensure_ascii=False, default=str)])
+
+        def descarregar():
+            if not lote:
+                return
+            if not simular:
+                try:
+                    gravar_lote(engine, [linha for _, linha, _, _ in lote])
+                except Exception as e:
+                    log.error("Lote com %d linhas falhou: %s", len(lote), e)
+                    for n, linha, bruto, id_local in lote:
+                        # nada do lote foi gravado: as linhas seguintes do
+                        # arquivo não podem ser recusadas por causa delas
+                        indice.remover(id_local)
+                        numeros.discard(linha["numero_parada"])
+                        rejeitar(n, f"erro no lote: {e}", bruto)
+                    lote.clear()
+                    return
+            totais["importadas"] += len(lote)
+            lote.clear()
+
+        for n, bruto in ler_arquivo(caminho):
+            totais["lidas"] += 1
+            try:
+                linha = normalizar_registro(bruto)
+            except RegistroInvalido as e:
+                rejeitar(n, str(e), bruto)
+                continue
+
+            if linha["numero_parada"] and linha["numero_parada"] in numeros:
+                rejeitar(n, f"numero_parada repetido: {linha['numero_parada']}", bruto)
+                continue
+
+            proximas = indice.vizinhos(linha["latitude"], linha["longitude"], raio_duplicata)
+            if proximas:
+                rejeitar(n, f"parada a {proximas[0][1]:.1f} m de outra já existente", bruto)
+                continue
+
+            # ids negativos marcam paradas deste arquivo ainda sem id no banco
+            novo_id -= 1
+            indice.adicionar(novo_id, linha["latitude"], linha["longitude"])
+            if linha["numero_parada"]:
+                numeros.add(linha["numero_parada"])
+
+            lote.append((n, linha, bruto, novo_id))
+            if len(lote) >= tamanho_lote:
+                descarregar()
+
+        descarregar()
+
+    duracao = time.perf_counter() - inicio
+    totais["segundos"] = round(duracao, 2)
+    totais["linhas_por_segundo"] = round(totais["lidas"] / duracao, 1) if duracao else 0
+    return totais
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa paradas em lote a partir de CSV ou GeoJSON.")
+    parser.add_argument("arquivo", help=".csv, .geojson ou GeoJSON sequencial (.geojsonl)")
+    parser.add_argument("--rejeitados", help="relatório CSV das linhas recusadas (padrão: <arquivo>.rejeitados.csv)")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="linhas por transação")
+    parser.add_argument("--raio", type=float, default=RAIO_DUPLICATA, help="distância mínima (m) até outra parada")
+    parser.add_argument("--simular", action="store_true", help="valida e deduplica sem gravar")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine = criar_engine(os.environ["DATABASE_URL"])
+    totais = importar(
+        engine,
+        args.arquivo,
+        args.rejeitados or f"{args.arquivo}.rejeitados.csv",
+        tamanho_lote=args.lote,
+        raio_duplicata=args.raio,
+        simular=args.simular,
+    )
+    print(", ".join(f"{k}: {v}" for k, v in totais.items()))
@@ -0,0 +1,155 @@
+import math
+import threading
+
+import numpy as np
+
+from collections import defaultdict
+
+
+# ================== GEOMETRIA ==================
+RAIO_TERRA_M = 6371000.0
+METROS_POR_GRAU = 111320.0
+LAT_REFERENCIA = -12.25            # Feira de Santana
+
+# Distância (m) abaixo da qual duas paradas são tratadas como possível duplicata
+RAIO_DUPLICATA = 15
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    # aceita escalares ou arrays NumPy (com broadcast)
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * RAIO_TERRA_M * np.arcsin(np.sqrt(a))
+
+
+# ================== ÍNDICE EM GRADE ==================
+# Grade métrica (projeção equirretangular local) com células de tamanho_m.
+# Uma busca de raio r só olha as células a até ceil(r / tamanho_m) de distância.
+class IndiceEspacial:
+    def __init__(self, tamanho_m=50.0):
+        self.tamanho_m = tamanho_m
+        self._escala_lon = METROS_POR_GRAU * math.cos(math.radians(LAT_REFERENCIA))
+        self.celulas = defaultdict(set)
+        self.pontos = {}
+        self._lock = threading.RLock()
+
+    def _celula(self, lat, lon):
+        return (
+            math.floor(lat * METROS_POR_GRAU / self.tamanho_m),
+            math.floor(lon * self._escala_lon / self.tamanho_m),
+        )
+
+    @classmethod
+    def construir(cls, df, tamanho_m=50.0):
+        indice = cls(tamanho_m)
+        indice.adicionar_frame(df)
+        return indice
+
+    def adicionar_frame(self, df):
+        df = df.dropna(subset=["LAT", "LON"])
+        if df.empty:
+            return
+
+        ids = df["ID_DB"].to_numpy()
+        lat = df["LAT"].to_numpy()
+        lon = df["LON"].to_numpy()
+        ci = np.floor(lat * METROS_POR_GRAU / self.tamanho_m).astype("int64")
+        cj = np.floor(lon * self._escala_lon / self.tamanho_m).astype("int64")
+
+        ids = ids.tolist()
+        with self._lock:
+            for pid in [p for p in ids if p in self.pontos]:
+                self.remover(pid)
+            for pid, celula in zip(ids, zip(ci.tolist(), cj.tolist())):
+                self.celulas[celula].add(pid)
+            self.pontos.update(zip(ids, zip(lat.tolist(), lon.tolist())))
+
+    def adicionar(self, pid, lat, lon):
+        with self._lock:
+            self.remover(pid)
+            self.pontos[pid] = (lat, lon)
+            self.celulas[self._celula(lat, lon)].add(pid)
+
+    def remover(self, pid):
+        with self._lock:
+            ponto = self.pontos.pop(pid, None)
+            if ponto is None:
+                return
+            celula = self._celula(*ponto)
+            self.celulas[celula].discard(pid)
+            if not self.celulas[celula]:
+                del self.celulas[celula]
+
+    def __len__(self):
+        return len(self.pontos)
+
+    # ---------- consultas ----------
+    def _candidatos(self, lat, lon, raio_m):
+        ci, cj = self._celula(lat, lon)
+        anel = math.ceil(raio_m / self.tamanho_m)
+        ids = []
+        for di in range(-anel, anel + 1):
+            for dj in range(-anel, anel + 1):
+                ids.extend(self.celulas.get((ci + di, cj + dj), ()))
+        return ids
+
+    def vizinhos(self, lat, lon, raio_m, ignorar=None):
+        with self._lock:
+            ids = [pid for pid in self._candidatos(lat, lon, raio_m) if pid != ignorar]
+            if not ids:
+                return []
+            coords = np.array([self.pontos[pid] for pid in ids])
+
+        dist = haversine_m(lat, lon, coords[:, 0], coords[:, 1])
+        ordem = np.argsort(dist)
+        return [(ids[k], float(dist[k])) for k in ordem if dist[k] <= raio_m]
+
+    def grupos_duplicados(self, raio_m):
+        # union-find sobre pares vizinhos: cada célula só é comparada com ela
+        # mesma e com as vizinhas, então o custo cresce com n e não com n²
+        pai = {}
+
+        def raiz(x):
+            while pai.get(x, x) != x:
+                pai[x] = pai.get(pai[x], pai[x])
+                x = pai[x]
+            return x
+
+        def unir(x, y):
+            rx, ry = raiz(x), raiz(y)
+            pai.setdefault(rx, rx)
+            pai.setdefault(ry, ry)
+            pai[rx] = ry
+
+        with self._lock:
+            anel = math.ceil(raio_m / self.tamanho_m)
+            celulas = {c: list(ids) for c, ids in self.celulas.items()}
+            pontos = dict(self.pontos)
+
+        for (ci, cj), ids in celulas.items():
+            vizinhos = []
+            for di in range(-anel, anel + 1):
+                for dj in range(-anel, anel + 1):
+                    # metade das vizinhas basta: o par (A, B) é visto a partir de A ou de B
+                    if (di, dj) > (0, 0):
+                        vizinhos.extend(celulas.get((ci + di, cj + dj), ()))
+
+            a = np.array([pontos[p] for p in ids])
+            # pares dentro da própria célula
+            if len(ids) > 1:
+                dist = haversine_m(a[:, None, 0], a[:, None, 1], a[None, :, 0], a[None, :, 1])
+                for x, y in zip(*np.nonzero(np.triu(dist <= raio_m, k=1))):
+                    unir(ids[x], ids[y])
+            # pares com as células vizinhas
+            if vizinhos:
+                b = np.array([pontos[p] for p in vizinhos])
+                dist = haversine_m(a[:, None, 0], a[:, None, 1], b[None, :, 0], b[None, :, 1])
+                for x, y in zip(*np.nonzero(dist <= raio_m)):
+                    unir(ids[x], vizinhos[y])
+
+        grupos = defaultdict(list)
+        for pid in pai:
+            grupos[raiz(pid)].append(pid)
+        return sorted((sorted(g) for g in grupos.values() if len(g) > 1), key=len, reverse=True)
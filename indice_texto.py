@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from dados_paradas import dobrar_acentos
+
+
+# ================== ÍNDICE DE TEXTO ==================
+# Cada coluna é fatorada em valores distintos (as categorias, no caso de
+# Rua e Bairro), guardados sem acento e em minúsculas. Uma busca procura o
+# trecho só nos valores distintos e vira um único isin nos códigos das
+# linhas: o trabalho cresce com o número de ruas/pontos diferentes, não
+# com o de paradas.
+COLUNAS_BUSCA = ("Rua", "Bairro", "Ponto de Referência")
+
+class IndiceTexto:
+    def __init__(self, df, colunas=COLUNAS_BUSCA):
+        self.tamanho = len(df)
+        self.codigos = {}
+        self.valores = {}
+        self.dobrados = {}
+
+        for coluna in colunas:
+            serie = df[coluna]
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                codigos = serie.cat.codes.to_numpy()
+                valores = serie.cat.categories
+            else:
+                codigos, valores = pd.factorize(serie)
+            self.codigos[coluna] = codigos
+            self.valores[coluna] = pd.Index(valores)
+            self.dobrados[coluna] = pd.Series([dobrar_acentos(v) for v in valores], dtype=object)
+
+    def _mascara_codigos(self, coluna, codigos):
+        return np.isin(self.codigos[coluna], codigos)
+
+    def buscar(self, coluna, termo):
+        # o trecho (sem acento nem caixa) aparece em qualquer ponto do valor;
+        # devolve uma máscara booleana por linha ou None se o termo for vazio
+        trecho = dobrar_acentos(termo)
+        if not trecho:
+            return None
+        achados = self.dobrados[coluna].str.contains(trecho, regex=False).to_numpy()
+        return self._mascara_codigos(coluna, np.flatnonzero(achados))
+
+    def selecionar(self, coluna, valores):
+        # filtro de igualdade (multiselect) direto nos códigos
+        if not valores:
+            return None
+        codigos = self.valores[coluna].get_indexer(list(valores))
+        return self._mascara_codigos(coluna, codigos[codigos >= 0])
+
+    def filtrar(self, df, bairros=None, rua=None, ponto=None):
+        mascara = np.ones(self.tamanho, dtype=bool)
+        for parcial in (
+            self.selecionar("Bairro", bairros),
+            self.buscar("Rua", rua),
+            self.buscar("Ponto de Referência", ponto),
+        ):
+            if parcial is not None:
+                mascara &= parcial
+        if mascara.all():
+            return df
+        return df[mascara]
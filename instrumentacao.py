@@ -0,0 +1,204 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import deque, defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+import numpy as np
+
+from sqlalchemy import event
+
+log = logging.getLogger(__name__)
+
+
+# ================== CONFIG ==================
+TAMANHO_BUFFER = 5000              # etapas guardadas (as mais antigas saem)
+PERCENTIS = (50, 90, 99)
+INTERVALO_ARQUIVO = 15             # segundos entre gravações do arquivo Prometheus
+PREFIXO_METRICAS = "sip"
+
+
+# ================== RASTREADOR ==================
+# Etapas cronometradas vão para um buffer circular. Cada execução do script
+# (um rerun) acumula, na thread dela, as etapas e as consultas SQL feitas;
+# o Streamlit roda cada sessão numa thread, então usuários não se misturam.
+class Rastreador:
+    def __init__(self, tamanho=TAMANHO_BUFFER):
+        self.etapas = deque(maxlen=tamanho)
+        self.execucoes = deque(maxlen=200)
+        self.sql_total = {"consultas": 0, "linhas": 0, "ms": 0.0}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._ultima_gravacao = 0.0
+        self._engines = set()
+
+    # ---------- execução (rerun) ----------
+    def iniciar_execucao(self, rotulo):
+        self._local.execucao = {
+            "rotulo": rotulo,
+            "inicio": time.time(),
+            "consultas": 0,
+            "linhas": 0,
+            "ms_sql": 0.0,
+            "etapas": defaultdict(float),
+        }
+        self._local.t0 = time.perf_counter()
+
+    def finalizar_execucao(self, rotulo=None):
+        # execuções interrompidas por st.rerun()/st.stop() não chegam aqui e são
+        # descartadas pela próxima iniciar_execucao
+        execucao = getattr(self._local, "execucao", None)
+        if execucao is None:
+            return None
+        self._local.execucao = None
+        if rotulo:
+            execucao["rotulo"] = rotulo
+
+        ms = (time.perf_counter() - self._local.t0) * 1000
+        self.registrar(f"execucao.{execucao['rotulo']}", ms)
+        resumo = {
+            "rotulo": execucao["rotulo"],
+            "inicio": execucao["inicio"],
+            "ms": round(ms, 2),
+            "consultas": execucao["consultas"],
+            "linhas": execucao["linhas"],
+            "ms_sql": round(execucao["ms_sql"], 2),
+            "etapas": {k: round(v, 2) for k, v in execucao["etapas"].items()},
+        }
+        with self._lock:
+            self.execucoes.append(resumo)
+        return resumo
+
+    # ---------- etapas ----------
+    def registrar(self, nome, ms):
+        with self._lock:
+            self.etapas.append((nome, ms, time.time()))
+        execucao = getattr(self._local, "execucao", None)
+        if execucao is not None:
+            execucao["etapas"][nome] += ms
+
+    @contextmanager
+    def etapa(self, nome):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(nome, (time.perf_counter() - inicio) * 1000)
+
+    def medir(self, nome=None):
+        def decorador(funcao):
+            rotulo = nome or funcao.__qualname__
+
+            @wraps(funcao)
+            def envolvida(*args, **kwargs):
+                with self.etapa(rotulo):
+                    return funcao(*args, **kwargs)
+            return envolvida
+        return decorador
+
+    # ---------- SQL ----------
+    def instalar_sql(self, engine):
+        # conta consultas, linhas e tempo de cada cursor; as linhas são as que o
+        # driver informa em rowcount (psycopg2 informa SELECT, sqlite3 não)
+        if id(engine) in self._engines:
+            return
+        self._engines.add(id(engine))
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def antes(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("inicio_consulta", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def depois(conn, cursor, statement, parameters, context, executemany):
+            ms = (time.perf_counter() - conn.info["inicio_consulta"].pop()) * 1000
+            linhas = max(cursor.rowcount or 0, 0)
+            with self._lock:
+                self.sql_total["consultas"] += 1
+                self.sql_total["linhas"] += linhas
+                self.sql_total["ms"] += ms
+            execucao = getattr(self._local, "execucao", None)
+            if execucao is not None:
+                execucao["consultas"] += 1
+                execucao["linhas"] += linhas
+                execucao["ms_sql"] += ms
+
+    # ---------- resumos ----------
+    def resumo(self):
+        with self._lock:
+            etapas = list(self.etapas)
+
+        por_nome = defaultdict(list)
+        for nome, ms, _ in etapas:
+            por_nome[nome].append(ms)
+
+        linhas = []
+        for nome, tempos in sorted(por_nome.items()):
+            valores = np.array(tempos)
+            linha = {"etapa": nome, "n": len(valores), "total_ms": float(valores.sum())}
+            for p, v in zip(PERCENTIS, np.percentile(valores, PERCENTIS)):
+                linha[f"p{p}_ms"] = round(float(v), 2)
+            linha["max_ms"] = round(float(valores.max()), 2)
+            linhas.append(linha)
+        return linhas
+
+    def ultimas_execucoes(self, n=20):
+        with self._lock:
+            return list(self.execucoes)[-n:]
+
+    def prometheus(self):
+        saida = [
+            f"# TYPE {PREFIXO_METRICAS}_etapa_ms summary",
+        ]
+        for linha in self.resumo():
+            rotulo = linha["etapa"].replace("\\", "\\\\").replace('"', '\\"')
+            for p in PERCENTIS:
+                saida.append(
+                    f'{PREFIXO_METRICAS}_etapa_ms{{etapa="{rotulo}",quantile="{p / 100}"}} {linha[f"p{p}_ms"]}'
+                )
+            saida.append(f'{PREFIXO_METRICAS}_etapa_ms_sum{{etapa="{rotulo}"}} {linha["total_ms"]:.3f}')
+            saida.append(f'{PREFIXO_METRICAS}_etapa_ms_count{{etapa="{rotulo}"}} {linha["n"]}')
+
+        with self._lock:
+            sql = dict(self.sql_total)
+        saida += [
+            f"# TYPE {PREFIXO_METRICAS}_sql_consultas_total counter",
+            f"{PREFIXO_METRICAS}_sql_consultas_total {sql['consultas']}",
+            f"# TYPE {PREFIXO_METRICAS}_sql_linhas_total counter",
+            f"{PREFIXO_METRICAS}_sql_linhas_total {sql['linhas']}",
+            f"# TYPE {PREFIXO_METRICAS}_sql_ms_total counter",
+            f"{PREFIXO_METRICAS}_sql_ms_total {sql['ms']:.3f}",
+        ]
+        return "\n".join(saida) + "\n"
+
+    # ---------- saída para análise offline ----------
+    def gravar_prometheus(self, caminho, forcar=False):
+        # para o textfile collector do node_exporter; troca atômica do arquivo
+        agora = time.monotonic()
+        if not forcar and agora - self._ultima_gravacao < INTERVALO_ARQUIVO:
+            return False
+        self._ultima_gravacao = agora
+
+        temporario = f"{caminho}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        os.replace(temporario, caminho)
+        return True
+
+    def registrar_json(self, execucao, caminho):
+        # uma linha JSON por execução (JSON Lines); o arquivo é reaberto a
+        # cada linha, então o logrotate pode girá-lo sem reiniciar o app
+        if execucao is None:
+            return
+        linha = json.dumps(execucao, ensure_ascii=False) + "\n"
+        with self._lock, open(caminho, "a", encoding="utf-8") as f:
+            f.write(linha)
+
+
+# Instância única por processo, usada pelos módulos e pelo app
+RASTREADOR = Rastreador()
+etapa = RASTREADOR.etapa
+medir = RASTREADOR.medir
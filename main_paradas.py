@@ -1,101 +1,166 @@
 import os
+import hmac
+import logging
+import tempfile
+import time
 import streamlit as st
-import pandas as pd
 import folium
 
-from sqlalchemy import create_engine, Column, Integer, String, Numeric, Text, DateTime
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.orm import sessionmaker
 
-from datetime import datetime
 from streamlit_folium import st_folium
-from geopy.geocoders import Nominatim
 from streamlit_js_eval import streamlit_js_eval
 
-import boto3
-from uuid import uuid4
-
-
-# ================== FUNÇÕES AUXILIARES ==================
-def normalizar_texto(txt):
-    if not txt:
-        return ""
-    return txt.strip().title()
-
-def extrair_endereco(addr):
-    return {
-        "rua": addr.get("road")
-               or addr.get("street")
-               or addr.get("pedestrian")
-               or "",
-        "num": addr.get("house_number", ""),
-        "bairro": addr.get("suburb")
-                  or addr.get("neighbourhood")
-                  or addr.get("quarter")
-                  or "",
-        "cep": addr.get("postcode", "")
-    }
+from dados_paradas import (
+    Parada,
+    TIPOS_PARADA,
+    SENTIDOS_PARADA,
+    normalizar_texto,
+    buscar_paradas,
+    CacheParadas,
+    criar_engine,
+    esquema_pendente,
+    ler_resumo,
+    migrar_esquema,
+    POOL_PADRAO,
+)
+from armazenamento_fotos import EnviosFotos, ler_config
+from indice_espacial import RAIO_DUPLICATA
+from indice_texto import IndiceTexto
+from analise_cobertura import (
+    analisar_cobertura,
+    ESPACAMENTO_MAXIMO,
+    RAIO_ISOLAMENTO,
+    LADO_CELULA_LACUNA,
+)
+from exportar_paradas import exportar, FORMATOS, TIPOS_MIME
+from geocodificacao import ServicoGeocodificacao, GeocodificadorNominatim
+from fila_captura import FilaCaptura, LIMITES_CAPTURA
+from instrumentacao import RASTREADOR, etapa
+from mapa_paradas import (
+    CacheMapas,
+    MAX_MAPAS_CACHE,
+    montar_mapa_lacunas,
+    montar_mapa_view,
+    planejar_mapa_view,
+    viewport_de,
+    LIMITE_MARCADORES as LIMITE_MARCADORES_PADRAO,
+)
 
-# ================== CONFIG BANCO ==================
-DATABASE_URL = st.secrets.get("DATABASE_URL") or os.getenv("DATABASE_URL")
 
-if not DATABASE_URL:
-    st.error("⚠️ URL do banco não configurada.")
-    st.stop()
+log = logging.getLogger(__name__)
+RASTREADOR.iniciar_execucao("inicio")
 
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-
-engine = create_engine(DATABASE_URL, echo=False, future=True, pool_pre_ping=True)
-SessionLocal = scoped_session(sessionmaker(bind=engine, autoflush=False, autocommit=False))
-Base = declarative_base()
-
-class Parada(Base):
-    __tablename__ = "paradas"
-    id = Column(Integer, primary_key=True)
-    numero_parada = Column(String(50), unique=True, nullable=True)
-    rua = Column(String(255), nullable=False)
-    numero_localizacao = Column(String(20))
-    bairro = Column(String(100), nullable=False)
-    cep = Column(String(10))
-    ponto_referencia = Column(Text, nullable=False)
-    sentido = Column(String(20))
-    tipo = Column(String(50))
-    latitude = Column(Numeric(10, 8))
-    longitude = Column(Numeric(11, 8))
-    foto_url = Column(Text)
-    data_cadastro = Column(DateTime, default=datetime.now)
-
-Base.metadata.create_all(bind=engine)
-db = SessionLocal()
-
-geolocator = Nominatim(user_agent="sipo_semob_fsa_v6")
-
-#==================== Upload Fotos =========================
-def get_r2_client():
-    return boto3.client(
-        "s3",
-        endpoint_url=st.secrets["R2_ENDPOINT"],
-        aws_access_key_id=st.secrets["R2_ACCESS_KEY"],
-        aws_secret_access_key=st.secrets["R2_SECRET_KEY"],
-        region_name="auto"
-    )
 
+# ================== CONFIG BANCO ==================
+def configuracao(nome, padrao=None):
+    return st.secrets.get(nome) or os.getenv(nome) or padrao
 
-def upload_foto_r2(file, parada_id):
-    r2 = get_r2_client()
+DATABASE_URL = configuracao("DATABASE_URL")
 
-    ext = file.name.split(".")[-1]
-    nome_arquivo = f"paradas/{parada_id}_{uuid4()}.{ext}"
+if not DATABASE_URL:
+    st.error("⚠️ URL do banco não configurada.")
+    st.stop()
 
-    r2.upload_fileobj(
-        file,
-        st.secrets["R2_BUCKET"],
-        nome_arquivo,
-        ExtraArgs={"ContentType": file.type}
+# Engine e fábrica de sessões criadas uma vez por processo; cada execução
+# do script abre só sessões curtas, devolvidas ao pool ao terminar.
+# O esquema é criado/migrado por `python dados_paradas.py migrar`; aqui só
+# se confere, uma vez, se falta alguma tabela ou coluna.
+# Sem spinner: rodam antes do st.set_page_config.
+@st.cache_resource(show_spinner=False)
+def obter_engine(url):
+    engine = criar_engine(url, **{
+        parametro: int(configuracao(f"DB_{parametro.upper()}", padrao))
+        for parametro, padrao in POOL_PADRAO.items()
+    })
+    if esquema_pendente(engine):
+        log.warning("Esquema desatualizado; aplicando migrações (rode `python dados_paradas.py migrar` no deploy)")
+        migrar_esquema(engine)
+    RASTREADOR.instalar_sql(engine)
+    return engine
+
+@st.cache_resource(show_spinner=False)
+def obter_fabrica_sessao(url):
+    return sessionmaker(bind=obter_engine(url), autoflush=False, autocommit=False)
+
+engine = obter_engine(DATABASE_URL)
+FabricaSessao = obter_fabrica_sessao(DATABASE_URL)
+
+LIMITE_MARCADORES = int(configuracao("MAPA_LIMITE_MARCADORES", LIMITE_MARCADORES_PADRAO))
+
+# Painel de desempenho: só com ?admin=<ADMIN_TOKEN> na URL
+ADMIN_TOKEN = configuracao("ADMIN_TOKEN", "")
+MODO_ADMIN = bool(ADMIN_TOKEN) and hmac.compare_digest(
+    str(st.query_params.get("admin", "")), str(ADMIN_TOKEN)
+)
+METRICAS_ARQUIVO = configuracao("METRICAS_ARQUIVO")
+EXECUCOES_ARQUIVO = configuracao("EXECUCOES_ARQUIVO")      # JSON Lines, uma linha por execução
+
+# Arquivos gerados em execução (diário da fila, snapshot) ficam numa pasta
+# própria ao lado do app, fora do diretório de trabalho e do git
+PASTA_DADOS = configuracao(
+    "PASTA_DADOS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados_locais")
+)
+PASTA_EXPORTACOES = os.path.join(PASTA_DADOS, "exportacoes")
+VALIDADE_EXPORTACAO = 3600         # segundos até um arquivo exportado ser descartado
+
+# ================== DADOS ==================
+# Um único DataFrame tipado por versão dos dados, compartilhado pelas abas
+# e sincronizado por delta (sem expiração por TTL nem limpeza global).
+# Na partida a frio o inventário vem do snapshot em disco, mapeado em
+# memória e compartilhado entre os processos, mais o delta desde ele.
+@st.cache_resource
+def obter_cache_paradas():
+    return CacheParadas(
+        FabricaSessao,
+        snapshot=configuracao("SNAPSHOT_ARQUIVO", os.path.join(PASTA_DADOS, "paradas_snapshot.arrow"))
     )
 
-    return f"{st.secrets['R2_PUBLIC_URL']}/{nome_arquivo}"
+# Envio de fotos ao R2 fora do formulário, com cliente S3 único por processo
+@st.cache_resource
+def obter_envios_fotos():
+    return EnviosFotos(ler_config(st.secrets), FabricaSessao)
+
+# Agregados do dashboard lidos da tabela de resumo, uma vez por versão
+@st.cache_data(max_entries=4)
+def carregar_resumo(versao):
+    with FabricaSessao() as session:
+        return ler_resumo(session)
+
+# Índice de palavras sem acento (Rua, Bairro, Ponto de Referência), uma vez
+# por versão; o frame não entra no hash da chave
+@st.cache_resource(max_entries=2)
+def obter_indice_texto(versao, _df):
+    return IndiceTexto(_df)
+
+# Cadastros vão para um diário local e são gravados no banco em lotes por
+# uma thread; a tela não espera o banco nem o envio da foto
+@st.cache_resource
+def obter_fila_captura():
+    return FilaCaptura(
+        configuracao("FILA_CAPTURA_ARQUIVO", os.path.join(PASTA_DADOS, "fila_captura.db")),
+        FabricaSessao,
+        envios_fotos=obter_envios_fotos(),
+        ao_gravar=obter_cache_paradas().aplicar_gravacao
+    ).iniciar()
+
+# Espaçamento, paradas isoladas e lacunas de cobertura, uma vez por versão
+@st.cache_data(max_entries=2)
+def carregar_analise(versao, _df):
+    with etapa("analise.cobertura"):
+        return analisar_cobertura(_df)
+
+# Planos de mapa (recorte, agregação e JSON prontos), reaproveitados entre
+# execuções e usuários; os objetos folium são montados a cada execução
+@st.cache_resource
+def obter_cache_mapas():
+    return CacheMapas(int(configuracao("MAPA_CACHE_ENTRADAS", MAX_MAPAS_CACHE)))
+
+# Geocodificação reversa com cache persistente e limite de taxa do Nominatim
+@st.cache_resource
+def obter_geocodificacao():
+    return ServicoGeocodificacao(FabricaSessao, GeocodificadorNominatim())
 
 
 # ================== STREAMLIT ==================
@@ -116,12 +181,69 @@ st.markdown(
 st.title("🚌 SIP - Sistema de Inventário de Paradas")
 st.caption("Gestão de Ativos - Feira de Santana")
 
-tab1, tab2, tab3, tab4 = st.tabs([
+# Navegação por seção em vez de st.tabs: st.tabs executa o corpo de todas
+# as abas a cada rerun; aqui só a seção escolhida roda. A escolha e o estado
+# compartilhado entre seções ficam no session_state.
+ABAS = [
     "📝 Cadastrar Parada",
     "📍 Visualizar Mapa e Dados",
     "📊 Dashboard",
     "✏️ Editar / Excluir"
-])
+]
+
+aba = st.radio(
+    "Seção",
+    ABAS,
+    horizontal=True,
+    key="aba",
+    label_visibility="collapsed"
+)
+
+cache_paradas = obter_cache_paradas()
+with etapa("cache.sincronizar"):
+    cache_paradas.sincronizar()
+df_paradas, versao_dados = cache_paradas.instantaneo()
+geocodificacao = obter_geocodificacao()
+envios_fotos = obter_envios_fotos()
+fila_captura = obter_fila_captura()
+
+def descartar_exportacoes_antigas():
+    # o Streamlit não avisa quando uma sessão termina: arquivos gerados há
+    # mais de VALIDADE_EXPORTACAO (sessões fechadas ou esquecidas) saem aqui
+    limite = time.time() - VALIDADE_EXPORTACAO
+    for nome in os.listdir(PASTA_EXPORTACOES):
+        caminho = os.path.join(PASTA_EXPORTACOES, nome)
+        try:
+            if os.path.getmtime(caminho) < limite:
+                os.remove(caminho)
+        except OSError:
+            pass
+
+def campo_limitado(rotulo, valor, coluna):
+    # mesmo limite da coluna no banco; valores vindos da geocodificação
+    # são cortados para caber
+    limite = LIMITES_CAPTURA[coluna]
+    return st.text_input(rotulo, (valor or "")[:limite], max_chars=limite)
+
+def tabela_proximas(proximas):
+    ids = [pid for pid, _ in proximas]
+    tabela = (
+        cache_paradas.frame.set_index("ID_DB")
+        .reindex(ids)[["ID", "Rua", "Bairro", "Tipo", "Sentido"]]
+        .reset_index(drop=True)
+    )
+    tabela["Distância (m)"] = [round(d, 1) for _, d in proximas]
+    return tabela
+
+def tabela_duplicatas(grupos):
+    ids = [pid for g in grupos for pid in g]
+    tabela = (
+        cache_paradas.frame.set_index("ID_DB")
+        .reindex(ids)[["ID", "Rua", "Bairro", "Tipo", "Sentido"]]
+        .reset_index(drop=True)
+    )
+    tabela.insert(0, "Grupo", [n for n, g in enumerate(grupos, start=1) for _ in g])
+    return tabela
 
 
 # ================== SESSION STATE ==================
@@ -133,11 +255,17 @@ if "form_data" not in st.session_state:
     st.session_state.form_data = {
         "rua": "", "bairro": "", "num": "", "cep": "", "id": ""
     }
+if "envios" not in st.session_state:
+    st.session_state.envios = []
+if "capturas" not in st.session_state:
+    st.session_state.capturas = []
+if "paginacao_edicao" not in st.session_state:
+    st.session_state.paginacao_edicao = {"termo": "", "cursores": [None]}
 
 # ==================================================
 # ================= ABA 1 - CADASTRO ================
 # ==================================================
-with tab1:
+if aba == ABAS[0]:
     st.subheader("🗺️ Localização e GPS")
 
     loc_data = streamlit_js_eval(
@@ -165,6 +293,10 @@ with tab1:
 
     @st.fragment
     def render_mapa_cadastro():
+        if st.session_state.get("msg_geocodificacao"):
+            st.warning(st.session_state.msg_geocodificacao)
+            st.session_state.msg_geocodificacao = None
+
         m = folium.Map(
             location=[st.session_state.lat_input, st.session_state.lon_input],
             zoom_start=19,
@@ -177,13 +309,14 @@ with tab1:
             icon=folium.Icon(color="red", icon="bus", prefix="fa")
         ).add_to(m)
 
-        out = st_folium(
-            m,
-            height=420,
-            use_container_width=True,
-            key="mapa_cadastro",
-            returned_objects=["last_clicked"]
-        )
+        with etapa("mapa.st_folium"):
+            out = st_folium(
+                m,
+                height=420,
+                use_container_width=True,
+                key="mapa_cadastro",
+                returned_objects=["last_clicked"]
+            )
 
         if out and out.get("last_clicked"):
             lat = out["last_clicked"]["lat"]
@@ -192,18 +325,35 @@ with tab1:
             if lat != st.session_state.lat_input:
                 st.session_state.lat_input = lat
                 st.session_state.lon_input = lon
-                try:
-                    rev = geolocator.reverse(f"{lat}, {lon}", timeout=5)
-                    if rev:
-                        dados = extrair_endereco(rev.raw.get("address", {}))
-                        st.session_state.form_data["rua"] = normalizar_texto(dados["rua"])
-                        st.session_state.form_data["bairro"] = normalizar_texto(dados["bairro"])
-                        st.session_state.form_data["num"] = dados["num"]
-                        st.session_state.form_data["cep"] = dados["cep"]
-                except:
-                    pass
+                dados, origem = geocodificacao.reverter(lat, lon, cache_paradas.indice)
+                if dados:
+                    st.session_state.form_data["rua"] = normalizar_texto(dados["rua"])
+                    st.session_state.form_data["bairro"] = normalizar_texto(dados["bairro"])
+                    st.session_state.form_data["num"] = dados["num"]
+                    st.session_state.form_data["cep"] = dados["cep"]
+                elif origem == "limitado":
+                    st.session_state.msg_geocodificacao = "Muitas consultas de endereço seguidas. Clique novamente em instantes."
+                elif origem == "falha":
+                    st.session_state.msg_geocodificacao = "Não foi possível buscar o endereço deste ponto. Preencha manualmente."
                 st.rerun()
 
+        est = geocodificacao.estatisticas
+        consultas = sum(est.values())
+        if consultas:
+            locais = est["cache"] + est["parada"]
+            st.caption(
+                f"🔁 Endereços: {locais}/{consultas} sem rede "
+                f"(cache {est['cache']} · paradas próximas {est['parada']} · "
+                f"Nominatim {est['rede']} · limitados {est['limitado']} · falhas {est['falha']})"
+            )
+
+        proximas = cache_paradas.indice.vizinhos(
+            st.session_state.lat_input, st.session_state.lon_input, RAIO_DUPLICATA
+        )
+        if proximas:
+            st.warning(f"⚠️ {len(proximas)} parada(s) já cadastrada(s) a menos de {RAIO_DUPLICATA} m deste ponto.")
+            st.dataframe(tabela_proximas(proximas), use_container_width=True, hide_index=True)
+
     render_mapa_cadastro()
     st.divider()
 
@@ -212,117 +362,200 @@ with tab1:
 
         with col1:
             st.markdown("#### 📍 Endereço")
-            id_p = st.text_input("Número da Parada (opcional)", st.session_state.form_data["id"])
-            rua_p = st.text_input("Rua*", st.session_state.form_data["rua"])
-            num_p = st.text_input("Número (opcional)", st.session_state.form_data["num"])
-            bairro_p = st.text_input("Bairro*", st.session_state.form_data["bairro"])
-            cep_p = st.text_input("CEP (opcional)", st.session_state.form_data["cep"])
+            id_p = campo_limitado("Número da Parada (opcional)", st.session_state.form_data["id"], "numero_parada")
+            rua_p = campo_limitado("Rua*", st.session_state.form_data["rua"], "rua")
+            num_p = campo_limitado("Número (opcional)", st.session_state.form_data["num"], "numero_localizacao")
+            bairro_p = campo_limitado("Bairro*", st.session_state.form_data["bairro"], "bairro")
+            cep_p = campo_limitado("CEP (opcional)", st.session_state.form_data["cep"], "cep")
             ref_p = st.text_area("Ponto de Referência*")
 
         with col2:
             st.markdown("#### 🏗️ Técnica")
             tipo_p = st.selectbox(
                 "Tipo*",
-                ["Placa", "Abrigo", "Abrigo + Placa", "Sem Identificação"]
+                TIPOS_PARADA
             )
 
-            sentido_p = st.selectbox("Sentido*", ["PC1 - PC2", "PC2 - PC1"])
+            sentido_p = st.selectbox("Sentido*", SENTIDOS_PARADA)
             st.write(f"📌 Lat: {st.session_state.lat_input:.6f}")
             st.write(f"📌 Lon: {st.session_state.lon_input:.6f}")
             foto = st.file_uploader("Foto", type=["jpg", "jpeg", "png"])
+            ignorar_proximas = st.checkbox("Salvar mesmo havendo parada próxima")
 
         submit = st.form_submit_button("💾 SALVAR REGISTRO", type="primary", use_container_width=True)
 
         if submit:
+            proximas = cache_paradas.indice.vizinhos(
+                st.session_state.lat_input, st.session_state.lon_input, RAIO_DUPLICATA
+            )
+
             if not rua_p or not bairro_p or not ref_p or not tipo_p or not sentido_p:
                 st.error("⚠️ Campos obrigatórios não preenchidos.")
+            elif proximas and not ignorar_proximas:
+                st.error(
+                    f"⚠️ Já existe parada a menos de {RAIO_DUPLICATA} m. Confira abaixo "
+                    "ou marque \"Salvar mesmo havendo parada próxima\"."
+                )
+                st.dataframe(tabela_proximas(proximas), use_container_width=True, hide_index=True)
             else:
                 try:
-                    nova = Parada(
-                        numero_parada=id_p if id_p.strip() else None,
-                        rua=rua_p,
-                        numero_localizacao=num_p if num_p.strip() else None,
-                        bairro=bairro_p,
-                        cep=cep_p if cep_p.strip() else None,
-                        ponto_referencia=ref_p,
-                        sentido=sentido_p,
-                        tipo=tipo_p,
-                        latitude=st.session_state.lat_input,
-                        longitude=st.session_state.lon_input,
-                        
+                    chave = fila_captura.enfileirar(
+                        {
+                            "numero_parada": id_p.strip() or None,
+                            "rua": rua_p,
+                            "numero_localizacao": num_p.strip() or None,
+                            "bairro": bairro_p,
+                            "cep": cep_p.strip() or None,
+                            "ponto_referencia": ref_p,
+                            "sentido": sentido_p,
+                            "tipo": tipo_p,
+                            "latitude": st.session_state.lat_input,
+                            "longitude": st.session_state.lon_input,
+                        },
+                        foto.getvalue() if foto else None,
+                        foto.name if foto else None,
+                        foto.type if foto else None
                     )
-
-                    db.add(nova)
-                    db.commit()
-                    if foto:
-                        url_foto = upload_foto_r2(foto, nova.id)
-                        nova.foto_url = url_foto
-                        db.commit()
-                    st.success("✅ Parada cadastrada com sucesso!")
+                    st.session_state.capturas.append(chave)
+                    st.success("✅ Parada registrada! A gravação no banco segue em segundo plano.")
                     st.balloons()
                 except Exception as e:
-                    db.rollback()
                     st.error(f"Erro ao salvar: {e}")
 
+    ROTULOS_ENVIO = {
+        "enviando": "⏳ enviando",
+        "concluido": "✅ enviada",
+        "erro": "❌ falhou",
+        "descartada": "⚪ descartada",
+    }
+
+    ROTULOS_CAPTURA = {
+        "pendente": "⏳ aguardando gravação",
+        "gravada": "✅ gravada",
+        "erro": "❌ recusada",
+    }
+
+    def coletar_capturas():
+        linhas, pendente = [], False
+        for chave in reversed(st.session_state.capturas[-5:]):
+            captura = fila_captura.situacao(chave)
+            if captura is None:
+                continue
+            if captura["estado"] == "pendente" or captura["foto_estado"] in ("aguardando", "enviando"):
+                pendente = True
+            linha = ROTULOS_CAPTURA.get(captura["estado"], captura["estado"])
+            if captura["parada_id"]:
+                linha = f"Parada #{captura['parada_id']}: {linha}"
+            if captura["estado"] == "erro":
+                linha += f" — {captura['erro']}"
+            if captura["foto_estado"]:
+                linha += f" • foto: {captura['foto_estado']}"
+            linhas.append(linha)
+        return linhas, pendente
+
+    def coletar_envios():
+        linhas, pendente = [], False
+        for pid in reversed(st.session_state.envios[-5:]):
+            situacao = envios_fotos.situacao(pid)
+            if situacao is None:
+                continue
+            estado, detalhe = situacao
+            if estado == "enviando":
+                pendente = True
+            linha = f"Parada #{pid}: {ROTULOS_ENVIO.get(estado, estado)}"
+            if estado == "erro":
+                linha += f" — {detalhe}"
+            linhas.append(linha)
+        return linhas, pendente
+
+    def render_status(titulo, linhas):
+        st.markdown(titulo)
+        for linha in linhas:
+            st.caption(linha)
+
+    # O fragmento com run_every só é usado enquanto há algo pendente: quando
+    # o último registro ou envio termina, um rerun completo redesenha a lista
+    # sem ele e a sessão para de consultar a cada 3 s
+    @st.fragment(run_every=3)
+    def acompanhar_status(titulo, coletar):
+        linhas, pendente = coletar()
+        render_status(titulo, linhas)
+        if not pendente:
+            st.rerun()
+
+    for titulo, lista, coletar in (
+        ("#### 🗂️ Registros desta sessão", st.session_state.capturas, coletar_capturas),
+        ("#### 📤 Envio de Fotos", st.session_state.envios, coletar_envios),
+    ):
+        if not lista:
+            continue
+        linhas, pendente = coletar()
+        if pendente:
+            acompanhar_status(titulo, coletar)
+        else:
+            render_status(titulo, linhas)
+
 # ==================================================
 # ================= ABA 2 - VISUALIZAÇÃO ============
 # ==================================================
-@st.cache_data(ttl=30)
-def carregar_paradas():
-    return db.query(Parada).order_by(Parada.data_cadastro.desc()).all()
-
-with tab2:
+if aba == ABAS[1]:
     st.subheader("📊 Inventário de Paradas")
 
-    todas = carregar_paradas()
+    if not df_paradas.empty:
+        df = df_paradas
 
-    if todas:
-        df = pd.DataFrame([{
-            "ID": p.numero_parada or "Sem identificação",
-            "Rua": normalizar_texto(p.rua),
-            "Bairro": normalizar_texto(p.bairro),
-            "Ponto de Referência": p.ponto_referencia,
-            "Tipo": p.tipo,
-            "Sentido": p.sentido,
-            "LAT": float(p.latitude),
-            "LON": float(p.longitude)
-        } for p in todas])
+        indice_texto = obter_indice_texto(versao_dados, df)
 
         st.markdown("### 🔎 Filtros")
-        c1, c2 = st.columns(2)
+        c1, c2, c3 = st.columns(3)
 
         with c1:
             filtro_bairro = st.multiselect(
                 "Bairro",
-                sorted(df["Bairro"].dropna().unique())
+                sorted(df["Bairro"].cat.categories)
             )
 
         with c2:
-            filtro_rua = st.text_input("Rua")
-
-        df_f = df.copy()
+            filtro_rua = st.text_input("Rua", placeholder="ex.: sao jose")
 
-        if filtro_bairro:
-            df_f = df_f[df_f["Bairro"].isin(filtro_bairro)]
+        with c3:
+            filtro_ponto = st.text_input("Ponto de Referência")
 
-        if filtro_rua:
-            df_f = df_f[df_f["Rua"].str.contains(filtro_rua, case=False, na=False)]
+        # interseção de conjuntos no índice em vez de regex linha a linha
+        df_f = indice_texto.filtrar(df, filtro_bairro, filtro_rua, filtro_ponto)
 
         @st.fragment
-        def render_mapa_view(df_map):
-            m = folium.Map(
-                location=[df_map["LAT"].mean(), df_map["LON"].mean()],
-                zoom_start=14
+        def render_mapa_view(df_map, filtro):
+            # o viewport salvo só vale para o mesmo filtro
+            estado = st.session_state.get("viewport_mapa") or {}
+            viewport = estado.get("viewport") if estado.get("filtro") == filtro else None
+
+            plano = obter_cache_mapas().obter(
+                (versao_dados, filtro, viewport, LIMITE_MARCADORES),
+                lambda: planejar_mapa_view(df_map, viewport, LIMITE_MARCADORES)
             )
-            for _, r in df_map.iterrows():
-                folium.Marker(
-                    [r["LAT"], r["LON"]],
-                    popup=f"Parada {r['ID']}"
-                ).add_to(m)
+            m, camada = montar_mapa_view(plano)
+
+            with etapa("mapa.st_folium"):
+                out = st_folium(
+                    m,
+                    height=550,
+                    use_container_width=True,
+                    key="mapa_view",
+                    feature_group_to_add=camada,
+                    returned_objects=["bounds", "zoom"]
+                )
 
-            st_folium(m, height=550, use_container_width=True, key="mapa_view")
+            novo = viewport_de(out)
+            if estado.get("filtro") != filtro:
+                # primeira renderização deste filtro: o componente ainda
+                # devolve a área vista com o filtro anterior
+                st.session_state.viewport_mapa = {"filtro": filtro, "viewport": None}
+            elif novo and novo != viewport:
+                st.session_state.viewport_mapa = {"filtro": filtro, "viewport": novo}
+                st.rerun(scope="fragment")
 
-        render_mapa_view(df_f)
+        render_mapa_view(df_f, (tuple(filtro_bairro), filtro_rua, filtro_ponto))
         st.dataframe(
             df_f[[
                 "ID",
@@ -335,44 +568,90 @@ with tab2:
             use_container_width=True
         )
 
+        # ---------- EXPORTAÇÃO ----------
+        # o arquivo é gerado em disco, lote a lote, só quando solicitado
+        st.markdown("### 📥 Exportar")
+        e1, e2 = st.columns([1, 2])
+
+        with e1:
+            formato_exp = st.selectbox("Formato", FORMATOS, format_func=str.upper)
+
+        with e2:
+            st.write("")
+            if st.button("Gerar arquivo com os filtros atuais", use_container_width=True):
+                anterior = st.session_state.get("exportacao")
+                if anterior and os.path.exists(anterior["caminho"]):
+                    os.remove(anterior["caminho"])
+                os.makedirs(PASTA_EXPORTACOES, exist_ok=True)
+                descartar_exportacoes_antigas()
+                caminho = None
+                try:
+                    with tempfile.NamedTemporaryFile(
+                        dir=PASTA_EXPORTACOES, suffix=f".{formato_exp}", delete=False
+                    ) as arquivo, engine.connect() as conn:
+                        caminho = arquivo.name
+                        total = exportar(
+                            conn, arquivo, formato_exp, filtro_bairro, filtro_rua, ponto=filtro_ponto
+                        )
+                    st.session_state.exportacao = {
+                        "caminho": caminho, "formato": formato_exp, "total": total
+                    }
+                except Exception as e:
+                    if caminho and os.path.exists(caminho):
+                        os.remove(caminho)
+                    st.session_state.exportacao = None
+                    st.error(f"Erro ao exportar: {e}")
+
+        exportacao = st.session_state.get("exportacao")
+        if exportacao and os.path.exists(exportacao["caminho"]):
+            with open(exportacao["caminho"], "rb") as arquivo:
+                st.download_button(
+                    f"⬇️ Baixar {exportacao['total']} paradas ({exportacao['formato'].upper()})",
+                    arquivo,
+                    file_name=f"paradas.{exportacao['formato']}",
+                    mime=TIPOS_MIME[exportacao["formato"]],
+                    use_container_width=True
+                )
+
     else:
         st.info("Nenhuma parada cadastrada.")
 
 # ==================================================
 # ================= ABA 3 - DASHBOARD ===============
 # ==================================================
-with tab3:
+if aba == ABAS[2]:
     st.subheader("📊 Dashboard e Quantitativos")
 
-    todas = carregar_paradas()
+    resumo = carregar_resumo(versao_dados)
+    total = int(resumo.loc[resumo["Dimensao"] == "total", "Quantidade"].sum())
 
-    if not todas:
+    if not total:
         st.info("Nenhuma parada cadastrada ainda.")
     else:
-        df = pd.DataFrame([{
-            "Rua": normalizar_texto(p.rua),
-            "Bairro": normalizar_texto(p.bairro),
-            "Tipo": p.tipo
-        } for p in todas])
+        def contagens(dimensao, coluna):
+            return (
+                resumo.loc[resumo["Dimensao"] == dimensao, ["Valor", "Quantidade"]]
+                .sort_values("Quantidade", ascending=False, kind="stable")
+                .rename(columns={"Valor": coluna})
+                .reset_index(drop=True)
+            )
+
+        bairro_counts = contagens("bairro", "Bairro")
+        ruas_counts = contagens("rua", "Rua/Avenida")
+        tipo_counts = contagens("tipo", "Tipo")
+        tipo_counts = tipo_counts[tipo_counts["Tipo"] != ""]
 
         # ================= INDICADORES =================
         c1, c2, c3 = st.columns(3)
-        c1.metric("🚌 Total de Paradas", len(df))
-        c2.metric("🏘️ Bairros Atendidos", df["Bairro"].nunique())
-        c3.metric("🛣️ Ruas / Avenidas", df["Rua"].nunique())
+        c1.metric("🚌 Total de Paradas", total)
+        c2.metric("🏘️ Bairros Atendidos", len(bairro_counts))
+        c3.metric("🛣️ Ruas / Avenidas", len(ruas_counts))
 
         st.divider()
 
         # ================= PARADAS POR BAIRRO (DONUT) =================
         st.markdown("### 📍 Paradas por Bairro")
 
-        bairro_counts = (
-            df["Bairro"]
-            .value_counts()
-            .reset_index()
-        )
-        bairro_counts.columns = ["Bairro", "Quantidade"]
-
         donut_spec = {
             "data": {"values": bairro_counts.to_dict(orient="records")},
             "mark": {"type": "arc", "innerRadius": 70},
@@ -393,13 +672,7 @@ with tab3:
         # ================= TOP 10 RUAS =================
         st.markdown("### 🏆 Top 10 Ruas/Avenidas com Mais Paradas")
 
-        top_ruas = (
-            df["Rua"]
-            .value_counts()
-            .head(10)
-            .reset_index()
-        )
-        top_ruas.columns = ["Rua/Avenida", "Quantidade"]
+        top_ruas = ruas_counts.head(10)
 
         max_qtd = top_ruas["Quantidade"].max()
 
@@ -412,181 +685,317 @@ with tab3:
         # ================= TIPO DE PARADA =================
         st.markdown("### 🏗️ Tipologia das Paradas")
 
-        tipo_counts = (
-            df["Tipo"]
-            .value_counts()
-            .reset_index()
-        )
-        tipo_counts.columns = ["Tipo", "Quantidade"]
-
         st.bar_chart(
             tipo_counts.set_index("Tipo")
         )
 
-# ==================================================
-# ================= ABA 4 - EDITAR / EXCLUIR ========
-# ==================================================
-with tab4:
-    st.subheader("✏️ Editar ou Excluir Parada")
-
-    if st.session_state.msg_sucesso:
-        st.success(st.session_state.msg_sucesso)
-        st.session_state.msg_sucesso = None
-
+        analise = carregar_analise(versao_dados, df_paradas)
 
-    todas = carregar_paradas()
+        st.divider()
 
-    if not todas:
-        st.info("Nenhuma parada cadastrada.")
-    else:
-        df_sel = pd.DataFrame([{
-            "ID_DB": p.id,
-            "ID Parada": p.numero_parada or "Sem identificação",
-            "Rua": p.rua,
-            "Bairro": p.bairro
-        } for p in todas])
-
-        escolha = st.selectbox(
-            "Selecione a parada",
-            df_sel.index,
-            format_func=lambda i: f"{df_sel.loc[i,'ID Parada']} — {df_sel.loc[i,'Rua']} ({df_sel.loc[i,'Bairro']})"
+        # ================= ESPAÇAMENTO POR RUA =================
+        st.markdown("### 📏 Espaçamento entre Paradas por Rua e Sentido")
+        st.caption(
+            "Distância entre paradas consecutivas da mesma rua e sentido. "
+            f"Trechos acima de {ESPACAMENTO_MAXIMO} m indicam possível falta de parada."
         )
 
-        parada_id = int(df_sel.loc[escolha, "ID_DB"])
-        parada = db.get(Parada, parada_id)
+        ruas_espacamento = analise["ruas"]
+        trechos_longos = ruas_espacamento.columns[-1]
+        e1, e2 = st.columns(2)
+        e1.metric("Ruas/sentidos com 2+ paradas", len(ruas_espacamento))
+        e2.metric(f"Trechos > {ESPACAMENTO_MAXIMO} m", int(ruas_espacamento[trechos_longos].sum()))
+        st.dataframe(ruas_espacamento.head(50), use_container_width=True, hide_index=True)
 
         st.divider()
 
-        # ---------- FORMULÁRIO DE EDIÇÃO ----------
-        with st.form("editar_parada"):
-            col1, col2 = st.columns(2)
-
-            with col1:
-                st.markdown("#### 📍 Endereço")
-                id_p = st.text_input(
-                    "Número da Parada (opcional)",
-                    parada.numero_parada or ""
-                )
-                rua_p = st.text_input("Rua*", parada.rua)
-                num_p = st.text_input(
-                    "Número (opcional)",
-                    parada.numero_localizacao or ""
-                )
-                bairro_p = st.text_input("Bairro*", parada.bairro)
-                cep_p = st.text_input("CEP (opcional)", parada.cep or "")
-                ref_p = st.text_area(
-                    "Ponto de Referência*",
-                    parada.ponto_referencia or ""
-                )
+        # ================= COBERTURA POR BAIRRO =================
+        st.markdown("### 🧭 Cobertura por Bairro")
+        st.caption(
+            f"Área atendida em células de {LADO_CELULA_LACUNA} m. Lacuna: célula sem parada "
+            f"cercada de células com parada. Isolada: parada sem outra a menos de {RAIO_ISOLAMENTO} m."
+        )
+        st.dataframe(analise["bairros"], use_container_width=True, hide_index=True)
 
-            with col2:
-                st.markdown("#### 🏗️ Técnica")
-                tipo_p = st.selectbox(
-                    "Tipo*",
-                    ["Placa", "Abrigo", "Abrigo + Placa", "Sem Identificação"],
-                    index=["Placa", "Abrigo", "Abrigo + Placa", "Sem Identificação"].index(parada.tipo)
-                )
-                sentido_p = st.selectbox(
-                    "Sentido*",
-                    ["PC1 - PC2", "PC2 - PC1"],
-                    index=["PC1 - PC2", "PC2 - PC1"].index(parada.sentido)
+        # ================= MAPA DE LACUNAS =================
+        st.markdown("### 🔥 Mapa de Lacunas e Paradas Isoladas")
+        if analise["lacunas"].empty and analise["isoladas"].empty:
+            st.success("Nenhuma lacuna de cobertura ou parada isolada encontrada.")
+        else:
+            st_folium(
+                montar_mapa_lacunas(df_paradas.dropna(subset=["LAT", "LON"]), analise["lacunas"], analise["isoladas"]),
+                height=450,
+                use_container_width=True,
+                key="mapa_lacunas",
+                returned_objects=[]
+            )
+            if not analise["isoladas"].empty:
+                st.dataframe(
+                    analise["isoladas"].drop(columns=["ID_DB", "LAT", "LON"]),
+                    use_container_width=True,
+                    hide_index=True
                 )
 
-                st.write(f"📌 Lat: {float(parada.latitude):.6f}")
-                st.write(f"📌 Lon: {float(parada.longitude):.6f}")
-
-                st.markdown("#### 📷 Foto")
+# ==================================================
+# ================= ABA 4 - EDITAR / EXCLUIR ========
+# ==================================================
+if aba == ABAS[3]:
+    st.subheader("✏️ Editar ou Excluir Parada")
 
-                if parada.foto_url and parada.foto_url.startswith("http"):
-                    st.image(
-                        parada.foto_url,
-                        caption="Foto atual da parada",
-                        use_container_width=True
-                    )
-                else:
-                    st.info("Esta parada ainda não possui foto válida.")
-                
-                foto_nova = st.file_uploader(
-                    "Adicionar / Alterar foto",
-                    type=["jpg", "jpeg", "png"]
-                )
+    if st.session_state.msg_sucesso:
+        st.success(st.session_state.msg_sucesso)
+        st.session_state.msg_sucesso = None
 
 
-            salvar = st.form_submit_button(
-                "💾 SALVAR ALTERAÇÕES",
-                type="primary",
-                use_container_width=True
+    # sessão curta, só desta execução; devolvida ao pool mesmo em st.rerun()
+    with FabricaSessao() as db:
+        if df_paradas.empty:
+            st.info("Nenhuma parada cadastrada.")
+        else:
+            # busca no banco (índice em texto_busca), só uma página de opções por vez
+            busca = st.text_input(
+                "Buscar parada",
+                placeholder="Número, rua ou bairro — acentos e maiúsculas são ignorados",
+                key="busca_edicao"
             )
 
-            if salvar:
-                if not rua_p or not bairro_p or not ref_p:
-                    st.error("⚠️ Preencha todos os campos obrigatórios.")
-                else:
-                    try:
-                        parada.numero_parada = id_p.strip() if id_p.strip() else None
-                        parada.rua = rua_p.strip()
-                        parada.numero_localizacao = num_p.strip() if num_p.strip() else None
-                        parada.bairro = bairro_p.strip()
-                        parada.cep = cep_p.strip() if cep_p.strip() else None
-                        parada.ponto_referencia = ref_p.strip()
-                        parada.tipo = tipo_p
-                        parada.sentido = sentido_p
-
-                        # Salva apenas o caminho/nome (ideal p/ outro banco ou storage)
-                        if foto_nova:
-                            url_foto = upload_foto_r2(foto_nova, parada.id)
-                            parada.foto_url = url_foto
-
-
-                        db.commit()
-                        st.session_state.msg_sucesso = "✅ Parada atualizada com sucesso!"
-                        st.cache_data.clear()
-                        st.rerun()
-
-                    except Exception as e:
-                        db.rollback()
-                        st.error(f"Erro ao atualizar: {e}")
+            paginacao = st.session_state.paginacao_edicao
+            if paginacao["termo"] != busca:
+                paginacao["termo"] = busca
+                paginacao["cursores"] = [None]
 
-        st.divider()
-
-        # ---------- EXCLUSÃO ----------
-        st.markdown("### 🗑️ Excluir Parada")
-        st.warning("⚠️ Esta ação não pode ser desfeita.")
+            resultados, ha_mais = buscar_paradas(db, busca, apos_id=paginacao["cursores"][-1])
+            rotulos = {
+                r.id: f"{r.numero_parada or 'Sem identificação'} — {normalizar_texto(r.rua)} ({normalizar_texto(r.bairro)})"
+                for r in resultados
+            }
 
-        confirmar = st.checkbox("Confirmo que desejo excluir esta parada")
+            parada = None
+            if rotulos:
+                parada_id = st.selectbox(
+                    "Selecione a parada",
+                    list(rotulos),
+                    format_func=rotulos.get
+                )
 
-        if st.button("❌ EXCLUIR PARADA", use_container_width=True):
-            if not confirmar:
-                st.error("Marque a confirmação para excluir.")
-            else:
-                try:
-                    db.delete(parada)
-                    db.commit()
-                    st.session_state.msg_sucesso = "🗑️ Parada excluída com sucesso!"
-                    st.cache_data.clear()
+                col_ant, col_pag, col_prox = st.columns([1, 2, 1])
+                if col_ant.button("◀ Anteriores", disabled=len(paginacao["cursores"]) == 1):
+                    paginacao["cursores"].pop()
+                    st.rerun()
+                col_pag.caption(f"Página {len(paginacao['cursores'])}")
+                if col_prox.button("Próximas ▶", disabled=not ha_mais):
+                    paginacao["cursores"].append(resultados[-1].id)
                     st.rerun()
 
-                except Exception as e:
-                    db.rollback()
-                    st.error(f"Erro ao excluir: {e}")
-
-db.close()
-
-
-
-
-
-
-
-
-
-
+                # registro completo só da parada escolhida
+                parada = db.get(Parada, parada_id)
 
+            if parada is None:
+                st.info("Nenhuma parada encontrada para esta busca.")
+            else:
+                st.divider()
+
+                # ---------- FORMULÁRIO DE EDIÇÃO ----------
+                with st.form("editar_parada"):
+                    col1, col2 = st.columns(2)
+
+                    with col1:
+                        st.markdown("#### 📍 Endereço")
+                        id_p = campo_limitado(
+                            "Número da Parada (opcional)",
+                            parada.numero_parada, "numero_parada"
+                        )
+                        rua_p = campo_limitado("Rua*", parada.rua, "rua")
+                        num_p = campo_limitado(
+                            "Número (opcional)",
+                            parada.numero_localizacao, "numero_localizacao"
+                        )
+                        bairro_p = campo_limitado("Bairro*", parada.bairro, "bairro")
+                        cep_p = campo_limitado("CEP (opcional)", parada.cep, "cep")
+                        ref_p = st.text_area(
+                            "Ponto de Referência*",
+                            parada.ponto_referencia or ""
+                        )
+
+                    with col2:
+                        st.markdown("#### 🏗️ Técnica")
+                        tipo_p = st.selectbox(
+                            "Tipo*",
+                            TIPOS_PARADA,
+                            index=TIPOS_PARADA.index(parada.tipo)
+                        )
+                        sentido_p = st.selectbox(
+                            "Sentido*",
+                            SENTIDOS_PARADA,
+                            index=SENTIDOS_PARADA.index(parada.sentido)
+                        )
+
+                        st.write(f"📌 Lat: {float(parada.latitude):.6f}")
+                        st.write(f"📌 Lon: {float(parada.longitude):.6f}")
+
+                        st.markdown("#### 📷 Foto")
+
+                        envio = envios_fotos.situacao(parada.id)
+                        if envio and envio[0] == "enviando":
+                            st.info("⏳ Nova foto em envio; ela aparece aqui ao terminar.")
+                        elif envio and envio[0] == "erro":
+                            st.error(f"Falha no envio da última foto: {envio[1]}")
+
+                        if parada.foto_url and parada.foto_url.startswith("http"):
+                            st.image(
+                                envios_fotos.url_exibicao(parada.foto_url),
+                                caption="Foto atual da parada",
+                                use_container_width=True
+                            )
+                            st.markdown(
+                                f"[🔍 Abrir foto em tamanho real]({envios_fotos.url_tamanho_real(parada.foto_url)})"
+                            )
+                        else:
+                            st.info("Esta parada ainda não possui foto válida.")
+                
+                        foto_nova = st.file_uploader(
+                            "Adicionar / Alterar foto",
+                            type=["jpg", "jpeg", "png"]
+                        )
 
 
+                    salvar = st.form_submit_button(
+                        "💾 SALVAR ALTERAÇÕES",
+                        type="primary",
+                        use_container_width=True
+                    )
 
+                    if salvar:
+                        if not rua_p or not bairro_p or not ref_p:
+                            st.error("⚠️ Preencha todos os campos obrigatórios.")
+                        else:
+                            try:
+                                parada.numero_parada = id_p.strip() if id_p.strip() else None
+                                parada.rua = rua_p.strip()
+                                parada.numero_localizacao = num_p.strip() if num_p.strip() else None
+                                parada.bairro = bairro_p.strip()
+                                parada.cep = cep_p.strip() if cep_p.strip() else None
+                                parada.ponto_referencia = ref_p.strip()
+                                parada.tipo = tipo_p
+                                parada.sentido = sentido_p
+
+                                db.commit()
+                                cache_paradas.aplicar_gravacao(parada)
+
+                                # a URL da foto é gravada pelo envio em segundo plano
+                                if foto_nova:
+                                    envios_fotos.enviar(parada.id, foto_nova.getvalue(), foto_nova.name, foto_nova.type)
+                                    st.session_state.envios.append(parada.id)
+
+                                st.session_state.msg_sucesso = "✅ Parada atualizada com sucesso!"
+                                st.rerun()
+
+                            except Exception as e:
+                                db.rollback()
+                                st.error(f"Erro ao atualizar: {e}")
+
+                st.divider()
+
+                # ---------- EXCLUSÃO ----------
+                st.markdown("### 🗑️ Excluir Parada")
+                st.warning("⚠️ Esta ação não pode ser desfeita.")
+
+                confirmar = st.checkbox("Confirmo que desejo excluir esta parada")
+
+                if st.button("❌ EXCLUIR PARADA", use_container_width=True):
+                    if not confirmar:
+                        st.error("Marque a confirmação para excluir.")
+                    else:
+                        try:
+                            db.delete(parada)
+                            db.commit()
+                            cache_paradas.aplicar_exclusao(parada_id)
+                            st.session_state.msg_sucesso = "🗑️ Parada excluída com sucesso!"
+                            st.rerun()
+
+                        except Exception as e:
+                            db.rollback()
+                            st.error(f"Erro ao excluir: {e}")
+
+            st.divider()
+
+            # ---------- DUPLICATAS ----------
+            st.markdown("### 🔍 Possíveis Duplicatas")
+            st.caption(f"Paradas a menos de {RAIO_DUPLICATA} m umas das outras.")
+
+            if st.button("Procurar duplicatas no inventário", use_container_width=True):
+                grupos = cache_paradas.indice.grupos_duplicados(RAIO_DUPLICATA)
+                if grupos:
+                    st.warning(f"{len(grupos)} grupo(s) de paradas suspeitas.")
+                    st.dataframe(tabela_duplicatas(grupos), use_container_width=True, hide_index=True)
+                else:
+                    st.success("Nenhuma duplicata suspeita encontrada.")
 
+# ==================================================
+# ================= DESEMPENHO ======================
+# ==================================================
+execucao = RASTREADOR.finalizar_execucao(aba)
+if EXECUCOES_ARQUIVO:
+    try:
+        RASTREADOR.registrar_json(execucao, EXECUCOES_ARQUIVO)
+    except OSError as e:
+        log.warning("Não foi possível gravar %s: %s", EXECUCOES_ARQUIVO, e)
+if METRICAS_ARQUIVO:
+    try:
+        RASTREADOR.gravar_prometheus(METRICAS_ARQUIVO)
+    except OSError as e:
+        log.warning("Não foi possível gravar %s: %s", METRICAS_ARQUIVO, e)
+
+if MODO_ADMIN:
+    with st.sidebar:
+        st.markdown("### ⏱️ Desempenho")
+        if execucao:
+            st.metric("Esta execução", f"{execucao['ms']:.0f} ms")
+            st.caption(
+                f"{execucao['consultas']} consultas SQL • {execucao['linhas']} linhas • "
+                f"{execucao['ms_sql']:.0f} ms no banco"
+            )
 
+        st.markdown("#### Etapas (percentis)")
+        st.dataframe(RASTREADOR.resumo(), use_container_width=True, hide_index=True)
 
+        st.markdown("#### Últimas execuções")
+        st.dataframe(
+            [
+                {k: v for k, v in e.items() if k != "etapas"}
+                for e in reversed(RASTREADOR.ultimas_execucoes())
+            ],
+            use_container_width=True,
+            hide_index=True
+        )
 
+        fila = fila_captura.contagens()
+        st.markdown("#### Fila de cadastro")
+        st.caption(
+            f"{fila.get('pendente', 0)} pendentes • {fila.get('gravada', 0)} gravadas • "
+            f"{fila.get('erro', 0)} recusadas • {fila.get('foto_erro', 0)} fotos com erro"
+        )
+        if fila.get("foto_erro"):
+            if st.button("🔁 Reenviar fotos com erro", use_container_width=True):
+                st.success(f"{fila_captura.reenviar_fotos_com_erro()} fotos de volta na fila de envio")
+        if fila.get("erro") or fila.get("foto_erro"):
+            if st.button("🗑️ Descartar recusadas e fotos com erro", use_container_width=True):
+                registros, fotos = fila_captura.descartar_erros()
+                st.success(f"{registros} registros e {fotos} fotos descartados do diário")
+
+        mapas = obter_cache_mapas().estatisticas()
+        st.markdown("#### Cache de mapas")
+        st.caption(
+            f"{mapas['entradas']}/{mapas['max_entradas']} mapas • "
+            f"~{mapas['bytes_estimados'] / 1024:.0f} KB de dados • "
+            f"acertos {mapas['taxa_acerto']:.0%} ({mapas['acertos']}/{mapas['acertos'] + mapas['faltas']}) • "
+            f"{mapas['descartes']} descartados"
+        )
 
+        st.download_button(
+            "⬇️ Métricas (Prometheus)",
+            RASTREADOR.prometheus(),
+            file_name="sip_metricas.prom",
+            mime="text/plain",
+            use_container_width=True
+        )
@@ -0,0 +1,288 @@
+import json
+import sys
+import threading
+
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+import folium
+from branca.element import Html, MacroElement, Template
+from folium.plugins import HeatMap, MarkerCluster
+
+from instrumentacao import medir
+
+
+# ================== CONFIG MAPA ==================
+# Acima deste número de pontos o mapa deixa de criar um marcador por parada
+LIMITE_MARCADORES = 500
+
+# tipo -> (cor do ícone folium, cor hex equivalente)
+CORES_TIPO = {
+    "Placa": ("blue", "#38aadd"),
+    "Abrigo": ("green", "#72b026"),
+    "Abrigo + Placa": ("purple", "#d252b9"),
+    "Sem Identificação": ("gray", "#575757"),
+}
+COR_PADRAO = ("red", "#d63e2a")
+
+# Viewport: margem em fração da área visível e zoom abaixo do qual o mapa
+# mostra contagens por célula em vez de paradas
+MARGEM_VIEWPORT = 0.25
+ZOOM_AGREGADO = 13
+
+# Mapas montados guardados por processo (versão + filtro + viewport)
+MAX_MAPAS_CACHE = 32
+
+
+# ================== CAMADA AGRUPADA ==================
+# Os pontos vão para o navegador como um único array JSON serializado pelo
+# pandas; marcadores e popups só são criados no cliente.
+def serializar_paradas(df_map):
+    df_map = df_map.dropna(subset=["LAT", "LON"])
+    tipos = df_map["Tipo"].astype("category")
+    cores = json.dumps([CORES_TIPO.get(t, COR_PADRAO)[1] for t in tipos.cat.categories])
+    dados = (
+        df_map[["LAT", "LON", "ID"]]
+        .assign(Tipo=tipos.cat.codes)
+        .to_json(orient="values")
+    )
+    return dados, cores
+
+class CamadaParadas(MarkerCluster):
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function () {
+                var dados = {{ this.dados }};
+                var cores = {{ this.cores }};
+                var cluster = L.markerClusterGroup({chunkedLoading: true});
+                var marcadores = dados.map(function (row) {
+                    var cor = cores[row[3]] || "{{ this.cor_padrao }}";
+                    var marker = L.circleMarker([row[0], row[1]], {
+                        radius: 7, weight: 1, color: cor,
+                        fillColor: cor, fillOpacity: 0.85
+                    });
+                    marker.bindPopup(function () {
+                        var el = document.createElement("div");
+                        el.textContent = "Parada " + row[2];
+                        return el;
+                    });
+                    return marker;
+                });
+                cluster.addLayers(marcadores);
+                cluster.addTo({{ this._parent.get_name() }});
+                return cluster;
+            })();
+        {% endmacro %}""")
+
+    def __init__(self, dados, cores, name=None, **kwargs):
+        super().__init__(name=name, **kwargs)
+        self._name = "CamadaParadas"
+        self.dados = dados
+        self.cores = cores
+        self.cor_padrao = COR_PADRAO[1]
+
+
+class CamadaCelulas(MacroElement):
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function () {
+                var dados = {{ this.dados }};
+                var grupo = L.layerGroup(dados.map(function (row) {
+                    var tamanho = 28 + Math.min(24, Math.round(Math.log(row[2] + 1) * 4));
+                    return L.marker([row[0], row[1]], {
+                        icon: L.divIcon({
+                            html: "<div><span>" + row[2] + "</span></div>",
+                            className: "marker-cluster marker-cluster-medium",
+                            iconSize: [tamanho, tamanho]
+                        })
+                    });
+                }));
+                grupo.addTo({{ this._parent.get_name() }});
+                return grupo;
+            })();
+        {% endmacro %}""")
+
+    def __init__(self, dados):
+        super().__init__()
+        self._name = "CamadaCelulas"
+        self.dados = dados
+
+
+# ================== VIEWPORT ==================
+def viewport_de(saida):
+    limites = (saida or {}).get("bounds") or {}
+    sw, ne = limites.get("_southWest") or {}, limites.get("_northEast") or {}
+    if sw.get("lat") is None or ne.get("lat") is None:
+        return None
+    return (
+        (round(sw["lat"], 5), round(sw["lng"], 5), round(ne["lat"], 5), round(ne["lng"], 5)),
+        saida.get("zoom")
+    )
+
+def recortar_viewport(df_map, limites, margem=MARGEM_VIEWPORT):
+    sul, oeste, norte, leste = limites
+    dlat = (norte - sul) * margem
+    dlon = (leste - oeste) * margem
+    dentro = (
+        df_map["LAT"].between(sul - dlat, norte + dlat)
+        & df_map["LON"].between(oeste - dlon, leste + dlon)
+    )
+    return df_map[dentro]
+
+def tamanho_celula_zoom(zoom):
+    # ~1/4 da largura de um tile de 256 px no zoom atual, em graus
+    return 360.0 / (2 ** zoom) / 4
+
+def agregar_celulas(df_map, zoom):
+    tamanho = tamanho_celula_zoom(zoom)
+    lat = df_map["LAT"].to_numpy()
+    lon = df_map["LON"].to_numpy()
+    grade = pd.DataFrame({
+        "i": np.floor(lat / tamanho).astype("int64"),
+        "j": np.floor(lon / tamanho).astype("int64"),
+        "LAT": lat,
+        "LON": lon,
+    })
+    return (
+        grade.groupby(["i", "j"], sort=False)
+        .agg(LAT=("LAT", "mean"), LON=("LON", "mean"), Quantidade=("LAT", "size"))
+        .reset_index(drop=True)
+    )
+
+
+# ================== MAPA DE VISUALIZAÇÃO ==================
+# O trabalho caro (recorte do viewport, agregação e serialização para JSON)
+# gera um PlanoMapa só de strings, que pode ser guardado e lido por várias
+# sessões ao mesmo tempo. Os objetos folium saem do plano a cada execução:
+# o st_folium altera o mapa ao renderizar (troca os ids, anexa a camada),
+# então um mesmo objeto nunca é entregue a duas execuções.
+#   modo "celulas":    dados = [[lat, lon, quantidade], ...]
+#   modo "agrupada":   dados = [[lat, lon, id, código do tipo], ...], cores = [hex, ...]
+#   modo "marcadores": dados = [[lat, lon, id, tipo], ...]
+PlanoMapa = namedtuple("PlanoMapa", ["centro", "modo", "dados", "cores"])
+
+@medir("mapa.planejar")
+def planejar_mapa_view(df_map, viewport=None, limite_marcadores=LIMITE_MARCADORES):
+    centro = (float(df_map["LAT"].mean()), float(df_map["LON"].mean()))
+
+    if viewport:
+        limites, zoom = viewport
+        df_map = recortar_viewport(df_map, limites)
+        if zoom is not None and zoom < ZOOM_AGREGADO and len(df_map) > limite_marcadores:
+            dados = agregar_celulas(df_map, zoom)[["LAT", "LON", "Quantidade"]].to_json(orient="values")
+            return PlanoMapa(centro, "celulas", dados, "")
+
+    if len(df_map) > limite_marcadores:
+        dados, cores = serializar_paradas(df_map)
+        return PlanoMapa(centro, "agrupada", dados, cores)
+
+    dados = df_map[["LAT", "LON", "ID", "Tipo"]].astype({"Tipo": object}).to_json(orient="values")
+    return PlanoMapa(centro, "marcadores", dados, "")
+
+def adicionar_marcadores(m, dados):
+    for lat, lon, id_p, tipo in dados:
+        # id fixo no conteúdo do popup: o st_folium não padroniza esse id e,
+        # com um aleatório por montagem, o HTML mudaria a cada execução
+        conteudo = Html(f"Parada {id_p}", script=True)
+        conteudo._id = f"parada_{id_p}"
+        folium.Marker(
+            [lat, lon],
+            popup=folium.Popup(conteudo),
+            icon=folium.Icon(color=CORES_TIPO.get(tipo, COR_PADRAO)[0])
+        ).add_to(m)
+
+def montar_mapa_base(centro):
+    m = folium.Map(location=list(centro), zoom_start=14)
+    # camada vazia só para carregar o JS/CSS do markercluster no mapa base,
+    # já que os pontos chegam numa FeatureGroup renderizada à parte
+    MarkerCluster(control=False).add_to(m)
+    return m
+
+@medir("mapa.montar")
+def montar_mapa_view(plano):
+    camada = folium.FeatureGroup(name="Paradas")
+    if plano.modo == "celulas":
+        CamadaCelulas(plano.dados).add_to(camada)
+    elif plano.modo == "agrupada":
+        CamadaParadas(plano.dados, plano.cores).add_to(camada)
+    else:
+        adicionar_marcadores(camada, json.loads(plano.dados))
+    return montar_mapa_base(plano.centro), camada
+
+
+# ================== MAPA DE COBERTURA ==================
+def montar_mapa_lacunas(df_map, lacunas, isoladas):
+    m = folium.Map(
+        location=[df_map["LAT"].mean(), df_map["LON"].mean()],
+        zoom_start=13
+    )
+    if not lacunas.empty:
+        HeatMap(
+            lacunas[["LAT", "LON", "Peso"]].to_numpy().tolist(),
+            name="Lacunas de cobertura",
+            radius=25,
+            blur=20,
+            min_opacity=0.3
+        ).add_to(m)
+    for lat, lon, id_p in zip(isoladas["LAT"], isoladas["LON"], isoladas["ID"]):
+        folium.CircleMarker(
+            [lat, lon],
+            radius=6,
+            color=COR_PADRAO[1],
+            fill=True,
+            popup=f"Parada isolada {id_p}"
+        ).add_to(m)
+    return m
+
+
+# ================== CACHE DE MAPAS ==================
+# LRU dos planos de mapa (strings imutáveis). Na mesma versão dos dados, com
+# o mesmo filtro e viewport, o plano é reaproveitado em vez de recortado,
+# agregado e serializado de novo; o st_folium padroniza os ids dos
+# elementos, então o HTML dos objetos novos montados do plano é idêntico
+# e o componente não é remontado.
+class CacheMapas:
+    def __init__(self, max_entradas=MAX_MAPAS_CACHE):
+        self.max_entradas = max_entradas
+        self.entradas = OrderedDict()
+        self.acertos = 0
+        self.faltas = 0
+        self.descartes = 0
+        self._lock = threading.Lock()
+
+    def obter(self, chave, montar):
+        with self._lock:
+            if chave in self.entradas:
+                self.entradas.move_to_end(chave)
+                self.acertos += 1
+                return self.entradas[chave][0]
+            self.faltas += 1
+
+        valor = montar()
+        tamanho = _tamanho_estimado(valor)
+
+        with self._lock:
+            self.entradas[chave] = (valor, tamanho)
+            self.entradas.move_to_end(chave)
+            while len(self.entradas) > self.max_entradas:
+                self.entradas.popitem(last=False)
+                self.descartes += 1
+        return valor
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.faltas
+            return {
+                "entradas": len(self.entradas),
+                "max_entradas": self.max_entradas,
+                "bytes_estimados": sum(t for _, t in self.entradas.values()),
+                "acertos": self.acertos,
+                "faltas": self.faltas,
+                "descartes": self.descartes,
+                "taxa_acerto": self.acertos / consultas if consultas else 0.0,
+            }
+
+def _tamanho_estimado(plano):
+    # memória das strings do plano (o grosso são os dados JSON)
+    return sys.getsizeof(plano.dados) + sys.getsizeof(plano.cores)
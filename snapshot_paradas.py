@@ -0,0 +1,91 @@
+import json
+import os
+
+from datetime import datetime
+
+import pandas as pd
+
+
+# ================== CONFIG ==================
+FORMATO_SNAPSHOT = "2"
+
+
+# ================== SNAPSHOT COLUNAR ==================
+# O inventário tipado gravado num arquivo Arrow IPC sem compressão, com a
+# marca d'água da última sincronização, o instante da gravação e a origem
+# (banco) nos metadados.
+# Lido por memory map, sem passar pelo banco. Só as colunas numéricas e de
+# data sem nulos (e os códigos das categóricas) viram arrays que apontam
+# para as páginas do arquivo, compartilhadas entre os processos pelo cache
+# de páginas. Os textos livres (ponto de referência, número da parada...)
+# são decodificados em objetos Python na memória de cada processo; para
+# eles o ganho é só não consultar o banco, não a memória.
+# O compartilhamento vale só para a partida a frio: a primeira
+# sincronização com alterações reais monta um frame novo (concat + filtro)
+# e copia todas as colunas para a memória do processo. O ganho que fica é o
+# tempo de partida, não a memória em regime.
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc  # noqa: F401
+    except ImportError:
+        raise RuntimeError("Snapshot do inventário requer o pacote pyarrow.")
+    return pa
+
+def gravar_snapshot(caminho, frame, marca, origem):
+    pa = _pyarrow()
+    tabela = pa.Table.from_pandas(frame, preserve_index=False)
+    tabela = tabela.replace_schema_metadata({
+        **(tabela.schema.metadata or {}),
+        b"sip.formato": FORMATO_SNAPSHOT.encode(),
+        b"sip.marca": pd.Timestamp(marca).isoformat().encode(),
+        b"sip.gravado_em": datetime.now().isoformat().encode(),
+        b"sip.origem": origem.encode(),
+        b"sip.colunas": json.dumps(list(frame.columns), ensure_ascii=False).encode("utf-8"),
+    })
+
+    # troca atômica: processos que já mapearam o arquivo antigo continuam
+    # lendo o inode anterior até soltá-lo
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    try:
+        with pa.OSFile(temporario, "wb") as destino:
+            with pa.ipc.new_file(destino, tabela.schema) as escritor:
+                escritor.write_table(tabela)
+        os.replace(temporario, caminho)
+    except BaseException:
+        # disco cheio, permissão...: não deixa o arquivo parcial para trás
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    return os.path.getsize(caminho)
+
+def ler_snapshot(caminho, origem, tipos):
+    # tipos: dtypes do frame esperado (colunas e ordem). Devolve
+    # (frame, marca, gravado_em) ou None se o arquivo não existe ou é de
+    # outro banco/formato
+    pa = _pyarrow()
+    if not os.path.exists(caminho):
+        return None
+
+    with pa.memory_map(caminho, "r") as fonte:
+        tabela = pa.ipc.open_file(fonte).read_all()
+
+    metadados = tabela.schema.metadata or {}
+    if (
+        metadados.get(b"sip.formato", b"").decode() != FORMATO_SNAPSHOT
+        or metadados.get(b"sip.origem", b"").decode() != origem
+        or json.loads(metadados.get(b"sip.colunas", b"[]").decode("utf-8")) != list(tipos.index)
+    ):
+        return None
+
+    frame = tabela.to_pandas(split_blocks=True)
+    # textos livres voltam como object, igual à carga pelo banco
+    for coluna, tipo in tipos.items():
+        if tipo == object and frame[coluna].dtype != object:
+            frame[coluna] = frame[coluna].astype(object)
+    return (
+        frame,
+        pd.Timestamp(metadados[b"sip.marca"].decode()).to_pydatetime(),
+        datetime.fromisoformat(metadados[b"sip.gravado_em"].decode()),
+    )
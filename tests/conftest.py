@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dados_paradas import Base, Parada, criar_engine  # noqa: E402
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = criar_engine(f"sqlite:///{tmp_path / 'paradas.db'}")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def fabrica(engine):
+    return sessionmaker(bind=engine, expire_on_commit=False)
+
+@pytest.fixture
+def criar_parada(fabrica):
+    contador = iter(range(1, 1_000_000))
+
+    def criar(**campos):
+        n = next(contador)
+        dados = {
+            "numero_parada": f"P{n}",
+            "rua": "Rua A",
+            "bairro": "Centro",
+            "ponto_referencia": "Em frente à praça",
+            "tipo": "Placa",
+            "sentido": "PC1 - PC2",
+            "latitude": -12.2664 + n * 0.001,
+            "longitude": -38.9663,
+        }
+        dados.update(campos)
+        with fabrica() as session:
+            parada = Parada(**dados)
+            session.add(parada)
+            session.commit()
+            return parada
+    return criar
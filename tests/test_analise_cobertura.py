@@ -0,0 +1,96 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from analise_cobertura import (
+    ESCALA_LON,
+    LADO_CELULA_LACUNA,
+    intervalos_consecutivos,
+    lacunas_cobertura,
+    paradas_isoladas,
+)
+from indice_espacial import METROS_POR_GRAU, haversine_m
+
+
+LAT, LON = -12.2664, -38.9663
+
+def _frame(pontos):
+    # pontos: [(lat, lon, rua, sentido, bairro), ...]
+    return pd.DataFrame({
+        "ID_DB": range(1, len(pontos) + 1),
+        "ID": [f"P{n}" for n in range(1, len(pontos) + 1)],
+        "Rua": pd.Categorical([p[2] for p in pontos]),
+        "Sentido": pd.Categorical([p[3] for p in pontos]),
+        "Bairro": pd.Categorical([p[4] for p in pontos]),
+        "LAT": [p[0] for p in pontos],
+        "LON": [p[1] for p in pontos],
+    })
+
+def _leste(metros):
+    return LON + metros / ESCALA_LON
+
+
+def test_intervalos_seguem_a_rua_e_separam_sentidos():
+    df = _frame([
+        (LAT, _leste(900), "Rua A", "PC1 - PC2", "Centro"),
+        (LAT, _leste(0), "Rua A", "PC1 - PC2", "Centro"),
+        (LAT, _leste(300), "Rua A", "PC1 - PC2", "Centro"),
+        (LAT, _leste(100), "Rua A", "PC2 - PC1", "Centro"),
+        (LAT, _leste(50), "Rua B", "PC1 - PC2", "Tomba"),
+    ])
+    intervalos = intervalos_consecutivos(df)
+
+    # só o grupo com mais de uma parada gera intervalos, na ordem ao longo da rua
+    assert list(zip(intervalos["ID_DB"], intervalos["ID_DB_SEGUINTE"])) == [(2, 3), (3, 1)]
+    esperado = [
+        haversine_m(LAT, _leste(0), LAT, _leste(300)),
+        haversine_m(LAT, _leste(300), LAT, _leste(900)),
+    ]
+    np.testing.assert_allclose(intervalos["Distancia"], esperado)
+    # a projeção local (METROS_POR_GRAU) difere do haversine em ~0,1%
+    np.testing.assert_allclose(intervalos["Distancia"], [300, 600], rtol=5e-3)
+
+def test_isolada_no_limite_do_raio():
+    df = _frame([
+        (LAT, LON, "Rua A", "PC1 - PC2", "Centro"),
+        (LAT, _leste(450), "Rua A", "PC1 - PC2", "Centro"),
+    ])
+    distancia = float(haversine_m(LAT, LON, LAT, _leste(450)))
+
+    assert paradas_isoladas(df, raio_m=distancia + 0.5).empty
+    isoladas = paradas_isoladas(df, raio_m=distancia - 0.5)
+    assert sorted(isoladas["ID_DB"]) == [1, 2]
+    assert (isoladas["Mais próxima (m)"] == round(distancia)).all()
+
+    # parada única: nada com que comparar
+    assert paradas_isoladas(df.iloc[:1]).empty
+
+def test_lacunas_quadro_vazio_e_parada_unica():
+    vazio = _frame([])
+    assert lacunas_cobertura(vazio).empty
+    assert list(lacunas_cobertura(vazio).columns) == ["LAT", "LON", "Bairro", "Vizinhas atendidas", "Peso"]
+
+    unica = _frame([(LAT, LON, "Rua A", "PC1 - PC2", "Centro")])
+    assert lacunas_cobertura(unica).empty
+
+def test_celula_vazia_cercada_e_lacuna():
+    i0 = math.floor(LAT * METROS_POR_GRAU / LADO_CELULA_LACUNA)
+    j0 = math.floor(LON * ESCALA_LON / LADO_CELULA_LACUNA)
+
+    def centro(i, j):
+        return (
+            (i + 0.5) * LADO_CELULA_LACUNA / METROS_POR_GRAU,
+            (j + 0.5) * LADO_CELULA_LACUNA / ESCALA_LON,
+        )
+
+    anel = [(i0 + di, j0 + dj) for di in (-1, 0, 1) for dj in (-1, 0, 1) if (di, dj) != (0, 0)]
+    df = _frame([(*centro(i, j), "Rua A", "PC1 - PC2", "Tomba") for i, j in anel])
+    lacunas = lacunas_cobertura(df)
+
+    # vizinhas de fora do anel têm no máximo 3 células atendidas
+    assert len(lacunas) == 1
+    lacuna = lacunas.iloc[0]
+    assert (lacuna["LAT"], lacuna["LON"]) == centro(i0, j0)
+    assert lacuna["Bairro"] == "Tomba"
+    assert lacuna["Vizinhas atendidas"] == 8 and lacuna["Peso"] == 1.0
@@ -0,0 +1,106 @@
+import gzip
+import json
+import threading
+import urllib.error
+import urllib.request
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from api_paradas import ErroRequisicao, ServicoParadas, servir
+from dados_paradas import MARGEM_SYNC
+
+
+def _json(resposta):
+    status, etag, corpo = resposta
+    return status, etag, json.loads(gzip.decompress(corpo))
+
+
+def test_paginacao_por_chave(engine, criar_parada):
+    ids = [criar_parada().id for _ in range(5)]
+    servico = ServicoParadas(engine)
+
+    vistos, apos = [], None
+    while True:
+        _, _, pagina = _json(servico.responder(f"/paradas?limite=2{'&apos=%d' % apos if apos else ''}"))
+        vistos += [f["id"] for f in pagina["features"]]
+        apos = pagina["proximo"]
+        if apos is None:
+            break
+    assert vistos == ids
+
+def test_304_sem_consultar_o_banco_mesmo_fora_do_cache(engine, criar_parada, monkeypatch):
+    # alteração mais antiga que MARGEM_SYNC: versão estável
+    criar_parada(atualizado_em=datetime.now() - 2 * MARGEM_SYNC)
+    servico = ServicoParadas(engine, max_respostas=1)
+    _, etag, _ = servico.responder("/paradas")
+    servico.responder("/paradas?limite=1")      # tira /paradas do cache
+
+    def sem_banco(*args, **kwargs):
+        raise AssertionError("consultou o banco")
+    monkeypatch.setattr(servico.engine, "connect", sem_banco)
+
+    assert servico.responder("/paradas", etag) == (304, etag, b"")
+
+def test_etag_muda_com_os_dados(engine, criar_parada):
+    criar_parada()
+    servico = ServicoParadas(engine)
+    servico.versao.validade = 0
+    _, antes, _ = servico.responder("/paradas")
+    criar_parada()
+    status, depois, dados = _json(servico.responder("/paradas", antes))
+    assert status == 200 and depois != antes and len(dados["features"]) == 2
+
+def test_linha_confirmada_depois_com_carimbo_anterior(engine, criar_parada):
+    agora = datetime.now()
+    criar_parada(atualizado_em=agora)
+    servico = ServicoParadas(engine)
+    servico.versao.validade = 0
+    _, antes, _ = servico.responder("/paradas")
+    assert servico.responder("/paradas", antes) == (304, antes, b"")
+
+    # transação lenta: carimbada antes da anterior, não muda o max()
+    criar_parada(atualizado_em=agora - timedelta(seconds=1))
+    versao_antes = servico.versao.valor
+    status, depois, dados = _json(servico.responder("/paradas", antes))
+    assert servico.versao.valor == versao_antes
+    assert status == 200 and depois != antes and len(dados["features"]) == 2
+
+def test_filtros_sem_diferenciar_caixa(engine, criar_parada):
+    centro = criar_parada(bairro="Centro", tipo="Abrigo + Placa").id
+    criar_parada(bairro="Tomba", tipo="Placa")
+    servico = ServicoParadas(engine)
+
+    for alvo in ("/paradas?bairro=centro", "/paradas?bairro=%20CENTRO", "/paradas?tipo=abrigo%2Bplaca"):
+        _, _, dados = _json(servico.responder(alvo))
+        assert [f["id"] for f in dados["features"]] == [centro], alvo
+
+    with pytest.raises(ErroRequisicao) as erro:
+        servico.responder("/paradas?tipo=poste")
+    assert erro.value.status == 400
+
+def test_http_tipos_de_conteudo(engine, criar_parada):
+    parada = criar_parada()
+    servidor = servir(engine, "127.0.0.1", 0)
+    thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{servidor.server_address[1]}"
+    try:
+        with urllib.request.urlopen(f"{base}/paradas/{parada.id}") as resposta:
+            assert resposta.headers["Content-Type"].startswith("application/geo+json")
+            etag = resposta.headers["ETag"]
+            assert json.load(resposta)["id"] == parada.id
+
+        with pytest.raises(urllib.error.HTTPError) as erro:
+            urllib.request.urlopen(urllib.request.Request(f"{base}/paradas/{parada.id}", headers={"If-None-Match": etag}))
+        assert erro.value.code == 304
+
+        with pytest.raises(urllib.error.HTTPError) as erro:
+            urllib.request.urlopen(f"{base}/paradas/999")
+        assert erro.value.code == 404
+        assert erro.value.headers["Content-Type"].startswith("application/json")
+        assert json.load(erro.value) == {"erro": "parada não encontrada"}
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
@@ -0,0 +1,103 @@
+import io
+
+import pytest
+
+import armazenamento_fotos
+from armazenamento_fotos import ConfigArmazenamento, EnviosFotos, url_miniatura, url_principal
+from dados_paradas import Parada
+
+
+@pytest.fixture
+def config(tmp_path):
+    return ConfigArmazenamento(
+        endpoint=f"file://{tmp_path / 'r2'}",
+        chave="", segredo="", bucket="fotos",
+        url_publica="https://fotos.exemplo",
+    )
+
+@pytest.fixture
+def envios(config, fabrica):
+    envios = EnviosFotos(config, fabrica, max_envios=1)
+    yield envios
+    envios.executor.shutdown(wait=True)
+
+def _jpeg():
+    Image = pytest.importorskip("PIL.Image")
+    saida = io.BytesIO()
+    Image.new("RGB", (640, 480), "red").save(saida, format="JPEG")
+    return saida.getvalue()
+
+
+def test_envio_grava_url_e_usa_miniatura(envios, fabrica, criar_parada):
+    parada = criar_parada()
+    url = envios.enviar(parada.id, _jpeg(), "foto.jpg", "image/jpeg").result()
+
+    with fabrica() as session:
+        assert session.get(Parada, parada.id).foto_url == url
+    assert envios.situacao(parada.id) == ("concluido", url)
+    assert envios.url_exibicao(url) == url_miniatura(url)
+    # o link de tamanho real vai para a principal, sem EXIF
+    assert envios.url_tamanho_real(url) == url_principal(url)
+
+def test_falha_nos_derivados_nao_impede_gravar_a_foto(envios, fabrica, criar_parada, monkeypatch):
+    def falhar(*args):
+        raise OSError("bucket indisponível")
+    monkeypatch.setattr(armazenamento_fotos, "enviar_derivados", falhar)
+
+    parada = criar_parada()
+    url = envios.enviar(parada.id, _jpeg(), "foto.jpg", "image/jpeg").result()
+
+    assert url is not None
+    with fabrica() as session:
+        assert session.get(Parada, parada.id).foto_url == url
+    # sem derivados no bucket a tela mostra e linka o original
+    assert envios.url_exibicao(url) == url
+    assert envios.url_tamanho_real(url) == url
+
+def test_foto_sem_derivados_nao_consulta_o_bucket_a_cada_execucao(envios, config, monkeypatch):
+    cliente = armazenamento_fotos.obter_cliente(config)
+    consultas = []
+    head_object = cliente.head_object
+    monkeypatch.setattr(cliente, "head_object", lambda **kw: consultas.append(kw) or head_object(**kw))
+    relogio = [0.0]
+    monkeypatch.setattr(armazenamento_fotos.time, "monotonic", lambda: relogio[0])
+
+    url = "https://fotos.exemplo/paradas/1_antiga.jpg"
+    assert envios.url_exibicao(url) == url
+    assert envios.url_tamanho_real(url) == url
+    assert len(consultas) == 1
+
+    # reprocessada depois: passada a validade do negativo, a miniatura aparece
+    cliente.put_object(Bucket="fotos", Key="paradas/1_antiga_miniatura.webp", Body=b"webp")
+    relogio[0] = armazenamento_fotos.VALIDADE_SEM_DERIVADOS + 1
+    assert envios.url_exibicao(url) == url_miniatura(url)
+    assert envios.url_exibicao(url) == url_miniatura(url)
+    assert len(consultas) == 2
+
+def test_url_fora_do_bucket_e_exibida_como_esta(envios):
+    assert envios.url_exibicao("http://outro.site/foto.jpg") == "http://outro.site/foto.jpg"
+
+def test_falha_ao_gravar_no_banco_marca_erro(config, criar_parada):
+    def fabrica_quebrada():
+        raise RuntimeError("banco fora do ar")
+
+    envios = EnviosFotos(config, fabrica_quebrada, max_envios=1)
+    try:
+        assert envios.enviar(7, b"x", "foto.jpg", "image/jpeg").result() is None
+    finally:
+        envios.executor.shutdown(wait=True)
+    estado, detalhe = envios.situacao(7)
+    assert estado == "erro" and "banco fora do ar" in detalhe
+
+def test_envios_terminados_saem_do_status(envios, monkeypatch):
+    relogio = iter([0.0, 1.0, 2.0, 2.0 + armazenamento_fotos.RETENCAO_STATUS + 1])
+    monkeypatch.setattr(armazenamento_fotos.time, "monotonic", lambda: next(relogio))
+
+    envios._marcar(1, "concluido", "url")
+    envios._marcar(2, "enviando")
+    envios._marcar(3, "erro", "falhou")
+    envios._marcar(4, "concluido", "url")
+
+    assert envios.situacao(1) is None and envios.situacao(3) is None
+    assert envios.situacao(2) == ("enviando", "")
+    assert envios.situacao(4) == ("concluido", "url")
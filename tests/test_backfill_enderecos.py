@@ -0,0 +1,61 @@
+import os
+
+from backfill_enderecos import executar, gravar_checkpoint, ler_checkpoint
+from dados_paradas import Parada, ler_resumo
+from geocodificacao import GeocodificadorLocal
+
+
+def test_checkpoint_cria_a_pasta_e_retoma(tmp_path):
+    caminho = str(tmp_path / "dados_locais" / "backfill.json")
+    assert ler_checkpoint(caminho) == {"ultimo_id": 0, "pendentes": [], "totais": {}}
+
+    gravar_checkpoint(caminho, {"ultimo_id": 42, "pendentes": [7], "totais": {"atualizadas": 3}})
+
+    lido = ler_checkpoint(caminho)
+    assert (lido["ultimo_id"], lido["pendentes"]) == (42, [7])
+    assert "gravado_em" in lido
+    assert not os.path.exists(f"{caminho}.tmp")
+
+def test_executar_completa_so_o_que_falta_e_retoma(tmp_path, engine, fabrica, criar_parada):
+    sul, norte = (-12.2800, -38.9663), (-12.2600, -38.9663)
+
+    def endereco(lat, lon):
+        # ao norte o Nominatim não conhece o CEP
+        dados = {"road": "Rua Nova", "house_number": "99", "suburb": "Tomba", "postcode": "44000-000"}
+        if lat > -12.27:
+            del dados["postcode"]
+        return dados
+
+    completa = criar_parada(rua="Rua Velha", numero_localizacao="1", cep="44999-999", latitude=-12.25)
+    b = criar_parada(rua="Rua Velha", bairro="Centro", latitude=sul[0], longitude=sul[1])
+    # a ~1 m de b: mesma chave de grade, uma única consulta
+    c = criar_parada(rua="Rua Velha", bairro="", latitude=sul[0] + 0.00001, longitude=sul[1])
+    d = criar_parada(rua="Rua Velha", bairro="Centro", latitude=norte[0], longitude=norte[1])
+
+    geo = GeocodificadorLocal(endereco)
+    checkpoint = str(tmp_path / "backfill.json")
+    totais = executar(engine, geo, checkpoint, tamanho_lote=2, trabalhadores=2, taxa=1000)
+
+    assert totais["candidatas"] == 3 and totais["celulas"] == 2
+    assert geo.chamadas == 2
+    assert totais["atualizadas"] == 3
+
+    with fabrica() as session:
+        paradas = {p.id: p for p in session.query(Parada)}
+    assert (paradas[completa.id].numero_localizacao, paradas[completa.id].cep) == ("1", "44999-999")
+    # campos preenchidos nunca são sobrescritos
+    assert {paradas[i].rua for i in (b.id, c.id, d.id)} == {"Rua Velha"}
+    assert paradas[b.id].bairro == "Centro"
+    assert (paradas[b.id].numero_localizacao, paradas[b.id].cep) == ("99", "44000-000")
+    assert (paradas[c.id].bairro, paradas[c.id].cep) == ("Tomba", "44000-000")
+    assert (paradas[d.id].numero_localizacao, paradas[d.id].cep) == ("99", None)
+
+    with fabrica() as session:
+        resumo = {(dim, v): q for dim, v, q in ler_resumo(session).itertuples(index=False)}
+    assert resumo[("bairro", "Tomba")] == 1 and ("bairro", "") not in resumo
+
+    # d continua sem CEP, mas já foi processada: a nova execução parte do checkpoint
+    assert ler_checkpoint(checkpoint)["ultimo_id"] == d.id
+    totais = executar(engine, geo, checkpoint, tamanho_lote=2, trabalhadores=2, taxa=1000)
+    assert totais["candidatas"] == 0
+    assert geo.chamadas == 2
@@ -0,0 +1,43 @@
+import logging
+
+from dados_paradas import buscar_paradas, criar_indice_trigrama
+
+
+def _ids(linhas):
+    return [l.id for l in linhas]
+
+
+def test_busca_por_inicio_de_palavra_sem_acento(fabrica, criar_parada):
+    a = criar_parada(rua="Avenida Getúlio Vargas", bairro="Centro")
+    criar_parada(rua="Rua Sergipe", bairro="Campo Limpo")
+    c = criar_parada(rua="Rua Vargem", bairro="Tomba")
+
+    with fabrica() as session:
+        assert _ids(buscar_paradas(session, "getulio")[0]) == [a.id]
+        assert _ids(buscar_paradas(session, "varg")[0]) == [c.id, a.id]
+        # trecho no meio da palavra não casa
+        assert buscar_paradas(session, "argas")[0] == []
+        # todas as palavras precisam aparecer
+        assert _ids(buscar_paradas(session, "varg centro")[0]) == [a.id]
+
+def test_busca_pagina_por_chave(fabrica, criar_parada):
+    ids = [criar_parada(rua="Rua Sergipe").id for _ in range(5)]
+
+    with fabrica() as session:
+        pagina, mais = buscar_paradas(session, "sergipe", limite=2)
+        assert _ids(pagina) == ids[:-3:-1] and mais
+        pagina, mais = buscar_paradas(session, "sergipe", apos_id=pagina[-1].id, limite=2)
+        assert _ids(pagina) == [ids[2], ids[1]] and mais
+        pagina, mais = buscar_paradas(session, "sergipe", apos_id=pagina[-1].id, limite=2)
+        assert _ids(pagina) == [ids[0]] and not mais
+
+def test_curingas_do_like_sao_literais(fabrica, criar_parada):
+    criar_parada(rua="Rua Sergipe")
+    with fabrica() as session:
+        assert buscar_paradas(session, "%")[0] == []
+        assert buscar_paradas(session, "s_rgipe")[0] == []
+
+def test_falha_no_indice_trigrama_vira_aviso(engine, caplog):
+    with caplog.at_level(logging.WARNING, logger="dados_paradas"):
+        criar_indice_trigrama(engine)
+    assert "Índice trigrama não criado" in caplog.text
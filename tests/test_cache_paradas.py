@@ -0,0 +1,154 @@
+import time
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, delete
+
+from dados_paradas import (
+    CacheParadas,
+    MARGEM_SYNC,
+    Parada,
+    ParadaExcluida,
+    RETENCAO_LAPIDES,
+    concatenar_frames,
+    linha_parada,
+    montar_frame,
+    podar_lapides,
+)
+
+
+def ids(cache):
+    return set(cache.frame["ID_DB"])
+
+
+# ================== FRAME ==================
+def test_frame_vazio_tem_os_tipos_do_frame_carregado(criar_parada):
+    parada = criar_parada()
+    vazio = montar_frame([])
+    cheio = montar_frame([linha_parada(parada)])
+
+    assert list(vazio.columns) == list(cheio.columns)
+    for coluna in ["ID_DB", "ID", "Ponto de Referência", "LAT", "LON", "Data Cadastro", "Atualizado Em"]:
+        assert vazio[coluna].dtype == cheio[coluna].dtype, coluna
+    for coluna in ["Rua", "Bairro", "Tipo", "Sentido"]:
+        assert vazio[coluna].dtype.categories.dtype.kind not in "fiu", coluna
+
+def test_concatenar_com_frame_vazio(criar_parada):
+    a = montar_frame([linha_parada(criar_parada(rua="rua um"))])
+    b = montar_frame([linha_parada(criar_parada(rua="rua dois"))])
+    df = concatenar_frames([montar_frame([]), a, b])
+
+    assert len(df) == 2
+    assert set(df["Rua"].cat.categories) == {"Rua Um", "Rua Dois"}
+
+
+# ================== CACHE ==================
+def test_gravacao_local_em_cache_vazio(fabrica, criar_parada):
+    cache = CacheParadas(fabrica)
+    cache.sincronizar(forcar=True)
+    assert cache.frame.empty
+
+    parada = criar_parada()
+    cache.aplicar_gravacao(parada)
+
+    assert ids(cache) == {parada.id}
+    cache.sincronizar(forcar=True)
+    assert ids(cache) == {parada.id}
+
+def test_delta_traz_alteracoes_e_exclusoes(fabrica, criar_parada):
+    a, b = criar_parada(), criar_parada()
+    cache = CacheParadas(fabrica)
+    cache.sincronizar(forcar=True)
+    versao = cache.versao
+
+    with fabrica() as session:
+        session.get(Parada, a.id).bairro = "Tomba"
+        session.delete(session.get(Parada, b.id))
+        session.commit()
+    c = criar_parada()
+
+    cache.sincronizar(forcar=True)
+    assert ids(cache) == {a.id, c.id}
+    assert cache.frame.set_index("ID_DB").loc[a.id, "Bairro"] == "Tomba"
+    assert cache.versao > versao
+    assert {pid for pid, _ in cache.indice.vizinhos(float(c.latitude), float(c.longitude), 5)} == {c.id}
+
+def test_delta_sem_mudancas_mantem_versao(fabrica, criar_parada):
+    criar_parada()
+    cache = CacheParadas(fabrica)
+    cache.sincronizar(forcar=True)
+    versao = cache.versao
+
+    cache.sincronizar(forcar=True)
+    assert cache.versao == versao
+
+def test_gravacao_local_nao_avanca_marca(engine, fabrica, criar_parada):
+    # uma gravação local com carimbo mais novo não pode esconder a alteração
+    # de outra sessão com carimbo anterior
+    a = criar_parada()
+    cache = CacheParadas(fabrica)
+    cache.sincronizar(forcar=True)
+    marca = cache.marca
+
+    with engine.begin() as conn:
+        conn.execute(
+            update(Parada.__table__).where(Parada.id == a.id)
+            .values(bairro="Tomba", atualizado_em=marca + timedelta(seconds=1))
+        )
+    b = criar_parada()
+    with engine.begin() as conn:
+        conn.execute(
+            update(Parada.__table__).where(Parada.id == b.id)
+            .values(atualizado_em=marca + timedelta(hours=1))
+        )
+    with fabrica() as session:
+        cache.aplicar_gravacao(session.get(Parada, b.id))
+
+    assert cache.marca == marca
+    cache.sincronizar(forcar=True)
+    assert cache.frame.set_index("ID_DB").loc[a.id, "Bairro"] == "Tomba"
+
+def test_marca_vem_dos_dados_e_nao_do_relogio_local(engine, fabrica, criar_parada):
+    antigo = datetime(2021, 5, 1, 12, 0)
+    a = criar_parada()
+    with engine.begin() as conn:
+        conn.execute(update(Parada.__table__).values(atualizado_em=antigo))
+
+    cache = CacheParadas(fabrica)
+    cache.sincronizar(forcar=True)
+    assert cache.marca == antigo
+
+    # gravação de outro servidor com o relógio atrasado ainda é vista
+    with engine.begin() as conn:
+        conn.execute(
+            update(Parada.__table__).where(Parada.id == a.id)
+            .values(bairro="Tomba", atualizado_em=antigo + MARGEM_SYNC / 2)
+        )
+    cache.sincronizar(forcar=True)
+    assert cache.frame.set_index("ID_DB").loc[a.id, "Bairro"] == "Tomba"
+
+
+# ================== LÁPIDES ==================
+def test_podar_lapides_remove_so_as_antigas(engine):
+    agora = datetime.now()
+    with engine.begin() as conn:
+        conn.execute(ParadaExcluida.__table__.insert(), [
+            {"parada_id": 1, "excluido_em": agora - RETENCAO_LAPIDES - timedelta(days=1)},
+            {"parada_id": 2, "excluido_em": agora - timedelta(days=1)},
+        ])
+        assert podar_lapides(conn) == 1
+        restantes = conn.execute(select(ParadaExcluida.parada_id)).scalars().all()
+    assert restantes == [2]
+
+def test_cache_parado_alem_da_retencao_recarrega_tudo(engine, fabrica, criar_parada):
+    a, b = criar_parada(), criar_parada()
+    cache = CacheParadas(fabrica)
+    cache.sincronizar(forcar=True)
+
+    # exclusão cuja lápide já teria sido podada
+    with engine.begin() as conn:
+        conn.execute(delete(Parada.__table__).where(Parada.id == b.id))
+    cache.ultima_sync = time.monotonic() - RETENCAO_LAPIDES.total_seconds() - 1
+
+    cache.sincronizar(forcar=True)
+    assert ids(cache) == {a.id}
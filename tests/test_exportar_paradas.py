@@ -0,0 +1,59 @@
+import csv
+import io
+import json
+
+import pytest
+
+from exportar_paradas import COLUNAS_EXPORTACAO, exportar, iterar_lotes
+
+
+@pytest.fixture
+def inventario(criar_parada):
+    return [
+        criar_parada(rua="Avenida Getúlio Vargas", bairro="Centro"),
+        criar_parada(rua="Rua Sergipe", bairro="Campo Limpo"),
+        criar_parada(rua="Rua Vargem Grande", bairro="Tomba", ponto_referencia="Em frente ao mercado"),
+        criar_parada(rua="Rua Centro Sul", bairro="Tomba"),
+    ]
+
+def _ids(engine, **filtros):
+    with engine.connect() as conn:
+        return [l.id for lote in iterar_lotes(conn, lote=2, **filtros) for l in lote]
+
+
+def test_filtros_de_bairro_rua_e_ponto(engine, inventario):
+    a, b, c, d = (p.id for p in inventario)
+    assert _ids(engine) == [a, b, c, d]
+    assert _ids(engine, bairros=["Tomba"]) == [c, d]
+    # "centro" também está no texto da rua d: o banco pré-filtra, o Python confirma
+    assert _ids(engine, bairros=["Centro"]) == [a]
+    assert _ids(engine, rua="varg") == [a, c]
+    assert _ids(engine, rua="getulio") == [a]
+    # trecho em qualquer ponto do nome, como na aba de visualização
+    assert _ids(engine, rua="argas") == [a]
+    assert _ids(engine, rua="rua c") == [d]
+    assert _ids(engine, bairros=["Tomba"], ponto="mercado") == [c]
+
+def test_csv_e_geojson(engine, inventario):
+    with engine.connect() as conn:
+        destino = io.BytesIO()
+        assert exportar(conn, destino, "csv", bairros=["Tomba"]) == 2
+        linhas = list(csv.reader(io.StringIO(destino.getvalue().decode("utf-8"))))
+        assert linhas[0] == COLUNAS_EXPORTACAO
+        assert [l[2] for l in linhas[1:]] == ["Rua Vargem Grande", "Rua Centro Sul"]
+
+        destino = io.BytesIO()
+        assert exportar(conn, destino, "geojson") == 4
+        colecao = json.loads(destino.getvalue())
+        primeira = colecao["features"][0]
+        assert primeira["geometry"]["coordinates"] == [inventario[0].longitude, inventario[0].latitude]
+        assert primeira["properties"]["rua"] == "Avenida Getúlio Vargas"
+
+def test_parquet(engine, inventario):
+    pq = pytest.importorskip("pyarrow.parquet")
+    with engine.connect() as conn:
+        destino = io.BytesIO()
+        assert exportar(conn, destino, "parquet", lote=3) == 4
+    tabela = pq.read_table(io.BytesIO(destino.getvalue()))
+    assert tabela.column_names == COLUNAS_EXPORTACAO
+    assert tabela.num_rows == 4
@@ -0,0 +1,153 @@
+import json
+import sqlite3
+
+from concurrent.futures import Future
+
+import pytest
+
+from sqlalchemy import event, func, select
+
+from dados_paradas import Parada
+from fila_captura import CapturaInvalida, FilaCaptura
+
+
+REGISTRO = {
+    "numero_parada": "P100", "rua": "Rua A", "numero_localizacao": "10",
+    "bairro": "Centro", "cep": "", "ponto_referencia": "Praça",
+    "sentido": "PC1 - PC2", "tipo": "Placa",
+    "latitude": -12.2664, "longitude": -38.9663,
+}
+
+
+class EnviosFalsos:
+    def __init__(self, resultado):
+        self.resultado = resultado
+        self.enviadas = []
+
+    def enviar(self, parada_id, foto, nome, tipo):
+        self.enviadas.append(parada_id)
+        futuro = Future()
+        futuro.set_result(self.resultado)
+        return futuro
+
+
+class EnviosPendentes(EnviosFalsos):
+    # envio que não termina durante o teste
+    def enviar(self, parada_id, foto, nome, tipo):
+        self.enviadas.append(parada_id)
+        return Future()
+
+
+def _fila(tmp_path, fabrica, envios=None):
+    return FilaCaptura(str(tmp_path / "fila" / "fila.db"), fabrica, envios_fotos=envios)
+
+def _total(fabrica):
+    with fabrica() as session:
+        return session.execute(select(func.count(Parada.id))).scalar()
+
+
+def test_descarga_repetida_nao_duplica(tmp_path, fabrica):
+    fila = _fila(tmp_path, fabrica)
+    chave = fila.enfileirar(REGISTRO)
+    assert fila.enfileirar(REGISTRO, chave=chave) == chave
+    assert fila.descarregar() == 1
+    assert fila.situacao(chave)["estado"] == "gravada"
+
+    # lote repetido depois de uma queda: a chave já está no banco
+    with fila._conectar() as conn:
+        conn.execute("UPDATE capturas SET estado = 'pendente'")
+    assert fila.descarregar() == 1
+    assert _total(fabrica) == 1
+
+def test_registro_recusado_nao_derruba_o_lote(tmp_path, fabrica, criar_parada):
+    criar_parada(numero_parada="P100")
+    fila = _fila(tmp_path, fabrica)
+    ruim = fila.enfileirar(REGISTRO)
+    bom = fila.enfileirar({**REGISTRO, "numero_parada": "P101"})
+
+    assert fila.descarregar() == 2
+    assert fila.situacao(ruim)["estado"] == "erro"
+    assert fila.situacao(bom)["estado"] == "gravada"
+    assert fila.contagens()["erro"] == 1
+
+def test_reenvio_e_descarte_de_fotos_com_erro(tmp_path, fabrica):
+    envios = EnviosFalsos(None)
+    fila = _fila(tmp_path, fabrica, envios)
+    chave = fila.enfileirar(REGISTRO, foto=b"jpeg", foto_nome="f.jpg", foto_tipo="image/jpeg")
+    fila.descarregar()
+    assert fila.situacao(chave)["foto_estado"] == "erro"
+    assert fila.contagens()["foto_erro"] == 1
+
+    envios.resultado = "https://fotos.exemplo/f.jpg"
+    assert fila.reenviar_fotos_com_erro() == 1
+    assert fila.situacao(chave)["foto_estado"] == "enviada"
+    assert len(envios.enviadas) == 2
+
+    envios.resultado = None
+    outra = fila.enfileirar({**REGISTRO, "numero_parada": "P101"}, foto=b"jpeg", foto_nome="f.jpg")
+    fila.descarregar()
+    assert fila.descartar_erros() == (0, 1)
+    assert fila.situacao(outra)["foto_estado"] == "descartada"
+    with fila._conectar() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM capturas WHERE foto IS NOT NULL").fetchone()[0] == 0
+
+def test_descarte_respeita_a_idade(tmp_path, fabrica, criar_parada):
+    criar_parada(numero_parada="P100")
+    fila = _fila(tmp_path, fabrica)
+    fila.enfileirar(REGISTRO)
+    fila.descarregar()
+    assert fila.descartar_erros(idade=3600) == (0, 0)
+    assert fila.descartar_erros() == (1, 0)
+    assert fila.contagens() == {}
+
+def test_valor_longo_demais_e_recusado_na_entrada(tmp_path, fabrica):
+    fila = _fila(tmp_path, fabrica)
+    with pytest.raises(CapturaInvalida):
+        fila.enfileirar({**REGISTRO, "numero_localizacao": "1" * 21})
+    assert fila.contagens() == {}
+
+def test_erro_de_dado_numa_linha_nao_trava_a_fila(tmp_path, engine, fabrica):
+    # o SQLite não limita VARCHAR; com um teto de tamanho por conexão ele
+    # levanta DataError como o Postgres faz para um valor longo demais
+    engine.dispose()
+    event.listen(engine, "connect", lambda conn, _: conn.setlimit(sqlite3.SQLITE_LIMIT_LENGTH, 1000))
+
+    fila = _fila(tmp_path, fabrica)
+    antes = fila.enfileirar({**REGISTRO, "numero_parada": "P1"})
+    ruim = fila.enfileirar({**REGISTRO, "numero_parada": "P2"})
+    depois = fila.enfileirar({**REGISTRO, "numero_parada": "P3"})
+    # registro que chegou ao diário sem passar pela validação de tamanho
+    with fila._conectar() as conn:
+        conn.execute(
+            "UPDATE capturas SET registro = ? WHERE chave = ?",
+            (json.dumps({**REGISTRO, "numero_parada": "P2", "rua": "R" * 2000}), ruim)
+        )
+
+    assert fila.descarregar() == 3
+    assert fila.situacao(ruim)["estado"] == "erro"
+    assert "too big" in fila.situacao(ruim)["erro"]
+    assert fila.situacao(antes)["estado"] == "gravada"
+    assert fila.situacao(depois)["estado"] == "gravada"
+    assert fila.descarregar() == 0
+    assert _total(fabrica) == 2
+
+def test_reenvio_manual_nao_repete_envio_em_andamento(tmp_path, fabrica):
+    envios = EnviosFalsos(None)
+    fila = _fila(tmp_path, fabrica, envios)
+    com_erro = fila.enfileirar(REGISTRO, foto=b"jpeg", foto_nome="f.jpg")
+    fila.descarregar()
+
+    fila.envios_fotos = envios = EnviosPendentes(None)
+    em_envio = fila.enfileirar({**REGISTRO, "numero_parada": "P101"}, foto=b"jpeg", foto_nome="f.jpg")
+    fila.descarregar()
+    assert fila.situacao(em_envio)["foto_estado"] == "enviando"
+    assert len(envios.enviadas) == 1
+
+    assert fila.reenviar_fotos_com_erro() == 1
+    assert fila.reenviar_fotos_com_erro() == 0
+    assert len(envios.enviadas) == 2
+    assert fila.situacao(com_erro)["foto_estado"] == "enviando"
+
+    # na partida, o que ficou em 'enviando' é de um processo anterior
+    fila._reenviar_fotos()
+    assert len(envios.enviadas) == 4
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+from dados_paradas import EnderecoCache
+from geocodificacao import (
+    GeocodificadorLocal,
+    LimitadorTaxa,
+    ServicoGeocodificacao,
+    TTL_CACHE,
+    chave_grade,
+)
+from indice_espacial import IndiceEspacial, METROS_POR_GRAU
+
+
+LAT, LON = -12.2664, -38.9663
+ENDERECO = {"road": "Rua Nova", "house_number": "12", "suburb": "Tomba", "postcode": "44000-000"}
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 0.0
+        self.esperas = []
+
+    def __call__(self):
+        return self.agora
+
+    def dormir(self, segundos):
+        self.esperas.append(segundos)
+        self.agora += segundos
+
+
+def _servico(fabrica, geocodificador):
+    # limitador sem espera: os testes do serviço não dependem da taxa
+    return ServicoGeocodificacao(fabrica, geocodificador, LimitadorTaxa(taxa=1000, capacidade=1000))
+
+
+def test_limitador_espaca_as_chamadas():
+    relogio = Relogio()
+    limitador = LimitadorTaxa(taxa=1.0, capacidade=1, relogio=relogio, dormir=relogio.dormir)
+    inicios = []
+    for _ in range(3):
+        assert limitador.aguardar()
+        inicios.append(relogio.agora)
+    assert inicios == [0.0, 1.0, 2.0]
+
+    # sem ficha e sem tempo para esperar por ela: desiste sem dormir
+    esperas = len(relogio.esperas)
+    assert limitador.aguardar(timeout=0.5) is False
+    assert len(relogio.esperas) == esperas
+
+    relogio.agora += 10
+    assert limitador.aguardar(timeout=0)
+
+def test_cache_acerta_e_expira(fabrica):
+    geo = GeocodificadorLocal(ENDERECO)
+    servico = _servico(fabrica, geo)
+
+    dados, origem = servico.reverter(LAT, LON)
+    assert origem == "rede" and dados["rua"] == "Rua Nova" and dados["num"] == "12"
+    # clique a poucos metros cai na mesma célula da grade
+    assert servico.reverter(LAT + 0.00001, LON) == (dados, "cache")
+    assert geo.chamadas == 1
+
+    with fabrica() as session:
+        item = session.get(EnderecoCache, chave_grade(LAT, LON))
+        item.criado_em = datetime.now() - TTL_CACHE - timedelta(days=1)
+        session.commit()
+    assert servico.reverter(LAT, LON)[1] == "rede"
+    assert geo.chamadas == 2
+
+def test_parada_proxima_ate_30_m(fabrica, criar_parada):
+    parada = criar_parada(rua="Rua da Parada", bairro="Centro", cep="44001-000", latitude=LAT, longitude=LON)
+    indice = IndiceEspacial()
+    indice.adicionar(parada.id, LAT, LON)
+    geo = GeocodificadorLocal(ENDERECO)
+    servico = _servico(fabrica, geo)
+
+    perto = LAT + 20 / METROS_POR_GRAU
+    dados, origem = servico.reverter(perto, LON, indice)
+    assert origem == "parada"
+    assert dados == {"rua": "Rua da Parada", "num": "", "bairro": "Centro", "cep": "44001-000"}
+    assert geo.chamadas == 0
+
+    longe = LAT + 40 / METROS_POR_GRAU
+    assert servico.reverter(longe, LON, indice)[1] == "rede"
+    assert geo.chamadas == 1
+
+def test_falha_de_rede_nao_fica_em_cache(fabrica):
+    def fora_do_ar(lat, lon):
+        raise TimeoutError("sem resposta")
+
+    geo = GeocodificadorLocal(fora_do_ar)
+    servico = _servico(fabrica, geo)
+    assert servico.reverter(LAT, LON) == (None, "falha")
+    assert servico.estatisticas["falha"] == 1
+
+    with fabrica() as session:
+        assert session.get(EnderecoCache, chave_grade(LAT, LON)) is None
+
+    geo.endereco = ENDERECO
+    dados, origem = servico.reverter(LAT, LON)
+    assert origem == "rede" and dados["rua"] == "Rua Nova"
+    assert servico.estatisticas["cache"] == 0
@@ -0,0 +1,102 @@
+import csv
+import json
+
+import pytest
+
+import importar_paradas
+from importar_paradas import RegistroInvalido, importar, ler_arquivo, normalizar_registro
+from dados_paradas import Parada
+from sqlalchemy import select
+
+
+CAMPOS = ["numero_parada", "rua", "bairro", "ponto_referencia", "tipo", "sentido", "latitude", "longitude"]
+
+def _linha(numero, lat, **campos):
+    linha = {
+        "numero_parada": numero, "rua": "rua sergipe", "bairro": " campo limpo ",
+        "ponto_referencia": "Praça", "tipo": "abrigo + placa", "sentido": "pc1-pc2",
+        "latitude": lat, "longitude": "-38,9663",
+    }
+    linha.update(campos)
+    return linha
+
+def _csv(caminho, linhas):
+    with open(caminho, "w", newline="", encoding="utf-8") as f:
+        escritor = csv.DictWriter(f, CAMPOS)
+        escritor.writeheader()
+        escritor.writerows(linhas)
+    return str(caminho)
+
+def _rejeitados(caminho):
+    with open(caminho, encoding="utf-8") as f:
+        return [(int(l["linha"]), l["motivo"]) for l in csv.DictReader(f)]
+
+
+def test_normalizacao_e_validacao():
+    linha = normalizar_registro(_linha("", "-12,2664"))
+    assert (linha["rua"], linha["bairro"], linha["tipo"], linha["sentido"]) == (
+        "Rua Sergipe", "Campo Limpo", "Abrigo + Placa", "PC1 - PC2"
+    )
+    assert linha["numero_parada"] is None and linha["latitude"] == -12.2664
+
+    # chaves de endereço do Nominatim no lugar das colunas do modelo
+    nominatim = _linha("", "-12.2664", rua="", bairro="", road="Avenida Getúlio Vargas", suburb="Centro")
+    assert normalizar_registro(nominatim)["rua"] == "Avenida Getúlio Vargas"
+
+    for ruim in (_linha("", "95"), _linha("", "-12.2", tipo="poste"), _linha("", "-12.2", ponto_referencia="")):
+        with pytest.raises(RegistroInvalido):
+            normalizar_registro(ruim)
+
+def test_leitores_csv_geojson_e_sequencial(tmp_path):
+    assert [n for n, _ in ler_arquivo(_csv(tmp_path / "a.csv", [_linha("1", "-12.2")] * 2))] == [2, 3]
+
+    feature = {"type": "Feature", "geometry": {"type": "Point", "coordinates": [-38.9, -12.2]},
+               "properties": {"rua": "Rua A"}}
+    colecao = tmp_path / "a.geojson"
+    colecao.write_text(json.dumps({"type": "FeatureCollection", "features": [feature]}), encoding="utf-8")
+    sequencial = tmp_path / "a.geojsonl"
+    sequencial.write_text("\n".join(json.dumps(feature) for _ in range(3)) + "\n", encoding="utf-8")
+
+    (_, props), = ler_arquivo(str(colecao))
+    assert (props["latitude"], props["longitude"], props["rua"]) == (-12.2, -38.9, "Rua A")
+    assert len(list(ler_arquivo(str(sequencial)))) == 3
+
+def test_importacao_recusa_repetidas_e_proximas(tmp_path, engine, criar_parada):
+    criar_parada(numero_parada="P1", latitude=-12.30, longitude=-38.9663)
+    arquivo = _csv(tmp_path / "a.csv", [
+        _linha("P1", "-12.20"),          # número já no banco
+        _linha("P2", "-12.30"),          # em cima de uma parada existente
+        _linha("P3", "-12.21"),
+        _linha("P3", "-12.22"),          # número repetido no próprio arquivo
+        _linha("", "-12.21"),            # em cima de uma parada do próprio arquivo
+        _linha("P4", "x"),
+    ])
+
+    totais = importar(engine, arquivo, str(tmp_path / "rej.csv"), tamanho_lote=2)
+
+    assert (totais["lidas"], totais["importadas"], totais["rejeitadas"]) == (6, 1, 5)
+    assert [n for n, _ in _rejeitados(tmp_path / "rej.csv")] == [2, 3, 5, 6, 7]
+    with engine.connect() as conn:
+        assert conn.execute(select(Parada.numero_parada).where(Parada.numero_parada == "P3")).scalar() == "P3"
+
+def test_lote_que_falhou_nao_bloqueia_as_linhas_seguintes(tmp_path, engine, monkeypatch):
+    gravar = importar_paradas.gravar_lote
+    chamadas = []
+
+    def falhar_no_primeiro(engine, linhas):
+        chamadas.append(len(linhas))
+        if len(chamadas) == 1:
+            raise RuntimeError("conexão perdida")
+        gravar(engine, linhas)
+    monkeypatch.setattr(importar_paradas, "gravar_lote", falhar_no_primeiro)
+
+    # o segundo lote reenvia as mesmas paradas (correção depois da falha)
+    linhas = [_linha("P1", "-12.20"), _linha("P2", "-12.21")]
+    arquivo = _csv(tmp_path / "a.csv", linhas + linhas)
+
+    totais = importar(engine, arquivo, str(tmp_path / "rej.csv"), tamanho_lote=2)
+
+    assert (totais["importadas"], totais["rejeitadas"]) == (2, 2)
+    assert all("erro no lote" in motivo for _, motivo in _rejeitados(tmp_path / "rej.csv"))
+    with engine.connect() as conn:
+        assert sorted(conn.execute(select(Parada.numero_parada)).scalars()) == ["P1", "P2"]
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+from indice_espacial import IndiceEspacial, METROS_POR_GRAU, haversine_m
+
+
+LAT, LON = -12.2664, -38.9663
+
+def _ao_norte(metros, lon=LON):
+    return LAT + metros / METROS_POR_GRAU, lon
+
+def _frame(pontos):
+    return pd.DataFrame(
+        [(pid, lat, lon) for pid, (lat, lon) in pontos.items()],
+        columns=["ID_DB", "LAT", "LON"]
+    )
+
+
+def test_vizinhos_ordenados_e_dentro_do_raio():
+    indice = IndiceEspacial.construir(_frame({
+        1: (LAT, LON),
+        2: _ao_norte(10),
+        3: _ao_norte(40),
+        4: _ao_norte(500),
+    }))
+    achados = indice.vizinhos(LAT, LON, 60)
+    assert [pid for pid, _ in achados] == [1, 2, 3]
+    assert abs(achados[1][1] - 10) < 0.1
+    assert [pid for pid, _ in indice.vizinhos(LAT, LON, 60, ignorar=1)] == [2, 3]
+    assert indice.vizinhos(LAT + 1, LON, 60) == []
+
+def test_adicionar_mover_e_remover():
+    indice = IndiceEspacial()
+    indice.adicionar(1, LAT, LON)
+    indice.adicionar(2, *_ao_norte(5))
+    assert len(indice) == 2
+
+    # readicionar move o ponto: a célula antiga não guarda mais o id
+    indice.adicionar(2, *_ao_norte(1000))
+    assert [pid for pid, _ in indice.vizinhos(LAT, LON, 15)] == [1]
+    assert sum(len(ids) for ids in indice.celulas.values()) == 2
+
+    indice.remover(1)
+    indice.remover(99)
+    assert indice.vizinhos(LAT, LON, 15) == []
+    assert len(indice) == 1
+
+def test_adicionar_frame_substitui_ids_e_ignora_sem_coordenada():
+    indice = IndiceEspacial.construir(_frame({1: (LAT, LON), 2: (None, None)}))
+    assert len(indice) == 1
+    indice.adicionar_frame(_frame({1: _ao_norte(800)}))
+    assert indice.vizinhos(LAT, LON, 15) == []
+    assert len(indice) == 1
+
+def test_grupos_duplicados_iguais_a_forca_bruta():
+    rng = np.random.default_rng(7)
+    # pontos densos o bastante para formar cadeias entre células vizinhas
+    lat = LAT + rng.uniform(0, 0.004, 400)
+    lon = LON + rng.uniform(0, 0.004, 400)
+    indice = IndiceEspacial.construir(pd.DataFrame({"ID_DB": range(400), "LAT": lat, "LON": lon}))
+
+    raio = 15
+    dist = haversine_m(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+    pai = list(range(400))
+
+    def raiz(x):
+        while pai[x] != x:
+            x = pai[x]
+        return x
+
+    for x, y in zip(*np.nonzero(np.triu(dist <= raio, k=1))):
+        pai[raiz(x)] = raiz(y)
+    esperados = {}
+    for pid in range(400):
+        esperados.setdefault(raiz(pid), []).append(pid)
+    esperados = sorted(sorted(g) for g in esperados.values() if len(g) > 1)
+
+    assert esperados
+    assert sorted(indice.grupos_duplicados(raio)) == esperados
+
+def test_grupo_encadeado_atravessa_celulas():
+    # 1-2 e 2-3 a 12 m, 1-3 a 24 m: um grupo só, cruzando a borda da célula de 50 m
+    indice = IndiceEspacial.construir(_frame({
+        1: _ao_norte(40),
+        2: _ao_norte(52),
+        3: _ao_norte(64),
+        4: _ao_norte(300),
+    }))
+    assert indice.grupos_duplicados(15) == [[1, 2, 3]]
@@ -0,0 +1,39 @@
+import pandas as pd
+
+from indice_texto import IndiceTexto
+
+
+def _frame():
+    return pd.DataFrame({
+        "ID": [1, 2, 3, 4],
+        "Rua": pd.Categorical(["Avenida Getúlio Vargas", "Rua Sergipe", "Rua Vargem Grande", "Rua São José"]),
+        "Bairro": pd.Categorical(["Centro", "Campo Limpo", "Tomba", "Tomba"]),
+        "Ponto de Referência": ["Em frente à praça", "Mercado", "Ao lado do mercado", "Posto"],
+    })
+
+def _ids(df, **filtros):
+    return IndiceTexto(df).filtrar(df, **filtros)["ID"].tolist()
+
+
+def test_rua_casa_trecho_sem_acento_nem_caixa():
+    df = _frame()
+    assert _ids(df, rua="varg") == [1, 3]
+    assert _ids(df, rua="argas") == [1]
+    assert _ids(df, rua="SAO JOSÉ") == [4]
+    assert _ids(df, rua="getulio vargas") == [1]
+    assert _ids(df, rua="inexistente") == []
+
+def test_ponto_sem_categoria_e_bairro_por_igualdade():
+    df = _frame()
+    assert _ids(df, ponto="mercado") == [2, 3]
+    assert _ids(df, ponto="praca") == [1]
+    assert _ids(df, bairros=["Tomba"]) == [3, 4]
+    assert _ids(df, bairros=["Tomba", "Centro"]) == [1, 3, 4]
+    assert _ids(df, bairros=["Outro"]) == []
+
+def test_filtros_combinados_e_vazios():
+    df = _frame()
+    indice = IndiceTexto(df)
+    assert indice.filtrar(df) is df
+    assert indice.filtrar(df, bairros=[], rua="  ", ponto="") is df
+    assert _ids(df, bairros=["Tomba"], rua="rua", ponto="mercado") == [3]
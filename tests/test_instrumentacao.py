@@ -0,0 +1,33 @@
+import json
+
+from instrumentacao import Rastreador
+
+
+def test_execucao_vai_para_o_arquivo_json_lines(tmp_path):
+    rastreador = Rastreador()
+    caminho = tmp_path / "execucoes.jsonl"
+
+    for rotulo in ("mapa", "dashboard"):
+        rastreador.iniciar_execucao(rotulo)
+        with rastreador.etapa("cache.sincronizar"):
+            pass
+        rastreador.registrar_json(rastreador.finalizar_execucao(), str(caminho))
+    rastreador.registrar_json(None, str(caminho))
+
+    linhas = [json.loads(l) for l in caminho.read_text(encoding="utf-8").splitlines()]
+    assert [l["rotulo"] for l in linhas] == ["mapa", "dashboard"]
+    assert "cache.sincronizar" in linhas[0]["etapas"]
+
+def test_prometheus_tem_percentis_por_etapa(tmp_path):
+    rastreador = Rastreador()
+    for ms in (1.0, 2.0, 3.0):
+        rastreador.registrar("mapa.montar", ms)
+
+    texto = rastreador.prometheus()
+    assert 'sip_etapa_ms{etapa="mapa.montar",quantile="0.5"} 2.0' in texto
+    assert 'sip_etapa_ms_count{etapa="mapa.montar"} 3' in texto
+
+    caminho = tmp_path / "sip.prom"
+    assert rastreador.gravar_prometheus(str(caminho))
+    assert not rastreador.gravar_prometheus(str(caminho))
+    assert caminho.read_text(encoding="utf-8") == texto
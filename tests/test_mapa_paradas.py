@@ -0,0 +1,60 @@
+import json
+
+import pandas as pd
+import pytest
+
+folium = pytest.importorskip("folium")
+
+from mapa_paradas import CacheMapas, PlanoMapa, montar_mapa_view, planejar_mapa_view  # noqa: E402
+
+
+def _df(n):
+    return pd.DataFrame({
+        "ID": range(1, n + 1),
+        "LAT": [-12.2664 + i * 1e-4 for i in range(n)],
+        "LON": [-38.9663] * n,
+        "Tipo": pd.Series(["Placa", "Abrigo"] * (n // 2) + ["Placa"] * (n % 2), dtype="category"),
+    })
+
+
+def test_plano_marcadores_so_tem_strings():
+    plano = planejar_mapa_view(_df(10), None, limite_marcadores=500)
+    assert plano.modo == "marcadores"
+    assert isinstance(plano.dados, str)
+    assert json.loads(plano.dados)[0] == [-12.2664, -38.9663, 1, "Placa"]
+
+def test_plano_agrupado_e_celulas():
+    df = _df(50)
+    assert planejar_mapa_view(df, None, limite_marcadores=10).modo == "agrupada"
+    viewport = ((-12.3, -39.0, -12.2, -38.9), 10)
+    assert planejar_mapa_view(df, viewport, limite_marcadores=10).modo == "celulas"
+
+def test_montagem_gera_objetos_novos_a_cada_execucao():
+    plano = planejar_mapa_view(_df(10), None, limite_marcadores=500)
+    m1, camada1 = montar_mapa_view(plano)
+    m2, camada2 = montar_mapa_view(plano)
+    assert m1 is not m2 and camada1 is not camada2
+    assert len(camada1._children) == 10
+
+def test_cache_guarda_plano_e_mede_mapas_pequenos():
+    cache = CacheMapas(max_entradas=2)
+    plano = cache.obter("a", lambda: planejar_mapa_view(_df(10), None, 500))
+    assert cache.obter("a", lambda: pytest.fail("não devia replanejar")) is plano
+    assert isinstance(plano, PlanoMapa)
+    estatisticas = cache.estatisticas()
+    assert estatisticas["acertos"] == 1
+    assert estatisticas["bytes_estimados"] >= len(plano.dados)
+
+def test_html_igual_entre_montagens_do_mesmo_plano():
+    st_folium = pytest.importorskip("streamlit_folium")
+    for n in (10, 50):
+        plano = planejar_mapa_view(_df(n), None, limite_marcadores=20)
+        htmls = []
+        for _ in range(2):
+            m, camada = montar_mapa_view(plano)
+            m.render()
+            htmls.append((
+                st_folium.generate_leaflet_string(m),
+                st_folium._get_feature_group_string(camada, m),
+            ))
+        assert htmls[0] == htmls[1]
@@ -0,0 +1,65 @@
+from sqlalchemy.orm import sessionmaker
+
+from dados_paradas import Parada, ler_resumo, reconstruir_resumo
+
+
+def _resumo(fabrica):
+    with fabrica() as session:
+        df = ler_resumo(session)
+    return {(d, v): q for d, v, q in df.itertuples(index=False)}
+
+
+def test_insercao_atualizacao_e_exclusao(fabrica, criar_parada):
+    a = criar_parada(rua="Rua A", bairro="Centro", tipo="Placa")
+    criar_parada(rua="Rua A", bairro="Tomba", tipo="Abrigo")
+    resumo = _resumo(fabrica)
+    assert resumo[("total", "")] == 2
+    assert resumo[("rua", "Rua A")] == 2
+    assert resumo[("bairro", "Centro")] == 1 and resumo[("tipo", "Placa")] == 1
+
+    with fabrica() as session:
+        parada = session.get(Parada, a.id)
+        parada.rua = "Rua B"
+        parada.tipo = "Abrigo"
+        session.commit()
+    resumo = _resumo(fabrica)
+    assert resumo[("rua", "Rua A")] == 1 and resumo[("rua", "Rua B")] == 1
+    assert ("tipo", "Placa") not in resumo and resumo[("tipo", "Abrigo")] == 2
+    assert resumo[("total", "")] == 2
+
+    with fabrica() as session:
+        session.delete(session.get(Parada, a.id))
+        session.commit()
+    resumo = _resumo(fabrica)
+    assert ("rua", "Rua B") not in resumo and ("bairro", "Centro") not in resumo
+    assert resumo[("total", "")] == 1
+
+def test_atualizacao_de_instancia_expirada(engine, fabrica, criar_parada):
+    criar_parada(rua="Rua A")
+    Sessao = sessionmaker(bind=engine)          # expire_on_commit=True
+    with Sessao() as session:
+        parada = session.query(Parada).one()
+        parada.ponto_referencia = "Outro ponto"
+        session.commit()                        # expira todos os atributos
+        parada.rua = "Rua B"                    # sem carregar o valor antigo antes
+        session.commit()
+
+        parada.bairro = "Tomba"
+        session.commit()
+        session.delete(parada)
+        session.commit()
+
+    assert _resumo(fabrica) == {}
+
+def test_reconstrucao_igual_as_contagens_incrementais(engine, fabrica, criar_parada):
+    ids = [criar_parada(rua=f"Rua {n % 3}", bairro=f"Bairro {n % 2}").id for n in range(7)]
+    with fabrica() as session:
+        session.get(Parada, ids[0]).rua = "Rua Nova"
+        session.delete(session.get(Parada, ids[1]))
+        session.commit()
+
+    incremental = _resumo(fabrica)
+    with engine.begin() as conn:
+        reconstruir_resumo(conn)
+    assert _resumo(fabrica) == incremental
+    assert incremental[("total", "")] == 6
@@ -0,0 +1,71 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+import dados_paradas  # noqa: E402
+from dados_paradas import CacheParadas, Parada, montar_frame  # noqa: E402
+from snapshot_paradas import gravar_snapshot, ler_snapshot  # noqa: E402
+
+
+def _cache(fabrica, arquivo):
+    cache = CacheParadas(fabrica, snapshot=arquivo)
+    cache.sincronizar(forcar=True)
+    cache.aguardar_snapshot()
+    return cache
+
+
+def test_partida_pelo_snapshot_traz_o_delta(tmp_path, fabrica, criar_parada):
+    arquivo = str(tmp_path / "dados" / "snap.arrow")
+    a = criar_parada()
+    b = criar_parada()
+    _cache(fabrica, arquivo)
+    assert os.path.exists(arquivo)
+
+    with fabrica() as session:
+        session.delete(session.get(Parada, a.id))
+        session.commit()
+    c = criar_parada()
+
+    cache = _cache(fabrica, arquivo)
+    assert cache.marca_snapshot is not None
+    assert sorted(cache.frame["ID_DB"]) == [b.id, c.id]
+    with fabrica() as session:
+        do_banco = dados_paradas.carregar_frame_paradas(session)
+    assert [str(t) for t in cache.frame.dtypes] == [str(t) for t in do_banco.dtypes]
+
+def test_snapshot_mais_antigo_que_a_retencao_e_ignorado(tmp_path, fabrica, criar_parada, monkeypatch):
+    arquivo = str(tmp_path / "snap.arrow")
+    criar_parada()
+    _cache(fabrica, arquivo)
+
+    class Futuro(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.now(tz) + dados_paradas.RETENCAO_LAPIDES + timedelta(days=1)
+    monkeypatch.setattr(dados_paradas, "datetime", Futuro)
+
+    cache = CacheParadas(fabrica, snapshot=arquivo)
+    with fabrica() as session:
+        assert not cache._carga_snapshot(session)
+
+def test_falha_na_gravacao_nao_deixa_temporario(tmp_path, monkeypatch):
+    arquivo = str(tmp_path / "snap.arrow")
+
+    def falhar(*args, **kwargs):
+        raise OSError("disco cheio")
+    monkeypatch.setattr(pa.ipc, "new_file", falhar)
+
+    with pytest.raises(OSError):
+        gravar_snapshot(arquivo, montar_frame([]), datetime(2024, 1, 1), "origem")
+    assert os.listdir(tmp_path) == []
+
+def test_snapshot_de_outro_banco_e_ignorado(tmp_path):
+    arquivo = str(tmp_path / "snap.arrow")
+    frame = montar_frame([])
+    gravar_snapshot(arquivo, frame, datetime(2024, 1, 1), "banco-a")
+    assert ler_snapshot(arquivo, "banco-b", frame.dtypes) is None
+    lido, marca, _ = ler_snapshot(arquivo, "banco-a", frame.dtypes)
+    assert marca == datetime(2024, 1, 1) and lido.empty